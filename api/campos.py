@@ -0,0 +1,100 @@
+"""
+Seleção de campos (?fields= / ?exclude=) nos endpoints da API
+
+O serializer passa a ter só os campos pedidos e o SELECT só as colunas que
+eles leem (only() + select_related() das relações usadas), então payload e
+leitura no banco acompanham o que o app realmente mostra. Sem ?fields=, os
+campos de `campos_omitidos` (o XML) ficam de fora.
+"""
+from rest_framework.exceptions import ValidationError
+
+PARAMETRO_CAMPOS = 'fields'
+PARAMETRO_EXCLUIR = 'exclude'
+
+
+def _nomes(request, parametro):
+    """Nomes separados por vírgula (aceita o parâmetro repetido)"""
+    nomes = []
+    for valor in request.query_params.getlist(parametro):
+        nomes += [nome.strip() for nome in valor.split(',') if nome.strip()]
+    return nomes
+
+
+class CamposSelecionadosMixin:
+    """
+    ?fields=a,b e ?exclude=c em list/retrieve de viewsets
+
+    O serializer precisa aceitar `campos` (ver serializers.CamposDinamicosMixin).
+    `colunas_campos` liga campos que não são colunas do modelo às colunas que
+    eles leem; campos sem coluna (source='*', relações reversas) não entram
+    no only().
+    """
+
+    campos_omitidos = ('xml_content',)
+    colunas_campos = {'xml_content': ('xml__conteudo',)}
+
+    def campos_selecionados(self):
+        """Nomes dos campos do serializer para esta requisição, na ordem do serializer"""
+        if hasattr(self, '_campos_selecionados'):
+            return self._campos_selecionados
+        disponiveis = list(self.get_serializer_class()().fields)
+        request = getattr(self, 'request', None)
+        if request is None:
+            return disponiveis
+
+        pedidos, excluidos = _nomes(request, PARAMETRO_CAMPOS), _nomes(request, PARAMETRO_EXCLUIR)
+        invalidos = [nome for nome in dict.fromkeys(pedidos + excluidos) if nome not in disponiveis]
+        if invalidos:
+            raise ValidationError({
+                PARAMETRO_CAMPOS if invalidos[0] in pedidos else PARAMETRO_EXCLUIR:
+                    [f"Campos inválidos: {', '.join(invalidos)}. Disponíveis: {', '.join(disponiveis)}"]
+            })
+        if pedidos:
+            campos = [nome for nome in disponiveis if nome in pedidos]
+        else:
+            campos = [nome for nome in disponiveis if nome not in self.campos_omitidos]
+        self._campos_selecionados = [nome for nome in campos if nome not in excluidos]
+        return self._campos_selecionados
+
+    def campos_lista(self):
+        return self.campos_selecionados()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve'):
+            kwargs.setdefault('campos', self.campos_selecionados())
+        return super().get_serializer(*args, **kwargs)
+
+    def colunas_selecionadas(self, queryset):
+        """(colunas para only(), relações para select_related()) dos campos selecionados"""
+        modelo = queryset.model
+        concretos = {campo.name for campo in modelo._meta.concrete_fields}
+        campos = self.get_serializer_class()().fields
+        colunas, relacoes = [modelo._meta.pk.name], []
+        for nome in self.campos_selecionados():
+            caminhos = self.colunas_campos.get(nome)
+            if caminhos is None:
+                fonte = campos[nome].source
+                if fonte == '*':
+                    continue
+                caminhos = (fonte.replace('.', '__'),)
+            for caminho in caminhos:
+                raiz = caminho.split('__')[0]
+                if '__' in caminho:
+                    relacoes.append(raiz)
+                    colunas.append(caminho)
+                elif raiz in concretos:
+                    colunas.append(caminho)
+        # O cursor da paginação lê o campo de ordenação de cada página
+        ordem = [o.lstrip('-') for o in queryset.query.order_by if isinstance(o, str)]
+        if ordem and ordem[0] != 'pk':
+            colunas.append(ordem[0])
+        return list(dict.fromkeys(colunas)), list(dict.fromkeys(relacoes))
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        colunas, relacoes = self.colunas_selecionadas(queryset)
+        if relacoes:
+            queryset = queryset.select_related(*relacoes)
+        return queryset.only(*colunas)
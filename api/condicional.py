@@ -0,0 +1,79 @@
+"""
+GET condicional (ETag/Last-Modified) nos endpoints da API
+
+O validador vem das versões em core.versoes (uma consulta por chave
+primária) e é comparado com If-None-Match/If-Modified-Since antes de a view
+rodar; se o cliente já tem a versão atual, responde 304 sem consultar nem
+serializar nada. Roda dentro da view do DRF, depois de autenticação e
+permissões.
+"""
+import hashlib
+from datetime import datetime, time
+from functools import wraps
+
+from django.http import HttpRequest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.request import Request
+
+from core.versoes import versoes
+
+
+def validadores(request, nomes):
+    """
+    (ETag entre aspas, Last-Modified em segundos) para os dados informados
+
+    A data local entra nos dois: dashboard e estatísticas têm janelas relativas
+    a hoje e mudam na virada do dia mesmo sem importações.
+    """
+    atuais = versoes(nomes)
+    # Reaproveitadas pelo cache de consultas na mesma requisição
+    request.versoes_dados = atuais
+    hoje = timezone.localdate()
+    base = '|'.join(
+        [request.get_full_path(), getattr(request, 'accepted_media_type', '') or '', hoje.isoformat()]
+        + [f'{nome}:{versao}' for nome, (versao, _) in sorted(atuais.items())]
+    )
+    inicio_do_dia = timezone.make_aware(datetime.combine(hoje, time.min))
+    ultima = max([inicio_do_dia] + [alterado_em for _, alterado_em in atuais.values() if alterado_em is not None])
+    return quote_etag(hashlib.md5(base.encode()).hexdigest()), int(ultima.timestamp())
+
+
+def responder_condicional(request, nomes, gerar):
+    """304 se o cliente já tem a versão; senão a resposta de gerar() com ETag/Last-Modified"""
+    etag, ultima = validadores(request, nomes)
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima)
+    if resposta is None:
+        resposta = gerar()
+    if resposta.status_code in (200, 304):
+        resposta['ETag'] = etag
+        resposta['Last-Modified'] = http_date(ultima)
+        # Pode guardar, mas revalida sempre (o 304 é barato)
+        patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+
+def condicional(*nomes):
+    """Decorator para views/actions GET que dependem dos conjuntos informados (NFe, CTe, ImportLog)"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def view(*args, **kwargs):
+            request = args[0] if isinstance(args[0], (Request, HttpRequest)) else args[1]
+            return responder_condicional(request, nomes, lambda: funcao(*args, **kwargs))
+        return view
+    return decorador
+
+
+class RespostaCondicionalMixin:
+    """list/retrieve de viewsets com ETag; a classe define `dados_versionados`"""
+
+    dados_versionados = ()
+
+    def list(self, request, *args, **kwargs):
+        return responder_condicional(request, self.dados_versionados, lambda: super(
+            RespostaCondicionalMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return responder_condicional(request, self.dados_versionados, lambda: super(
+            RespostaCondicionalMixin, self).retrieve(request, *args, **kwargs))
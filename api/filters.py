@@ -0,0 +1,16 @@
+"""
+Filtros da API REST
+"""
+from rest_framework import filters
+
+from core.busca import filtro_busca
+
+
+class BuscaIndexadaFilter(filters.SearchFilter):
+    """?search= pelos índices de busca de NFe/CTe (ver core.busca) em vez de icontains por campo"""
+
+    def filter_queryset(self, request, queryset, view):
+        termo = request.query_params.get(self.search_param, '').strip()
+        if not termo:
+            return queryset
+        return queryset.filter(filtro_busca(queryset.model, termo, queryset.db))
@@ -0,0 +1,113 @@
+"""
+Listagem rápida de NFe/CTe na API
+
+Em vez de instanciar o modelo e passar cada linha pelos campos do
+ModelSerializer, a lista busca só as colunas do serializer com values(),
+converte Decimal/datetime uma vez por coluna (no mesmo formato do DRF) e
+codifica a página inteira de uma vez com orjson (json da biblioteca padrão
+quando o orjson não está instalado) pelo JSONRapidoRenderer.
+
+Só atende respostas JSON; a API navegável e outros formatos seguem pelo
+serializer.
+"""
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+
+try:
+    import orjson
+except ImportError:  # opcional
+    orjson = None
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """JSONRenderer que usa orjson quando não há indentação pedida"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data)
+        except TypeError:  # tipos que só o encoder do DRF conhece
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+def _data_hora(valor):
+    # Como o DateTimeField do DRF: no fuso atual, ISO 8601 e 'Z' para UTC
+    if timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    texto = valor.isoformat()
+    return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+
+
+def _conversor(campo):
+    """Função que leva o valor do banco ao valor do JSON (None quando não precisa)"""
+    if isinstance(campo, models.DateTimeField):
+        return _data_hora
+    if isinstance(campo, (models.DateField, models.TimeField)):
+        return lambda valor: valor.isoformat()
+    if isinstance(campo, models.DecimalField):
+        expoente = Decimal(1).scaleb(-campo.decimal_places)
+        return lambda valor: format(valor.quantize(expoente), 'f')
+    if isinstance(campo, models.UUIDField):
+        return str
+    return None
+
+
+def serializar_linhas(modelo, campos, linhas):
+    """
+    Linhas de values() como dicionários com só os `campos`, prontos para o JSON
+
+    Valores None ficam None, como no serializer.
+    """
+    conversores = [
+        (nome, conversor)
+        for nome, conversor in ((nome, _conversor(modelo._meta.get_field(nome))) for nome in campos)
+        if conversor is not None
+    ]
+    resultado = []
+    for linha in linhas:
+        item = {nome: linha[nome] for nome in campos}
+        for nome, conversor in conversores:
+            if item[nome] is not None:
+                item[nome] = conversor(item[nome])
+        resultado.append(item)
+    return resultado
+
+
+def _colunas_consulta(queryset, campos):
+    """Campos + id e campo de ordenação, que o cursor da paginação precisa ler"""
+    pk = queryset.model._meta.pk.attname
+    ordem = [o.lstrip('-') for o in queryset.query.order_by or queryset.model._meta.ordering if isinstance(o, str)]
+    extras = [pk if nome == 'pk' else nome for nome in [pk] + ordem[:1]]
+    return list(dict.fromkeys(list(campos) + extras))
+
+
+class ListaRapidaMixin:
+    """
+    list() de viewsets por values() + codificador JSON rápido
+
+    As colunas são as de `campos_lista()` (por padrão, Meta.fields do
+    serializer de listagem).
+    """
+
+    renderer_classes = [JSONRapidoRenderer, BrowsableAPIRenderer]
+
+    def campos_lista(self):
+        return list(self.get_serializer_class().Meta.fields)
+
+    def list(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        campos = self.campos_lista()
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.values(*_colunas_consulta(queryset, campos))
+        pagina = self.paginate_queryset(queryset)
+        dados = serializar_linhas(queryset.model, campos, queryset if pagina is None else pagina)
+        if pagina is not None:
+            dados = self.paginator.get_paginated_data(dados)
+        return Response(dados)
@@ -0,0 +1,74 @@
+"""
+Paginação da API REST por cursor (keyset)
+"""
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from core.paginacao import CursorInvalido, paginar
+
+
+class PaginacaoCursor(BasePagination):
+    """
+    Páginas por cursor na ordem do queryset (após ?ordering=)
+
+    Parâmetros: ?cursor= (vem em next/previous), ?limite= (até max_limite) e
+    ?total=estimado para incluir total_estimado na resposta.
+    """
+
+    cursor_query_param = 'cursor'
+    limite_query_param = 'limite'
+    max_limite = 100
+
+    def get_limite(self, request):
+        padrao = getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE') or 20
+        try:
+            limite = int(request.query_params[self.limite_query_param])
+        except (KeyError, ValueError):
+            return padrao
+        return max(1, min(limite, self.max_limite))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.pagina = paginar(
+                queryset,
+                cursor=request.query_params.get(self.cursor_query_param),
+                tamanho=self.get_limite(request),
+                estimar=request.query_params.get('total') == 'estimado',
+            )
+        except CursorInvalido as e:
+            raise NotFound(str(e))
+        return self.pagina.itens
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_data(self, data):
+        resposta = {
+            'next': self._link(self.pagina.proximo),
+            'previous': self._link(self.pagina.anterior),
+            'results': data,
+        }
+        if self.pagina.total_estimado is not None:
+            resposta['total_estimado'] = self.pagina.total_estimado
+        return resposta
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'total_estimado': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -5,6 +5,16 @@ from rest_framework import serializers
 from core.models import NFe, NFeItem, CTe, ImportLog
 
 
+class CamposDinamicosMixin:
+    """Aceita `campos` (nomes) para serializar só parte dos campos (ver api.campos)"""
+
+    def __init__(self, *args, campos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if campos is not None:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
+
 class NFeItemSerializer(serializers.ModelSerializer):
     """Serializer para itens de NFe"""
 
@@ -17,33 +27,40 @@ class NFeItemSerializer(serializers.ModelSerializer):
         ]
 
 
-class NFeListSerializer(serializers.ModelSerializer):
+class NFeListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para listagem de NFes (resumido)"""
 
     class Meta:
         model = NFe
         fields = [
-            'id', 'chave_acesso', 'numero_n', 'serie', 'data_emissao',
+            'id', 'chave_acesso', 'numero_nf', 'serie', 'data_emissao',
             'emit_cnpj', 'emit_nome', 'dest_nome', 'valor_total',
             'status_nfe'
         ]
 
 
-class NFeDetailSerializer(serializers.ModelSerializer):
+class NFeDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para detalhes completos de NFe"""
 
     itens = NFeItemSerializer(many=True, read_only=True)
     total_itens = serializers.SerializerMethodField()
+    xml_content = serializers.CharField(read_only=True)
 
     class Meta:
         model = NFe
         fields = '__all__'
 
     def get_total_itens(self, obj):
+        # Anotação ou itens pré-carregados pela view; COUNT só fora delas
+        total = getattr(obj, 'quantidade_itens', None)
+        if total is not None:
+            return total
+        if 'itens' in getattr(obj, '_prefetched_objects_cache', {}):
+            return len(obj.itens.all())
         return obj.itens.count()
 
 
-class CTeListSerializer(serializers.ModelSerializer):
+class CTeListSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para listagem de CTes (resumido)"""
 
     class Meta:
@@ -55,15 +72,17 @@ class CTeListSerializer(serializers.ModelSerializer):
         ]
 
 
-class CTeDetailSerializer(serializers.ModelSerializer):
+class CTeDetailSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para detalhes completos de CTe"""
 
+    xml_content = serializers.CharField(read_only=True)
+
     class Meta:
         model = CTe
         fields = '__all__'
 
 
-class ImportLogSerializer(serializers.ModelSerializer):
+class ImportLogSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     """Serializer para logs de importação"""
 
     usuario_nome = serializers.CharField(source='usuario.username', read_only=True)
@@ -72,7 +91,7 @@ class ImportLogSerializer(serializers.ModelSerializer):
         model = ImportLog
         fields = [
             'id', 'data_importacao', 'tipo_documento', 'arquivo_nome',
-            'status', 'mensagem', 'chave_acesso', 'usuario_nome'
+            'status', 'mensagem', 'chave_acesso', 'quantidade', 'usuario_nome'
         ]
 
 
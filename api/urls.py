@@ -20,6 +20,7 @@ urlpatterns = [
     path('dashboard/', views.dashboard_api, name='api_dashboard'),
     path('statistics/', views.statistics_api, name='api_statistics'),
     path('search/', views.search_api, name='api_search'),
+    path('cache/', views.cache_api, name='api_cache'),
 
     # Router URLs
     path('', include(router.urls)),
@@ -5,21 +5,39 @@ Endpoints otimizados para consumo mobile
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count, Q
-from django.db.models.functions import TruncMonth
-from datetime import datetime, timedelta
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db.models import Count, Prefetch, Sum
+from django.http import Http404
+from django.utils import timezone
 
 from core.models import NFe, NFeItem, CTe, ImportLog
+from core.busca import buscar
+from core.cache_consultas import contadores, em_cache
+from core.estatisticas import resumo_analiticos, resumo_dashboard
+from .campos import CamposSelecionadosMixin
+from .condicional import RespostaCondicionalMixin, condicional
+from .filters import BuscaIndexadaFilter
+from .lista_rapida import ListaRapidaMixin
 from .serializers import (
-    NFeListSerializer, NFeDetailSerializer,
+    NFeListSerializer, NFeDetailSerializer, NFeItemSerializer,
     CTeListSerializer, CTeDetailSerializer,
     ImportLogSerializer, DashboardSerializer,
     StatisticsSerializer
 )
 
 
-class NFeViewSet(viewsets.ReadOnlyModelViewSet):
+def _em_cache(request, nome, dependencias, calcular, parametros=None):
+    """Response com o resultado de calcular() do cache de consultas (X-Cache: HIT/MISS)"""
+    dados, acerto = em_cache(
+        nome, dependencias, request.query_params if parametros is None else parametros, calcular,
+        atuais=getattr(request, 'versoes_dados', None),
+    )
+    resposta = Response(dados)
+    resposta['X-Cache'] = 'HIT' if acerto else 'MISS'
+    return resposta
+
+
+class NFeViewSet(RespostaCondicionalMixin, CamposSelecionadosMixin, ListaRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para NFes
 
@@ -28,13 +46,15 @@ class NFeViewSet(viewsets.ReadOnlyModelViewSet):
     - GET /api/nfe/{id}/ - Detalhes de uma NFe
     - GET /api/nfe/search/?q=termo - Busca por termo
     - GET /api/nfe/by_emitente/?cnpj=00000000000000 - Filtra por emitente
+    - GET /api/nfe/{id}/itens/ - Itens da NFe paginados por cursor
+    - ?fields=a,b / ?exclude=c em listas e detalhes (XML só se pedido)
     """
 
     queryset = NFe.objects.all().order_by('-data_emissao')
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['numero_n', 'emit_nome', 'dest_nome', 'chave_acesso']
-    ordering_fields = ['data_emissao', 'valor_total', 'numero_n']
+    dados_versionados = ('NFe',)
+    filter_backends = [BuscaIndexadaFilter, filters.OrderingFilter]
+    ordering_fields = ['data_emissao', 'valor_total', 'numero_nf']
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -60,37 +80,58 @@ class NFeViewSet(viewsets.ReadOnlyModelViewSet):
 
         return queryset
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        campos = self.campos_selecionados()
+        if 'itens' in campos:
+            # Itens de todas as notas numa consulta; total_itens é contado sobre eles
+            queryset = queryset.prefetch_related(Prefetch('itens', queryset=NFeItem.objects.order_by('numero_item')))
+        elif 'total_itens' in campos:
+            queryset = queryset.annotate(quantidade_itens=Count('itens'))
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    @condicional('NFe')
+    def itens(self, request, pk=None):
+        """Itens da NFe em páginas por cursor (?limite=, ?cursor=), para notas grandes"""
+        if not self.get_queryset().filter(pk=pk).exists():
+            raise Http404
+        pagina = self.paginate_queryset(NFeItem.objects.filter(nfe_id=pk).order_by('numero_item'))
+        return self.get_paginated_response(NFeItemSerializer(pagina, many=True).data)
+
     @action(detail=False, methods=['get'])
+    @condicional('NFe')
     def totais(self, request):
         """Retorna totalizadores das NFes"""
-        queryset = self.filter_queryset(self.get_queryset())
+        def calcular():
+            return self.filter_queryset(self.get_queryset()).aggregate(
+                total_notas=Count('id'),
+                valor_total=Sum('valor_total'),
+                valor_produtos=Sum('valor_produtos'),
+                valor_icms=Sum('valor_icms'),
+                valor_ipi=Sum('valor_ipi')
+            )
 
-        totais = queryset.aggregate(
-            total_notas=Count('id'),
-            valor_total=Sum('valor_total'),
-            valor_produtos=Sum('valor_produtos'),
-            valor_icms=Sum('valor_icms'),
-            valor_ipi=Sum('valor_ipi')
-        )
-
-        return Response(totais)
+        return _em_cache(request, 'nfe_totais', self.dados_versionados, calcular)
 
     @action(detail=False, methods=['get'])
+    @condicional('NFe')
     def por_emitente(self, request):
         """Agrupa NFes por emitente"""
-        queryset = self.filter_queryset(self.get_queryset())
-
-        emitentes = queryset.values(
-            'emit_cnpj', 'emit_nome'
-        ).annotate(
-            total_notas=Count('id'),
-            valor_total=Sum('valor_total')
-        ).order_by('-total_notas')[:20]
+        def calcular():
+            return list(self.filter_queryset(self.get_queryset()).values(
+                'emit_cnpj', 'emit_nome'
+            ).annotate(
+                total_notas=Count('id'),
+                valor_total=Sum('valor_total')
+            ).order_by('-total_notas')[:20])
 
-        return Response(emitentes)
+        return _em_cache(request, 'nfe_por_emitente', self.dados_versionados, calcular)
 
 
-class CTeViewSet(viewsets.ReadOnlyModelViewSet):
+class CTeViewSet(RespostaCondicionalMixin, CamposSelecionadosMixin, ListaRapidaMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para CTes
 
@@ -102,8 +143,8 @@ class CTeViewSet(viewsets.ReadOnlyModelViewSet):
 
     queryset = CTe.objects.all().order_by('-data_emissao')
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['numero_ct', 'emit_nome', 'dest_nome', 'chave_acesso']
+    dados_versionados = ('CTe',)
+    filter_backends = [BuscaIndexadaFilter, filters.OrderingFilter]
     ordering_fields = ['data_emissao', 'valor_total', 'numero_ct']
 
     def get_serializer_class(self):
@@ -112,36 +153,36 @@ class CTeViewSet(viewsets.ReadOnlyModelViewSet):
         return CTeListSerializer
 
     @action(detail=False, methods=['get'])
+    @condicional('CTe')
     def totais(self, request):
         """Retorna totalizadores dos CTes"""
-        queryset = self.filter_queryset(self.get_queryset())
-
-        totais = queryset.aggregate(
-            total_ctes=Count('id'),
-            valor_total=Sum('valor_total'),
-            valor_carga=Sum('valor_carga'),
-            valor_icms=Sum('valor_icms')
-        )
+        def calcular():
+            return self.filter_queryset(self.get_queryset()).aggregate(
+                total_ctes=Count('id'),
+                valor_total=Sum('valor_total'),
+                valor_carga=Sum('valor_carga'),
+                valor_icms=Sum('valor_icms')
+            )
 
-        return Response(totais)
+        return _em_cache(request, 'cte_totais', self.dados_versionados, calcular)
 
     @action(detail=False, methods=['get'])
+    @condicional('CTe')
     def rotas(self, request):
         """Agrupa CTes por rota"""
-        queryset = self.filter_queryset(self.get_queryset())
+        def calcular():
+            return list(self.filter_queryset(self.get_queryset()).values(
+                'municipio_inicio', 'uf_inicio',
+                'municipio_fim', 'uf_fim'
+            ).annotate(
+                total_ctes=Count('id'),
+                valor_total=Sum('valor_total')
+            ).order_by('-total_ctes')[:20])
 
-        rotas = queryset.values(
-            'municipio_inicio', 'uf_inicio',
-            'municipio_fim', 'uf_fim'
-        ).annotate(
-            total_ctes=Count('id'),
-            valor_total=Sum('valor_total')
-        ).order_by('-total_ctes')[:20]
+        return _em_cache(request, 'cte_rotas', self.dados_versionados, calcular)
 
-        return Response(rotas)
 
-
-class ImportLogViewSet(viewsets.ReadOnlyModelViewSet):
+class ImportLogViewSet(RespostaCondicionalMixin, CamposSelecionadosMixin, viewsets.ReadOnlyModelViewSet):
     """
     API para logs de importação
 
@@ -153,6 +194,7 @@ class ImportLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ImportLog.objects.all().order_by('-data_importacao')
     serializer_class = ImportLogSerializer
     permission_classes = [IsAuthenticated]
+    dados_versionados = ('ImportLog',)
     filter_backends = [filters.OrderingFilter]
 
     def get_queryset(self):
@@ -173,6 +215,7 @@ class ImportLogViewSet(viewsets.ReadOnlyModelViewSet):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional('NFe', 'CTe', 'ImportLog')
 def dashboard_api(request):
     """
     Endpoint para dados do dashboard mobile
@@ -182,37 +225,23 @@ def dashboard_api(request):
     Retorna estatísticas gerais do sistema
     """
 
-    # Período: últimos 30 dias
-    data_inicio = datetime.now() - timedelta(days=30)
-
-    # Estatísticas NFe
-    nfe_total = NFe.objects.count()
-    nfe_mes = NFe.objects.filter(data_emissao__gte=data_inicio).count()
-    nfe_valor_total = NFe.objects.aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-    nfe_valor_mes = NFe.objects.filter(
-        data_emissao__gte=data_inicio
-    ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-
-    # Estatísticas CTe
-    cte_total = CTe.objects.count()
-    cte_mes = CTe.objects.filter(data_emissao__gte=data_inicio).count()
-    cte_valor_total = CTe.objects.aggregate(Sum('valor_total'))['valor_total__sum'] or 0
-    cte_valor_mes = CTe.objects.filter(
-        data_emissao__gte=data_inicio
-    ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0
+    # Totais vêm das tabelas de resumo (em cache)
+    resumo = resumo_dashboard()
+    nfe_stats = resumo['nfe_stats']
+    cte_stats = resumo['cte_stats']
 
     # Últimos logs
     ultimos_logs = ImportLog.objects.order_by('-data_importacao')[:10]
 
     data = {
-        'nfe_total': nfe_total,
-        'nfe_mes': nfe_mes,
-        'nfe_valor_total': nfe_valor_total,
-        'nfe_valor_mes': nfe_valor_mes,
-        'cte_total': cte_total,
-        'cte_mes': cte_mes,
-        'cte_valor_total': cte_valor_total,
-        'cte_valor_mes': cte_valor_mes,
+        'nfe_total': nfe_stats['total'],
+        'nfe_mes': nfe_stats['mes_atual'],
+        'nfe_valor_total': nfe_stats['valor_total'],
+        'nfe_valor_mes': nfe_stats['valor_mes'],
+        'cte_total': cte_stats['total'],
+        'cte_mes': cte_stats['mes_atual'],
+        'cte_valor_total': cte_stats['valor_total'],
+        'cte_valor_mes': cte_stats['valor_mes'],
         'ultimos_logs': ImportLogSerializer(ultimos_logs, many=True).data,
     }
 
@@ -221,60 +250,29 @@ def dashboard_api(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional('NFe', 'CTe')
 def statistics_api(request):
     """
     Endpoint para estatísticas e análises
 
     GET /api/statistics/
+    GET /api/statistics/?dias=90
 
     Retorna análises detalhadas para dashboard mobile
     """
 
-    # Top 10 emitentes
-    top_emitentes = list(NFe.objects.values(
-        'emit_cnpj', 'emit_nome'
-    ).annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-total')[:10])
-
-    # Top 10 produtos
-    top_produtos = list(NFeItem.objects.values(
-        'codigo_produto', 'descricao'
-    ).annotate(
-        qtd_total=Sum('quantidade'),
-        valor_total=Sum('valor_total')
-    ).order_by('-qtd_total')[:10])
-
-    # Top 10 rotas
-    top_rotas = list(CTe.objects.values(
-        'municipio_inicio', 'uf_inicio',
-        'municipio_fim', 'uf_fim'
-    ).annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-total')[:10])
-
-    # Vendas por mês (últimos 12 meses)
-    vendas_por_mes = list(NFe.objects.annotate(
-        mes=TruncMonth('data_emissao')
-    ).values('mes').annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-mes')[:12])
+    dias = request.query_params.get('dias')
+    dias = int(dias) if dias and dias.isdigit() else None
 
-    data = {
-        'top_emitentes': top_emitentes,
-        'top_produtos': top_produtos,
-        'top_rotas': top_rotas,
-        'vendas_por_mes': vendas_por_mes,
-    }
-
-    return Response(data)
+    # Top 10 emitentes, produtos e rotas e vendas dos últimos 12 meses (resumos diários);
+    # com janela, o dia entra na chave porque a janela anda sem novas importações
+    parametros = {'dias': dias, 'hoje': timezone.localdate().isoformat()} if dias else {}
+    return _em_cache(request, 'estatisticas', ('NFe', 'CTe'), lambda: resumo_analiticos(dias=dias), parametros)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@condicional('NFe', 'CTe')
 def search_api(request):
     """
     Busca unificada em NFes e CTes
@@ -289,26 +287,29 @@ def search_api(request):
     if not query:
         return Response({'error': 'Parâmetro q é obrigatório'}, status=400)
 
-    # Busca em NFes
-    nfes = NFe.objects.filter(
-        Q(numero_nf__icontains=query) |
-        Q(chave_acesso__icontains=query) |
-        Q(emit_nome__icontains=query) |
-        Q(dest_nome__icontains=query)
-    ).order_by('-data_emissao')[:20]
-
-    # Busca em CTes
-    ctes = CTe.objects.filter(
-        Q(numero_ct__icontains=query) |
-        Q(chave_acesso__icontains=query) |
-        Q(emit_nome__icontains=query) |
-        Q(dest_nome__icontains=query)
-    ).order_by('-data_emissao')[:20]
+    # Busca indexada; total de cada tipo vem na mesma consulta (janela)
+    nfes, total_nfes = buscar(
+        NFe.objects.only(*NFeListSerializer.Meta.fields).order_by('-data_emissao'), query
+    )
+    ctes, total_ctes = buscar(
+        CTe.objects.only(*CTeListSerializer.Meta.fields).order_by('-data_emissao'), query
+    )
 
     data = {
         'nfes': NFeListSerializer(nfes, many=True).data,
         'ctes': CTeListSerializer(ctes, many=True).data,
-        'total_results': nfes.count() + ctes.count(),
+        'total_results': total_nfes + total_ctes,
     }
 
     return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_api(request):
+    """
+    Acertos e falhas do cache de consultas (para ajuste de TTL/tamanho)
+
+    GET /api/cache/
+    """
+    return Response(contadores())
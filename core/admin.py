@@ -4,12 +4,19 @@ from .models import NFe, NFeItem, CTe, ImportLog
 
 @admin.register(NFe)
 class NFeAdmin(admin.ModelAdmin):
-    list_display = ['numero_n', 'emit_nome', 'dest_nome', 'valor_total', 'data_emissao']
-    list_filter = ['data_emissao', 'emit_u', 'status_nfe']
-    search_fields = ['chave_acesso', 'numero_n', 'emit_nome', 'dest_nome', 'emit_cnpj']
+    list_display = ['numero_nf', 'emit_nome', 'dest_nome', 'valor_total', 'data_emissao']
+    list_filter = ['data_emissao', 'emit_uf', 'status_nfe']
+    search_fields = ['chave_acesso', 'numero_nf', 'emit_nome', 'dest_nome', 'emit_cnpj']
     date_hierarchy = 'data_emissao'
     readonly_fields = ['data_importacao']
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        # Changelist carrega só as colunas listadas; o formulário usa o modelo inteiro
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            qs = qs.only(*NFe.CAMPOS_LISTAGEM)
+        return qs
+
 
 @admin.register(NFeItem)
 class NFeItemAdmin(admin.ModelAdmin):
@@ -21,11 +28,17 @@ class NFeItemAdmin(admin.ModelAdmin):
 @admin.register(CTe)
 class CTeAdmin(admin.ModelAdmin):
     list_display = ['numero_ct', 'emit_nome', 'dest_nome', 'valor_total', 'data_emissao']
-    list_filter = ['data_emissao', 'emit_u', 'modal']
+    list_filter = ['data_emissao', 'emit_uf', 'modal']
     search_fields = ['chave_acesso', 'numero_ct', 'emit_nome', 'dest_nome']
     date_hierarchy = 'data_emissao'
     readonly_fields = ['data_importacao']
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            qs = qs.only(*CTe.CAMPOS_LISTAGEM)
+        return qs
+
 
 @admin.register(ImportLog)
 class ImportLogAdmin(admin.ModelAdmin):
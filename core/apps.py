@@ -1,7 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Core - Gestão de XMLs'
+
+    def ready(self):
+        from .busca import criar_indices_apos_migrate
+        from .estatisticas import atualizar_por_signal, guardar_anterior_por_signal, remover_por_signal
+        from .versoes import incrementar_por_signal
+
+        # Índices de busca (FTS5/pg_trgm) não são expressáveis nos models
+        post_migrate.connect(criar_indices_apos_migrate, sender=self)
+
+        # Alterações individuais (admin, create) mudam a versão usada nos ETags e os resumos
+        for nome in ('NFe', 'CTe'):
+            modelo = self.get_model(nome)
+            post_save.connect(incrementar_por_signal, sender=modelo, dispatch_uid=f'versao_{nome}_save')
+            post_delete.connect(incrementar_por_signal, sender=modelo, dispatch_uid=f'versao_{nome}_delete')
+            pre_save.connect(guardar_anterior_por_signal, sender=modelo, dispatch_uid=f'resumo_{nome}_pre_save')
+            post_save.connect(atualizar_por_signal, sender=modelo, dispatch_uid=f'resumo_{nome}_save')
+            # pre_delete: os itens da NFe ainda existem (o CASCADE apaga antes do post_delete)
+            pre_delete.connect(remover_por_signal, sender=modelo, dispatch_uid=f'resumo_{nome}_delete')
@@ -0,0 +1,135 @@
+"""
+Gravação em lote dos ImportLog
+
+Em cargas grandes um INSERT por arquivo dobra as escritas e, no SQLite,
+disputa o lock de escrita com a gravação dos documentos. BufferImportLog
+acumula os registros em memória e grava com bulk_create ao atingir
+`tamanho` registros ou `intervalo` segundos desde a última gravação. O
+conteúdo pendente é gravado ao sair do bloco `with` (inclusive com exceção)
+e, como última garantia, na saída do processo.
+"""
+import atexit
+import logging
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Iterable, List
+
+from django.db import transaction
+
+from .models import ImportLog
+from .versoes import incrementar_versao
+
+logger = logging.getLogger(__name__)
+
+_abertos = weakref.WeakSet()
+
+
+@atexit.register
+def _descarregar_abertos():
+    for buffer in list(_abertos):
+        try:
+            buffer.descarregar()
+        except Exception:
+            logger.exception("Falha ao gravar ImportLog pendentes na saída")
+
+
+class BufferImportLog:
+    """Acumula ImportLog e grava em lote por tamanho ou tempo"""
+
+    def __init__(self, tamanho: int = 500, intervalo: float = 5.0, resumir_sucessos: bool = False, usuario=None):
+        """
+        Args:
+            tamanho: Registros pendentes que disparam a gravação
+            intervalo: Segundos máximos entre gravações
+            resumir_sucessos: Grava os sucessos de cada descarga como um registro por
+                tipo, com quantidade (erros continuam um por arquivo)
+            usuario: Usuário padrão dos registros
+        """
+        self.tamanho = tamanho
+        self.intervalo = intervalo
+        self.resumir_sucessos = resumir_sucessos
+        self.usuario = usuario
+        self.gravados = 0
+        self._pendentes: List[ImportLog] = []
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+        _abertos.add(self)
+
+    def registrar(self, tipo, arquivo_nome, status, mensagem=None, chave_acesso=None, quantidade=1):
+        """Cria e enfileira um ImportLog"""
+        self.adicionar([ImportLog(
+            tipo_documento=tipo,
+            arquivo_nome=arquivo_nome[:255],
+            status=status,
+            mensagem=mensagem,
+            chave_acesso=chave_acesso,
+            quantidade=quantidade,
+            usuario=self.usuario,
+        )])
+
+    def adicionar(self, logs: Iterable[ImportLog]):
+        """Enfileira registros já montados; grava se atingir tamanho ou intervalo"""
+        with self._lock:
+            self._pendentes.extend(logs)
+            cheio = len(self._pendentes) >= self.tamanho
+            vencido = time.monotonic() - self._ultima >= self.intervalo
+        if cheio or vencido:
+            self.descarregar()
+
+    def __len__(self):
+        return len(self._pendentes)
+
+    def descarregar(self) -> int:
+        """Grava os pendentes; retorna quantas linhas foram inseridas"""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+            self._ultima = time.monotonic()
+        if not pendentes:
+            return 0
+
+        if self.resumir_sucessos:
+            pendentes = self._resumir(pendentes)
+        try:
+            with transaction.atomic():
+                ImportLog.objects.bulk_create(pendentes, batch_size=self.tamanho)
+                incrementar_versao('ImportLog')
+        except Exception:
+            # Devolve para a próxima tentativa (ex.: banco momentaneamente travado)
+            with self._lock:
+                self._pendentes[:0] = pendentes
+            raise
+        self.gravados += len(pendentes)
+        return len(pendentes)
+
+    def _resumir(self, logs: List[ImportLog]) -> List[ImportLog]:
+        sucessos = Counter()
+        resto = []
+        for log in logs:
+            if log.status == 'sucesso':
+                sucessos[(log.tipo_documento, log.usuario_id)] += log.quantidade
+            else:
+                resto.append(log)
+        return resto + [
+            ImportLog(
+                tipo_documento=tipo,
+                arquivo_nome=f"{quantidade} arquivo(s)",
+                status='sucesso',
+                mensagem='Resumo do lote importado',
+                quantidade=quantidade,
+                usuario_id=usuario_id,
+            )
+            for (tipo, usuario_id), quantidade in sucessos.items()
+        ]
+
+    def fechar(self):
+        """Grava o que restou e desliga a gravação na saída do processo"""
+        self.descarregar()
+        _abertos.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
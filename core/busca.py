@@ -0,0 +1,144 @@
+"""
+Busca indexada em NFe/CTe (número, chave de acesso, emitente e destinatário)
+
+- Chave de 44 dígitos e números curtos vão direto aos índices de
+  chave_acesso/numero (busca pontual).
+- SQLite: tabelas FTS5 com tokenizer trigram (casam trechos como o
+  icontains), mantidas por triggers, então bulk_create e upserts também
+  atualizam o índice. O rowid da FTS é o id do documento.
+- PostgreSQL: índices GIN pg_trgm sobre UPPER(coluna), que atendem o
+  icontains do ORM sem varrer a tabela.
+- Outros bancos: icontains como antes.
+
+As tabelas/índices são criados no post_migrate (e refeitos pelo comando
+reconstruir_busca).
+"""
+import re
+import sqlite3
+
+from django.db import connections
+from django.db.models import Count, Q, Window
+from django.db.models.expressions import RawSQL
+
+from .models import NFe, CTe
+
+# Campo de número por modelo (demais campos são comuns)
+CAMPO_NUMERO = {NFe: 'numero_nf', CTe: 'numero_ct'}
+CAMPOS_TEXTO = ('chave_acesso', 'emit_nome', 'dest_nome')
+
+_RE_CHAVE = re.compile(r'^\d{44}$')
+_RE_NUMERO = re.compile(r'^\d{1,9}$')
+
+# Trigram exige SQLite 3.34+; termos menores que 3 caracteres não geram trigramas
+FTS_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+TAMANHO_MINIMO_FTS = 3
+
+
+def _tabela_fts(modelo) -> str:
+    return f'{modelo._meta.db_table}_busca'
+
+
+def _colunas(modelo):
+    return (CAMPO_NUMERO[modelo],) + CAMPOS_TEXTO
+
+
+def _usa_fts(conexao) -> bool:
+    return conexao.vendor == 'sqlite' and FTS_TRIGRAM
+
+
+def _sql_sqlite(modelo):
+    tabela, fts = modelo._meta.db_table, _tabela_fts(modelo)
+    colunas = ', '.join(_colunas(modelo))
+    novos = ', '.join(f'new.{c}' for c in _colunas(modelo))
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({colunas}, tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabela} BEGIN "
+        f"INSERT INTO {fts}(rowid, {colunas}) VALUES (new.id, {novos}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabela} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {colunas} ON {tabela} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; "
+        f"INSERT INTO {fts}(rowid, {colunas}) VALUES (new.id, {novos}); END",
+    ]
+
+
+def _sql_postgresql(modelo):
+    tabela = modelo._meta.db_table
+    return ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+        f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_trgm ON {tabela} USING gin (UPPER({coluna}) gin_trgm_ops)'
+        for coluna in _colunas(modelo)
+    ]
+
+
+def criar_indices(using: str = 'default', reconstruir: bool = False):
+    """
+    Cria as estruturas de busca do banco (idempotente)
+
+    No SQLite preenche a FTS quando ela acaba de ser criada ou com reconstruir.
+    """
+    conexao = connections[using]
+    with conexao.cursor() as cursor:
+        for modelo in CAMPO_NUMERO:
+            if _usa_fts(conexao):
+                fts = _tabela_fts(modelo)
+                existia = fts in conexao.introspection.table_names(cursor)
+                for sql in _sql_sqlite(modelo):
+                    cursor.execute(sql)
+                if reconstruir or not existia:
+                    colunas = ', '.join(_colunas(modelo))
+                    cursor.execute(f'DELETE FROM {fts}')
+                    cursor.execute(
+                        f'INSERT INTO {fts}(rowid, {colunas}) SELECT id, {colunas} FROM {modelo._meta.db_table}'
+                    )
+            elif conexao.vendor == 'postgresql':
+                for sql in _sql_postgresql(modelo):
+                    cursor.execute(sql)
+
+
+def criar_indices_apos_migrate(sender, using='default', **kwargs):
+    criar_indices(using)
+
+
+def _expressao_fts(termo: str) -> str:
+    # Cada palavra vira uma frase entre aspas (aspas internas duplicadas), combinadas com AND
+    return ' '.join('"{}"'.format(palavra.replace('"', '""')) for palavra in termo.split())
+
+
+def filtro_busca(modelo, termo: str, using: str = 'default') -> Q:
+    """
+    Q que encontra o termo em número, chave, emitente ou destinatário
+
+    Chave completa e números vão ao índice da coluna; texto usa a FTS (SQLite)
+    ou o icontains atendido pelos índices trigram (PostgreSQL).
+    """
+    termo = termo.strip()
+    if _RE_CHAVE.match(termo):
+        return Q(chave_acesso=termo)
+    if _RE_NUMERO.match(termo):
+        return Q(**{CAMPO_NUMERO[modelo]: termo})
+
+    palavras = termo.split()
+    if _usa_fts(connections[using]) and palavras and all(len(p) >= TAMANHO_MINIMO_FTS for p in palavras):
+        return Q(pk__in=RawSQL(
+            f'SELECT rowid FROM {_tabela_fts(modelo)} WHERE {_tabela_fts(modelo)} MATCH %s',
+            [_expressao_fts(termo)],
+        ))
+
+    filtro = Q()
+    for campo in _colunas(modelo):
+        filtro |= Q(**{f'{campo}__icontains': termo})
+    return filtro
+
+
+def buscar(queryset, termo: str, limite: int = 20):
+    """
+    Primeiros `limite` documentos com o termo e o total, em uma única consulta
+
+    Returns:
+        (lista de documentos, total de resultados)
+    """
+    resultados = list(
+        queryset.filter(filtro_busca(queryset.model, termo, queryset.db))
+        .annotate(total_busca=Window(Count('pk')))[:limite]
+    )
+    return resultados, (resultados[0].total_busca if resultados else 0)
@@ -0,0 +1,102 @@
+"""
+Cache de consultas agregadas com invalidação pelas versões dos dados
+
+A chave junta o nome da consulta, os parâmetros normalizados (ordem, vazios
+e paginação ignorados) e as versões de core.versoes dos conjuntos de que
+ela depende. Importações, eventos da SEFAZ e gravação de logs incrementam
+essas versões, então entradas antigas deixam de ser encontradas e saem do
+cache pelo LRU/TTL do backend, sem varrer chaves.
+"""
+import hashlib
+from typing import Callable, Dict, Iterable, Mapping, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .versoes import versoes
+
+PREFIXO = 'consultas'
+
+# Parâmetros que não mudam o resultado de agregações
+PARAMETROS_IGNORADOS = {'cursor', 'limite', 'ordering', 'format', 'total', 'fields', 'exclude'}
+
+_CONTADORES = f'{PREFIXO}:contadores'
+
+
+def normalizar_parametros(parametros: Mapping) -> Tuple:
+    """Parâmetros como tupla ordenada, sem vazios nem os que não afetam o resultado"""
+    itens = []
+    lista = parametros.getlist if hasattr(parametros, 'getlist') else lambda k: [parametros[k]]
+    for chave in sorted(parametros):
+        if chave in PARAMETROS_IGNORADOS:
+            continue
+        valores = sorted(str(v).strip() for v in lista(chave) if str(v).strip())
+        if valores:
+            itens.append((chave, tuple(valores)))
+    return tuple(itens)
+
+
+def chave_cache(nome: str, dependencias: Iterable[str], parametros: Mapping = None, atuais: Dict = None) -> str:
+    dependencias = list(dependencias)
+    if atuais is None or not set(dependencias) <= set(atuais):
+        atuais = versoes(dependencias)
+    atuais = {dep: atuais[dep] for dep in dependencias}
+    marcas = ','.join(f'{dep}:{versao}' for dep, (versao, _) in sorted(atuais.items()))
+    resumo = hashlib.md5(repr(normalizar_parametros(parametros or {})).encode()).hexdigest()
+    return f'{PREFIXO}:{nome}:{marcas}:{resumo}'
+
+
+def _contar(nome: str, evento: str):
+    chave = f'{_CONTADORES}:{nome}:{evento}'
+    cache.add(chave, 0, timeout=None)
+    try:
+        cache.incr(chave)
+    except ValueError:  # removido entre o add e o incr (LRU)
+        cache.set(chave, 1, timeout=None)
+    nomes = cache.get(_CONTADORES) or set()
+    if nome not in nomes:
+        cache.set(_CONTADORES, nomes | {nome}, timeout=None)
+
+
+def em_cache(nome: str, dependencias: Iterable[str], parametros: Mapping, calcular: Callable, atuais: Dict = None):
+    """
+    Resultado de calcular() em cache para estes parâmetros e versões
+
+    Args:
+        atuais: Versões já lidas nesta requisição (evita reler; ver api.condicional)
+
+    Returns:
+        (valor, True se veio do cache)
+    """
+    chave = chave_cache(nome, dependencias, parametros, atuais)
+    valor = cache.get(chave)
+    if valor is not None:
+        _contar(nome, 'acertos')
+        return valor, True
+
+    valor = calcular()
+    cache.set(chave, valor, getattr(settings, 'CACHE_CONSULTAS_TTL', 3600))
+    _contar(nome, 'falhas')
+    return valor, False
+
+
+def contadores() -> Dict[str, Dict]:
+    """{consulta: {'acertos', 'falhas', 'taxa_acerto'}} desde o último zerar_contadores()"""
+    resultado = {}
+    for nome in sorted(cache.get(_CONTADORES) or ()):
+        acertos = cache.get(f'{_CONTADORES}:{nome}:acertos') or 0
+        falhas = cache.get(f'{_CONTADORES}:{nome}:falhas') or 0
+        total = acertos + falhas
+        resultado[nome] = {
+            'acertos': acertos,
+            'falhas': falhas,
+            'taxa_acerto': round(acertos / total, 4) if total else None,
+        }
+    return resultado
+
+
+def zerar_contadores():
+    nomes = cache.get(_CONTADORES) or ()
+    cache.delete_many(
+        [f'{_CONTADORES}:{nome}:{evento}' for nome in nomes for evento in ('acertos', 'falhas')] + [_CONTADORES]
+    )
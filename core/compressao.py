@@ -0,0 +1,266 @@
+"""
+Compressão dos XMLs armazenados no banco (zlib com dicionário compartilhado)
+
+NFe/CTe são muito repetitivos entre si (mesmas tags, namespaces, emitentes),
+então um dicionário zlib (zdict) treinado no próprio acervo comprime bem até
+documentos pequenos. Formato gravado:
+
+    b'XZ' + id do DicionarioCompressao (4 bytes, 0 = sem dicionário) + stream zlib
+
+XMLComprimidoField guarda esses bytes e só descomprime no primeiro acesso ao
+atributo; se o XML não for alterado, o save regrava os bytes originais.
+"""
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Iterable, Optional, Tuple
+
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
+
+MAGICO = b'XZ'
+_CABECALHO = struct.Struct('>2sI')
+
+# Janela do zlib: só os últimos 32 KB do dicionário são aproveitados
+TAMANHO_DICIONARIO = 32 * 1024
+NIVEL = 9
+
+# Dicionário ativo é relido a cada intervalo (outros processos podem treinar um novo)
+_TTL_ATIVO = 300
+
+_RE_TOKEN = re.compile(r'<[^>]+>|[^<]+')
+
+_dicionarios = {}
+_ativo = None
+_ativo_em = 0.0
+_lock = threading.Lock()
+
+
+def treinar_dicionario(amostras: Iterable[str], tamanho: int = TAMANHO_DICIONARIO) -> bytes:
+    """
+    Monta um dicionário zlib com os trechos mais repetidos das amostras
+
+    Tags e textos que aparecem em vários documentos são pontuados por
+    frequência x tamanho; os mais valiosos ficam no fim do dicionário, que é a
+    região mais barata de referenciar no zlib.
+    """
+    frequencia = Counter()
+    for xml in amostras:
+        frequencia.update(set(_RE_TOKEN.findall(xml)))
+
+    candidatos = [t for t, n in frequencia.items() if n > 1]
+    candidatos.sort(key=lambda t: (frequencia[t] * len(t.encode('utf-8')), t), reverse=True)
+
+    escolhidos, total = [], 0
+    for token in candidatos:
+        dados = token.encode('utf-8')
+        if total + len(dados) > tamanho:
+            continue
+        escolhidos.append(dados)
+        total += len(dados)
+    return b''.join(reversed(escolhidos))
+
+
+def _modelo_dicionario():
+    return apps.get_model('core', 'DicionarioCompressao')
+
+
+def carregar_dicionario(dicionario_id: int) -> bytes:
+    """Bytes do dicionário (cache do processo; dicionários nunca mudam)"""
+    dados = _dicionarios.get(dicionario_id)
+    if dados is None:
+        dados = bytes(_modelo_dicionario().objects.values_list('dados', flat=True).get(pk=dicionario_id))
+        _dicionarios[dicionario_id] = dados
+    return dados
+
+
+def dicionario_ativo() -> Optional[Tuple[int, bytes]]:
+    """(id, bytes) do dicionário mais recente, ou None se nenhum foi treinado"""
+    global _ativo, _ativo_em
+    if time.monotonic() - _ativo_em > _TTL_ATIVO:
+        with _lock:
+            ultimo = _modelo_dicionario().objects.order_by('-pk').values_list('pk', 'dados').first()
+            _ativo = (ultimo[0], bytes(ultimo[1])) if ultimo else None
+            if _ativo:
+                _dicionarios[_ativo[0]] = _ativo[1]
+            _ativo_em = time.monotonic()
+    return _ativo
+
+
+def recarregar_dicionarios():
+    """Força a releitura do dicionário ativo (após treinar um novo)"""
+    global _ativo_em
+    _ativo_em = 0.0
+
+
+def _compressor(dicionario: Optional[Tuple[int, bytes]]):
+    """(cabeçalho, compressobj) para o dicionário informado (padrão: o ativo)"""
+    dicionario = dicionario or dicionario_ativo()
+    if dicionario:
+        return _CABECALHO.pack(MAGICO, dicionario[0]), zlib.compressobj(NIVEL, zdict=dicionario[1])
+    return _CABECALHO.pack(MAGICO, 0), zlib.compressobj(NIVEL)
+
+
+def comprimir_xml(xml: str, dicionario: Optional[Tuple[int, bytes]] = None) -> bytes:
+    """Comprime o XML com o dicionário informado (padrão: o ativo)"""
+    if not xml:
+        return b''
+    cabecalho, compressor = _compressor(dicionario)
+    return cabecalho + compressor.compress(xml.encode('utf-8')) + compressor.flush()
+
+
+def comprimir_arquivo(caminho, dicionario: Optional[Tuple[int, bytes]] = None, tamanho_bloco: int = 64 * 1024) -> bytes:
+    """
+    Comprime um arquivo XML (UTF-8) lendo blocos de bytes, sem montar o texto em memória
+
+    Gera o mesmo formato de comprimir_xml; o resultado pode ser atribuído
+    direto a um XMLComprimidoField.
+    """
+    cabecalho, compressor = _compressor(dicionario)
+    partes = [cabecalho]
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(tamanho_bloco), b''):
+            partes.append(compressor.compress(bloco))
+    partes.append(compressor.flush())
+    return b''.join(partes)
+
+
+def descomprimir_xml(dados) -> str:
+    """Bytes gravados por comprimir_xml -> XML (aceita texto legado sem compressão)"""
+    if dados is None or isinstance(dados, str):
+        return dados
+    dados = bytes(dados)
+    if not dados.startswith(MAGICO):
+        return dados.decode('utf-8')
+    _, dicionario_id = _CABECALHO.unpack_from(dados)
+    if dicionario_id:
+        descompressor = zlib.decompressobj(zdict=carregar_dicionario(dicionario_id))
+    else:
+        descompressor = zlib.decompressobj()
+    return (descompressor.decompress(dados[_CABECALHO.size:]) + descompressor.flush()).decode('utf-8')
+
+
+def dicionario_do_valor(dados) -> Optional[int]:
+    """Id do dicionário usado no valor gravado (None para texto sem compressão)"""
+    if isinstance(dados, (bytes, memoryview)) and bytes(dados[:2]) == MAGICO:
+        return _CABECALHO.unpack_from(bytes(dados[:_CABECALHO.size]))[1]
+    return None
+
+
+class _XMLComprimidoAttribute(DeferredAttribute):
+    """Descomprime na primeira leitura e guarda os bytes originais para o save"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        valor = super().__get__(instance, cls)
+        if isinstance(valor, (bytes, memoryview)):
+            texto = descomprimir_xml(valor)
+            instance.__dict__[self.field.attname] = texto
+            instance.__dict__[self.field.chave_original] = (valor, texto)
+            valor = texto
+        return valor
+
+    def __set__(self, instance, value):
+        # Descriptor de dados: a leitura sempre passa por __get__
+        instance.__dict__[self.field.attname] = value
+
+
+class XMLComprimidoField(models.BinaryField):
+    """
+    XML gravado comprimido (BinaryField) e exposto como str
+
+    A descompressão acontece só quando o atributo é lido; consultas que não
+    precisam do XML devem usar .defer()/.only() para nem trazer os bytes.
+    """
+
+    descriptor_class = _XMLComprimidoAttribute
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        self.chave_original = f'_{self.attname}_comprimido'
+
+    def pre_save(self, model_instance, add):
+        valor = model_instance.__dict__.get(self.attname)
+        original = model_instance.__dict__.get(self.chave_original)
+        if original is not None and valor is original[1]:
+            # XML lido e não alterado: regrava os bytes sem recomprimir
+            return original[0]
+        return valor
+
+    def get_prep_value(self, value):
+        if isinstance(value, str):
+            value = comprimir_xml(value)
+        return super().get_prep_value(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = comprimir_xml(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj) or ''
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return descomprimir_xml(value)
+        return value
+
+    def formfield(self, **kwargs):
+        return models.TextField(null=self.null, blank=self.blank).formfield(**kwargs)
+
+
+def salvar_dicionario(amostras: Iterable[str], tamanho: int = TAMANHO_DICIONARIO):
+    """Treina e grava um novo DicionarioCompressao, que passa a ser o ativo"""
+    amostras = list(amostras)
+    dicionario = _modelo_dicionario().objects.create(
+        dados=treinar_dicionario(amostras, tamanho), amostras=len(amostras)
+    )
+    recarregar_dicionarios()
+    return dicionario
+
+
+def recomprimir(modelo, campo: str, tamanho_lote: int = 500, pausa: float = 0.0, a_partir_de: int = 0):
+    """
+    Regrava com o dicionário ativo os valores em texto ou com outro dicionário
+
+    Percorre a tabela por faixas de pk (retomável com a_partir_de) e dorme
+    `pausa` segundos entre lotes para não disputar o banco com a aplicação.
+
+    Yields:
+        (último pk do lote, linhas regravadas, bytes antes, bytes depois)
+    """
+    ativo = dicionario_ativo()
+    alvo = ativo[0] if ativo else 0
+    ultimo = a_partir_de
+
+    while True:
+        linhas = list(
+            modelo.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', campo)[:tamanho_lote]
+        )
+        if not linhas:
+            return
+
+        regravadas, antes, depois = 0, 0, 0
+        with transaction.atomic():
+            for pk, bruto in linhas:
+                if not bruto or dicionario_do_valor(bruto) == alvo:
+                    continue
+                novo = comprimir_xml(descomprimir_xml(bruto), ativo)
+                modelo.objects.filter(pk=pk).update(**{campo: novo})
+                regravadas += 1
+                antes += len(bruto.encode('utf-8') if isinstance(bruto, str) else bruto)
+                depois += len(novo)
+
+        ultimo = linhas[-1][0]
+        yield ultimo, regravadas, antes, depois
+        if pausa:
+            time.sleep(pausa)
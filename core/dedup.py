@@ -0,0 +1,147 @@
+"""
+Deduplicação por chave de acesso antes do parse
+
+A chave (44 dígitos) é lida do nome do arquivo ou com uma busca por regex no
+início do XML (Id="NFe..."/<chNFe>), sem montar a árvore. IndiceChaves
+responde quais chaves já estão gravadas: com um set (ou filtro de Bloom, em
+tabelas grandes) carregado das tabelas informadas, ou consultando o banco
+diretamente quando não foi aquecido.
+"""
+import hashlib
+import math
+import os
+import re
+from typing import Iterable, Optional, Set
+
+_RE_CHAVE_NOME = re.compile(r'(?<!\d)(\d{44})(?!\d)')
+_RE_CHAVE_XML = re.compile(rb'Id="(?:NFe|CTe)(\d{44})"|<(?:\w+:)?ch(?:NFe|CTe)>(\d{44})<')
+
+# Bytes lidos do início do arquivo quando o nome não traz a chave
+TAMANHO_CABECALHO = 8192
+
+# Acima deste número de chaves o índice usa filtro de Bloom em vez de set
+LIMITE_SET = 1_000_000
+
+# Modelo (posições 21-22 da chave) -> tipo do documento
+TIPO_POR_MODELO = {'55': 'NFe', '65': 'NFe', '57': 'CTe', '67': 'CTe'}
+
+
+def chave_do_xml(conteudo) -> Optional[str]:
+    """Chave de acesso do XML (bytes ou str) sem parse"""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode('utf-8')
+    m = _RE_CHAVE_XML.search(conteudo)
+    if not m:
+        return None
+    return (m.group(1) or m.group(2)).decode()
+
+
+def chave_do_arquivo(caminho: str) -> Optional[str]:
+    """Chave de acesso pelo nome do arquivo ou, se ausente, pelo início do conteúdo"""
+    m = _RE_CHAVE_NOME.search(os.path.basename(caminho))
+    if m:
+        return m.group(1)
+    try:
+        with open(caminho, 'rb') as f:
+            return chave_do_xml(f.read(TAMANHO_CABECALHO))
+    except OSError:
+        return None
+
+
+def tipo_da_chave(chave: str) -> Optional[str]:
+    """'NFe' ou 'CTe' pelo modelo da chave"""
+    return TIPO_POR_MODELO.get(chave[20:22])
+
+
+class FiltroBloom:
+    """Filtro de Bloom sobre bytearray (falsos positivos, nunca falsos negativos)"""
+
+    def __init__(self, capacidade: int, taxa_erro: float = 0.001):
+        capacidade = max(1, capacidade)
+        self.bits = max(64, int(-capacidade * math.log(taxa_erro) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacidade * math.log(2)))
+        self._dados = bytearray((self.bits + 7) // 8)
+
+    def _posicoes(self, chave: str):
+        # Hash duplo: h1 + i*h2 a partir de um único blake2b
+        digest = hashlib.blake2b(chave.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def adicionar(self, chave: str):
+        for p in self._posicoes(chave):
+            self._dados[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, chave: str) -> bool:
+        return all(self._dados[p >> 3] & (1 << (p & 7)) for p in self._posicoes(chave))
+
+
+class IndiceChaves:
+    """Chaves de acesso já gravadas nos modelos informados (NFe, CTe, DocumentoConsultado)"""
+
+    def __init__(
+        self, modelos: Iterable, bloom: Optional[bool] = None, taxa_erro: float = 0.001, filtros: dict = None
+    ):
+        """
+        Args:
+            modelos: Modelos com campo chave_acesso
+            bloom: Usa filtro de Bloom (None = automático acima de LIMITE_SET chaves)
+            taxa_erro: Falsos positivos do Bloom (confirmados no banco)
+            filtros: Lookups que as linhas precisam atender para contar (ex.: {'xml_baixado': True})
+        """
+        self.modelos = list(modelos)
+        self.bloom = bloom
+        self.taxa_erro = taxa_erro
+        self.filtros = filtros or {}
+        self._conhecidas = None
+        self._novas = set()
+
+    def _linhas(self, modelo):
+        return modelo.objects.filter(**self.filtros)
+
+    @property
+    def aquecido(self) -> bool:
+        return self._conhecidas is not None
+
+    def aquecer(self) -> int:
+        """Carrega as chaves das tabelas; retorna quantas"""
+        total = sum(self._linhas(modelo).count() for modelo in self.modelos)
+        bloom = self.bloom if self.bloom is not None else total > LIMITE_SET
+        if bloom:
+            # Folga para as chaves adicionadas durante a execução
+            self._conhecidas = FiltroBloom(int(total * 1.2) + 10_000, self.taxa_erro)
+            adicionar = self._conhecidas.adicionar
+        else:
+            self._conhecidas = set()
+            adicionar = self._conhecidas.add
+
+        for modelo in self.modelos:
+            for chave in self._linhas(modelo).values_list('chave_acesso', flat=True).iterator(chunk_size=10_000):
+                adicionar(chave)
+        return total
+
+    def adicionar(self, chave: str):
+        """Registra uma chave vista nesta execução (ainda não gravada)"""
+        self._novas.add(chave)
+
+    def existentes(self, chaves: Iterable[str]) -> Set[str]:
+        """Subconjunto das chaves que já existem"""
+        chaves = set(chaves)
+        encontradas = chaves & self._novas
+        restantes = chaves - encontradas
+
+        if isinstance(self._conhecidas, set):
+            return encontradas | (restantes & self._conhecidas)
+        if self._conhecidas is not None:
+            # Bloom: só os candidatos positivos vão ao banco
+            restantes = {c for c in restantes if c in self._conhecidas}
+        if restantes:
+            for modelo in self.modelos:
+                encontradas.update(
+                    self._linhas(modelo).filter(chave_acesso__in=restantes).values_list('chave_acesso', flat=True)
+                )
+        return encontradas
+
+    def __contains__(self, chave: str) -> bool:
+        return bool(self.existentes([chave]))
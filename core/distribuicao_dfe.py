@@ -0,0 +1,231 @@
+"""
+Decodificação dos lotes da distribuição DF-e (nfeDistDFeInteresse)
+
+Cada docZip vem em base64 de um XML compactado em gzip. Os documentos do lote
+são localizados direto nos bytes da resposta e decodificados/descompactados
+em paralelo sobre fatias memoryview (sem copiar o base64); o XML resultante
+é classificado pelo schema e parseado no registro correspondente.
+"""
+import base64
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from .dedup import chave_do_xml
+from .xml_parser import parse_nfe_xml, parse_res_nfe_xml, parse_evento_nfe_xml
+
+# <docZip NSU="000000000000123" schema="resNFe_v1.01.xsd">H4sIA...</docZip>
+_RE_DOCZIP = re.compile(rb'<(?:\w+:)?docZip\b([^>]*)>([^<]*)</(?:\w+:)?docZip>')
+_RE_NSU = re.compile(rb'NSU="(\d+)"')
+_RE_SCHEMA = re.compile(rb'schema="([^"]+)"')
+_RE_CABECALHO = {
+    campo: re.compile(rb'<(?:\w+:)?' + campo.encode() + rb'>([^<]*)</')
+    for campo in ('cStat', 'xMotivo', 'ultNSU', 'maxNSU')
+}
+
+# cStat do retDistDFeInt
+CSTAT_NENHUM_DOCUMENTO = '137'
+CSTAT_DOCUMENTOS_LOCALIZADOS = '138'
+
+# Prefixo do schema -> tipo do documento
+TIPOS_SCHEMA = ('resNFe', 'procNFe', 'procEventoNFe', 'resEvento')
+
+# Eventos repetem a chave da NFe: nunca são descartados como duplicados
+TIPOS_EVENTO = ('procEventoNFe', 'resEvento')
+
+_PARSERS = {
+    'resNFe': parse_res_nfe_xml,
+    'procNFe': parse_nfe_xml,
+    'procEventoNFe': parse_evento_nfe_xml,
+    'resEvento': parse_evento_nfe_xml,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_decodificacao() -> Executor:
+    """Pool de threads compartilhado pelo processo (zlib libera o GIL)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix='doczip')
+    return _pool
+
+
+class DocumentoDFe:
+    """Documento decodificado de um lote de distribuição"""
+
+    __slots__ = ('nsu', 'schema', 'tipo', 'xml', 'registro', 'erro', 'chave', 'duplicado')
+
+    def __init__(self, nsu, schema, tipo=None, xml=None, registro=None, erro=None, chave=None, duplicado=False):
+        self.nsu = nsu
+        self.schema = schema
+        self.tipo = tipo
+        self.xml = xml
+        self.registro = registro
+        self.erro = erro
+        self.chave = chave
+        self.duplicado = duplicado
+
+    def __repr__(self):
+        return f"<DocumentoDFe NSU={self.nsu} {self.tipo or self.schema}>"
+
+
+def tipo_do_schema(schema: str) -> Optional[str]:
+    """'procNFe_v4.00.xsd' -> 'procNFe'"""
+    prefixo = schema.split('_', 1)[0]
+    return prefixo if prefixo in TIPOS_SCHEMA else None
+
+
+def descompactar_doczip(conteudo) -> bytes:
+    """Decodifica base64 e descompacta gzip (aceita bytes ou memoryview)"""
+    compactado = base64.b64decode(conteudo)
+    # wbits=47 aceita gzip ou zlib, detectando pelo cabeçalho
+    return zlib.decompress(compactado, wbits=47)
+
+
+def _decodificar(nsu: str, schema: str, conteudo) -> DocumentoDFe:
+    tipo = tipo_do_schema(schema)
+    try:
+        xml = descompactar_doczip(conteudo)
+        registro = _PARSERS[tipo](xml) if tipo else None
+        return DocumentoDFe(nsu, schema, tipo, xml.decode('utf-8'), registro)
+    except Exception as e:
+        return DocumentoDFe(nsu, schema, tipo, erro=str(e))
+
+
+def _descompactar(nsu: str, schema: str, conteudo) -> DocumentoDFe:
+    """Só descompacta e lê a chave (o parse fica para depois da deduplicação)"""
+    tipo = tipo_do_schema(schema)
+    try:
+        xml = descompactar_doczip(conteudo)
+        return DocumentoDFe(nsu, schema, tipo, xml, chave=chave_do_xml(xml))
+    except Exception as e:
+        return DocumentoDFe(nsu, schema, tipo, erro=str(e))
+
+
+def _parsear(doc: DocumentoDFe) -> DocumentoDFe:
+    try:
+        doc.registro = _PARSERS[doc.tipo](doc.xml) if doc.tipo else None
+        doc.xml = doc.xml.decode('utf-8')
+    except Exception as e:
+        doc.xml, doc.erro = None, str(e)
+    return doc
+
+
+def iter_doczips(resposta: bytes) -> Iterator[tuple]:
+    """Localiza (nsu, schema, memoryview do base64) de cada docZip da resposta"""
+    buffer = memoryview(resposta)
+    for m in _RE_DOCZIP.finditer(resposta):
+        atributos = m.group(1)
+        nsu = _RE_NSU.search(atributos)
+        schema = _RE_SCHEMA.search(atributos)
+        yield (
+            nsu.group(1).decode() if nsu else '',
+            schema.group(1).decode() if schema else '',
+            buffer[m.start(2):m.end(2)],
+        )
+
+
+def decodificar_lote(
+    resposta, executor: Optional[Executor] = None, ignorar=None, ignorar_completos=None
+) -> Iterator[DocumentoDFe]:
+    """
+    Decodifica todos os docZip de uma resposta em paralelo
+
+    Os documentos são entregues em ordem de NSU conforme ficam prontos, então
+    o consumidor pode gravar o início do lote enquanto o resto é processado.
+
+    Args:
+        resposta: Corpo da resposta SOAP (bytes ou str)
+        executor: Pool a usar (padrão: pool_decodificacao()). Com ProcessPoolExecutor
+            o parse também sai do GIL, ao custo de copiar cada base64 para o processo
+        ignorar: IndiceChaves (ou objeto com existentes(chaves)); documentos cuja
+            chave já existe voltam com duplicado=True, sem parse
+        ignorar_completos: Índice das chaves que já têm o XML completo. Com ele, um
+            procNFe só é descartado se a chave estiver aqui (o que chega depois do
+            resNFe da mesma chave é parseado para completar o registro)
+
+    Yields:
+        DocumentoDFe com tipo 'resNFe', 'procNFe', 'procEventoNFe' ou 'resEvento'
+    """
+    if isinstance(resposta, str):
+        resposta = resposta.encode('utf-8')
+
+    executor = executor or pool_decodificacao()
+    copiar = isinstance(executor, ProcessPoolExecutor)
+    if ignorar is None:
+        futuros = [
+            executor.submit(_decodificar, nsu, schema, bytes(conteudo) if copiar else conteudo)
+            for nsu, schema, conteudo in iter_doczips(resposta)
+        ]
+        for futuro in futuros:
+            yield futuro.result()
+        return
+
+    # Descompacta tudo, consulta as chaves do lote de uma vez e parseia só as novas
+    docs = [
+        executor.submit(_descompactar, nsu, schema, bytes(conteudo) if copiar else conteudo)
+        for nsu, schema, conteudo in iter_doczips(resposta)
+    ]
+    docs = [futuro.result() for futuro in docs]
+    chaves = [doc.chave for doc in docs if doc.chave and doc.tipo not in TIPOS_EVENTO]
+    if ignorar_completos is None:
+        existentes = completos = ignorar.existentes(chaves)
+    else:
+        completos = ignorar_completos.existentes(doc.chave for doc in docs if doc.chave and doc.tipo == 'procNFe')
+        existentes = ignorar.existentes(doc.chave for doc in docs if doc.chave and doc.tipo == 'resNFe')
+    futuros = []
+    for doc in docs:
+        if doc.chave in (completos if doc.tipo == 'procNFe' else existentes) and doc.tipo not in TIPOS_EVENTO:
+            doc.xml, doc.duplicado = None, True
+            futuros.append(doc)
+        elif doc.erro:
+            futuros.append(doc)
+        else:
+            futuros.append(executor.submit(_parsear, doc))
+    for futuro in futuros:
+        yield futuro if isinstance(futuro, DocumentoDFe) else futuro.result()
+
+
+@dataclass
+class RetornoDistribuicao:
+    """Cabeçalho do retDistDFeInt e documentos do lote"""
+
+    cstat: str
+    motivo: str
+    ult_nsu: str
+    max_nsu: str
+    documentos: Iterator[DocumentoDFe] = field(default_factory=lambda: iter(()))
+
+    @property
+    def sincronizado(self) -> bool:
+        """True quando não há mais documentos após ult_nsu"""
+        return self.cstat == CSTAT_NENHUM_DOCUMENTO or int(self.ult_nsu or 0) >= int(self.max_nsu or 0)
+
+
+def ler_retorno_distribuicao(
+    resposta, executor: Optional[Executor] = None, ignorar=None, ignorar_completos=None
+) -> RetornoDistribuicao:
+    """Lê cStat/ultNSU/maxNSU da resposta e inicia a decodificação do lote"""
+    if isinstance(resposta, str):
+        resposta = resposta.encode('utf-8')
+
+    cabecalho = {}
+    for campo, regex in _RE_CABECALHO.items():
+        m = regex.search(resposta)
+        cabecalho[campo] = m.group(1).decode('utf-8') if m else ''
+
+    return RetornoDistribuicao(
+        cstat=cabecalho['cStat'],
+        motivo=cabecalho['xMotivo'],
+        ult_nsu=cabecalho['ultNSU'],
+        max_nsu=cabecalho['maxNSU'],
+        documentos=decodificar_lote(resposta, executor, ignorar, ignorar_completos),
+    )
@@ -0,0 +1,150 @@
+"""
+Download em massa dos XMLs completos dos documentos consultados
+
+As chaves são baixadas num pool de threads de tamanho fixo pela distribuição
+DF-e (consChNFe), com o serviço (sessão mTLS) e o CNPJ do certificado da
+consulta. Só um nfeProc autorizado da própria chave conta como baixado; o
+resto (resumo, rejeição, erro) fica com xml_baixado=False para nova tentativa.
+Os XMLs recebidos são gravados em lotes com bulk_update.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterable, List, Union
+
+from django.db.models import F, QuerySet
+
+from .models_certificado import CertificadoDigital, DocumentoConsultado
+from .sefaz_service import nfe_autorizada, obter_servico, uf_da_chave
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResultadoDownload:
+    """Totalizadores de um download em massa"""
+
+    total: int = 0
+    baixados: int = 0
+    falhas: List[str] = field(default_factory=list)
+    duracao: float = 0.0
+
+    @property
+    def downloads_por_segundo(self) -> float:
+        return self.baixados / self.duracao if self.duracao else 0.0
+
+
+class DownloadXML:
+    """Baixa os XMLs completos de DocumentoConsultado com concorrência limitada"""
+
+    def __init__(self, concorrencia: int = 8, tamanho_lote: int = 200, service=None):
+        """
+        Args:
+            concorrencia: Downloads simultâneos
+            tamanho_lote: Documentos gravados por bulk_update
+            service: Serviço a usar para todas as chaves (padrão: o do certificado de cada consulta)
+        """
+        self.concorrencia = concorrencia
+        self.tamanho_lote = tamanho_lote
+        self.service = service
+        self._certificados = {}
+
+    def _servico(self, certificado_id):
+        if self.service is not None:
+            return self.service
+        if certificado_id not in self._certificados:
+            try:
+                servico = obter_servico(CertificadoDigital.objects.get(pk=certificado_id))
+            except Exception as e:
+                # Certificado inválido/vencido: as chaves dele contam como falha
+                logger.error("Certificado %s indisponível: %s", certificado_id, e)
+                servico = None
+            self._certificados[certificado_id] = servico
+        return self._certificados[certificado_id]
+
+    def baixar(self, documentos: Union[QuerySet, Iterable[str]], limite: int = None) -> ResultadoDownload:
+        """
+        Baixa e grava os XMLs
+
+        Args:
+            documentos: QuerySet de DocumentoConsultado ou lista de chaves de acesso
+            limite: Máximo de documentos nesta execução
+        """
+        if not isinstance(documentos, QuerySet):
+            documentos = DocumentoConsultado.objects.filter(chave_acesso__in=list(documentos))
+
+        # Apenas o necessário para baixar: sem xml_completo e sem carregar o certificado
+        documentos = documentos.only('pk', 'chave_acesso').annotate(
+            certificado_id=F('consulta__certificado_id'), cnpj=F('consulta__certificado__cnpj')
+        )
+        if limite:
+            documentos = documentos[:limite]
+
+        resultado = ResultadoDownload()
+        inicio = time.perf_counter()
+        pendentes = []
+
+        with ThreadPoolExecutor(max_workers=self.concorrencia, thread_name_prefix='download-xml') as executor:
+            # Janela de submissões limitada: não materializa o queryset inteiro em futures
+            janela = {}
+            for documento in documentos.iterator(chunk_size=self.tamanho_lote):
+                resultado.total += 1
+                service = self._servico(documento.certificado_id)
+                chave = documento.chave_acesso
+                try:
+                    uf = uf_da_chave(chave)
+                except ValueError:
+                    # Chave com cUF inexistente: consultar outra UF só traria rejeição
+                    uf = None
+                if service is None or uf is None:
+                    resultado.falhas.append(chave)
+                    continue
+                futuro = executor.submit(service.baixar_nfe_distribuicao, chave, documento.cnpj, uf)
+                janela[futuro] = documento
+                if len(janela) >= self.concorrencia * 4:
+                    self._coletar(janela, resultado, pendentes, minimo=self.concorrencia)
+            self._coletar(janela, resultado, pendentes)
+
+        self._gravar(pendentes)
+        resultado.duracao = time.perf_counter() - inicio
+        return resultado
+
+    def _coletar(self, janela, resultado, pendentes, minimo=0):
+        """Recolhe downloads concluídos até restarem `minimo` em andamento"""
+        for futuro in as_completed(list(janela)):
+            documento = janela.pop(futuro)
+            try:
+                xml = futuro.result()
+            except Exception as e:
+                logger.warning("Erro ao baixar %s: %s", documento.chave_acesso, e)
+                xml = None
+
+            if xml and nfe_autorizada(xml, documento.chave_acesso):
+                documento.xml_completo = xml
+                documento.xml_baixado = True
+                pendentes.append(documento)
+                resultado.baixados += 1
+            else:
+                if xml:
+                    logger.warning("Resposta sem nfeProc autorizado para %s", documento.chave_acesso)
+                resultado.falhas.append(documento.chave_acesso)
+
+            if len(pendentes) >= self.tamanho_lote:
+                self._gravar(pendentes)
+            if len(janela) <= minimo:
+                break
+
+    def _gravar(self, pendentes):
+        if pendentes:
+            DocumentoConsultado.objects.bulk_update(pendentes, ['xml_completo', 'xml_baixado'])
+            pendentes.clear()
+
+
+def baixar_xmls(
+    documentos: Union[QuerySet, Iterable[str]] = None, concorrencia: int = 8, **kwargs
+) -> ResultadoDownload:
+    """Atalho: baixa os documentos informados (padrão: todos com xml_baixado=False)"""
+    if documentos is None:
+        documentos = DocumentoConsultado.objects.filter(xml_baixado=False)
+    return DownloadXML(concorrencia=concorrencia, **kwargs).baixar(documentos)
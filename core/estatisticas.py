@@ -0,0 +1,435 @@
+"""
+Estatísticas do dashboard e das análises a partir de tabelas de resumo
+
+Os resumos (por dia, por emitente, por dia e emitente/produto/rota) são
+incrementados pela importação na mesma transação dos documentos, então o
+dashboard e as análises leem linhas de resumo em vez de agregar NFe, NFeItem
+e CTe inteiras. Save/delete individuais (admin, create) atualizam os resumos
+pelos signals, como as versões; bulk_create chama registrar_documentos. O
+dashboard ainda fica no cache do Django até a próxima alteração (ou
+ESTATISTICAS_CACHE segundos, pela virada do período de 30 dias).
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    NFe, NFeItem, CTe,
+    ResumoDiario, ResumoEmitente, ResumoDiarioEmitente, ResumoDiarioProduto, ResumoDiarioRota,
+)
+from .versoes import incrementar_versao
+
+CHAVE_CACHE = 'estatisticas:dashboard'
+
+MODELOS = {'NFe': NFe, 'CTe': CTe}
+
+# Janela de "mês atual" do dashboard
+DIAS_PERIODO = 30
+
+# Campos dos documentos que entram nos resumos
+CAMPOS_RESUMO = {
+    'NFe': ('data_emissao', 'valor_total', 'emit_cnpj', 'emit_nome'),
+    'CTe': (
+        'data_emissao', 'valor_total', 'emit_cnpj', 'emit_nome',
+        'municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim',
+    ),
+}
+
+
+def _dia(data_emissao):
+    if data_emissao is None:
+        return None
+    if timezone.is_aware(data_emissao):
+        data_emissao = timezone.localtime(data_emissao)
+    return data_emissao.date()
+
+
+def _incrementar(modelo, chave: Dict, somas: Dict, extras: Dict):
+    """UPDATE com F() e, se a linha ainda não existe, INSERT (com nova tentativa em corrida)"""
+    incremento = {campo: F(campo) + valor for campo, valor in somas.items()}
+    incremento.update(extras)
+    if modelo.objects.filter(**chave).update(**incremento):
+        return
+    try:
+        with transaction.atomic():
+            modelo.objects.create(**chave, **somas, **extras)
+    except IntegrityError:
+        modelo.objects.filter(**chave).update(**incremento)
+
+
+def _sql_upsert(conexao, modelo, chaves, somas, extras, linhas: int):
+    """
+    INSERT de várias linhas que, na chave já existente, soma `somas` e troca `extras`
+
+    PostgreSQL/SQLite: ON CONFLICT (chave) DO UPDATE; MySQL: ON DUPLICATE KEY UPDATE.
+    """
+    qn = conexao.ops.quote_name
+    tabela = qn(modelo._meta.db_table)
+    colunas = [qn(modelo._meta.get_field(campo).column) for campo in chaves + somas + extras]
+    valores = ', '.join(['(' + ', '.join(['%s'] * len(colunas)) + ')'] * linhas)
+    sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES {valores}"
+    soma, extra = colunas[len(chaves):len(chaves) + len(somas)], colunas[len(chaves) + len(somas):]
+    if conexao.vendor == 'mysql':
+        atribuicoes = [f'{c} = {c} + VALUES({c})' for c in soma] + [f'{c} = VALUES({c})' for c in extra]
+        return f"{sql} ON DUPLICATE KEY UPDATE {', '.join(atribuicoes)}"
+    atribuicoes = [f'{c} = {tabela}.{c} + excluded.{c}' for c in soma] + [f'{c} = excluded.{c}' for c in extra]
+    return f"{sql} ON CONFLICT ({', '.join(colunas[:len(chaves)])}) DO UPDATE SET {', '.join(atribuicoes)}"
+
+
+def _gravar_modelo(modelo, linhas: List):
+    """
+    Soma as linhas (chave, somas, extras) ao resumo com um INSERT ... ON CONFLICT por lote
+
+    Linhas com NULL na chave (documento sem data) não disparam o conflito da
+    restrição única, então vão pelo UPDATE/INSERT de _incrementar.
+    """
+    conexao = connections[router.db_for_write(modelo)]
+    if not conexao.features.supports_update_conflicts:
+        for chave, somas, extras in linhas:
+            _incrementar(modelo, chave, somas, extras)
+        return
+
+    com_nulo = [linha for linha in linhas if None in linha[0].values()]
+    for chave, somas, extras in com_nulo:
+        _incrementar(modelo, chave, somas, extras)
+    linhas = [linha for linha in linhas if None not in linha[0].values()]
+    if not linhas:
+        return
+
+    chave, somas, extras = (list(parte) for parte in linhas[0])
+    campos = [modelo._meta.get_field(nome) for nome in chave + somas + extras]
+    lote = conexao.ops.bulk_batch_size(campos, linhas) or len(linhas)
+    with conexao.cursor() as cursor:
+        for inicio in range(0, len(linhas), lote):
+            parte = linhas[inicio:inicio + lote]
+            parametros = []
+            for linha_chave, linha_somas, linha_extras in parte:
+                valores = [linha_chave[c] for c in chave] + [linha_somas[c] for c in somas]
+                valores += [linha_extras[c] for c in extras]
+                parametros += [campo.get_db_prep_save(valor, conexao) for campo, valor in zip(campos, valores)]
+            cursor.execute(_sql_upsert(conexao, modelo, chave, somas, extras, len(parte)), parametros)
+
+
+class _Incrementos:
+    """Acumula os incrementos por linha de resumo e grava cada resumo em uma instrução"""
+
+    def __init__(self):
+        self._linhas = {}
+
+    def somar(self, modelo, chave: Dict, extras: Dict = None, **somas):
+        linha_somas, linha_extras = self._linhas.setdefault((modelo, tuple(chave.items())), ({}, {}))
+        for campo, valor in somas.items():
+            linha_somas[campo] = linha_somas.get(campo, 0) + valor
+        linha_extras.update(extras or {})
+
+    def __bool__(self):
+        return bool(self._linhas)
+
+    def gravar(self):
+        # Subtrações não trocam os extras (nome): cada instrução leva as mesmas colunas
+        por_modelo = {}
+        for (modelo, chave), (somas, extras) in self._linhas.items():
+            por_modelo.setdefault((modelo, tuple(extras)), []).append((dict(chave), somas, extras))
+        for (modelo, _), linhas in por_modelo.items():
+            _gravar_modelo(modelo, linhas)
+
+    def remover_vazias(self):
+        """Apaga as linhas que ficaram sem documentos depois de uma subtração"""
+        for (modelo, chave), (somas, _) in self._linhas.items():
+            contador = 'itens' if 'itens' in somas else 'quantidade'
+            if somas[contador] < 0:
+                modelo.objects.filter(**dict(chave), **{f'{contador}__lte': 0}).delete()
+
+
+def _rota(cte, dia) -> Dict:
+    return {
+        'dia': dia,
+        'municipio_inicio': cte.municipio_inicio or '',
+        'uf_inicio': cte.uf_inicio or '',
+        'municipio_fim': cte.municipio_fim or '',
+        'uf_fim': cte.uf_fim or '',
+    }
+
+
+def _somar_documento(incrementos: _Incrementos, tipo: str, doc, sinal: int = 1):
+    """Soma (ou subtrai, sinal=-1) o documento aos resumos; retorna o dia usado"""
+    valor = (doc.valor_total or Decimal(0)) * sinal
+    dia = _dia(doc.data_emissao)
+    cnpj = doc.emit_cnpj or ''
+    nome = {'emit_nome': doc.emit_nome} if sinal > 0 else None
+
+    incrementos.somar(ResumoDiario, {'tipo': tipo, 'dia': dia}, quantidade=sinal, valor_total=valor)
+    incrementos.somar(ResumoEmitente, {'tipo': tipo, 'emit_cnpj': cnpj}, nome, quantidade=sinal, valor_total=valor)
+    incrementos.somar(
+        ResumoDiarioEmitente, {'tipo': tipo, 'dia': dia, 'emit_cnpj': cnpj}, nome,
+        quantidade=sinal, valor_total=valor,
+    )
+    if tipo == 'CTe':
+        incrementos.somar(ResumoDiarioRota, _rota(doc, dia), quantidade=sinal, valor_total=valor)
+    return dia
+
+
+def _somar_itens(incrementos: _Incrementos, itens: Iterable, dias: Dict, sinal: int = 1):
+    for item in itens:
+        incrementos.somar(
+            ResumoDiarioProduto,
+            {'dia': dias.get(item.nfe_id), 'codigo_produto': item.codigo_produto or ''},
+            {'descricao': item.descricao} if sinal > 0 else None,
+            itens=sinal,
+            quantidade=(item.quantidade or Decimal(0)) * sinal,
+            valor_total=(item.valor_total or Decimal(0)) * sinal,
+        )
+
+
+def registrar_itens(nfe, itens: Iterable):
+    """
+    Soma um lote de itens já gravados da NFe ao resumo por produto
+
+    Para itens gravados com bulk_create de uma NFe criada com save() (a NFe
+    em si entra nos resumos pelo signal). Na importação em streaming roda a
+    cada lote, sem guardar os itens até o fim. Deve rodar na transação que
+    gravou os itens.
+    """
+    incrementos = _Incrementos()
+    _somar_itens(incrementos, itens, {nfe.pk: _dia(nfe.data_emissao)})
+    if incrementos:
+        incrementos.gravar()
+
+
+def registrar_documentos(tipo: str, documentos: Iterable, itens: Iterable = ()):
+    """
+    Soma documentos recém-gravados com bulk_create aos resumos
+
+    Deve ser chamado na transação que gravou os documentos (tipo 'NFe' ou 'CTe';
+    os objetos precisam de data_emissao, valor_total e emitente, e os CTe da rota).
+    `itens` são os NFeItem gravados desses documentos, para o resumo por produto.
+    Também incrementa a versão do tipo (ETags da API).
+    """
+    incrementos = _Incrementos()
+    dias = {}
+    for doc in documentos:
+        dias[doc.pk] = _somar_documento(incrementos, tipo, doc)
+
+    _somar_itens(incrementos, itens, dias)
+
+    if not incrementos:
+        return
+    with transaction.atomic():
+        incrementos.gravar()
+        incrementar_versao(tipo)
+        transaction.on_commit(invalidar_dashboard)
+
+
+def _gravar_alteracao(incrementos: _Incrementos):
+    with transaction.atomic():
+        incrementos.gravar()
+        incrementos.remover_vazias()
+        transaction.on_commit(invalidar_dashboard)
+
+
+def guardar_anterior_por_signal(sender, instance, raw=False, update_fields=None, **kwargs):
+    """pre_save de NFe/CTe: guarda os valores gravados para o post_save subtrair dos resumos"""
+    campos = CAMPOS_RESUMO[sender.__name__]
+    if raw or instance._state.adding or (update_fields is not None and not set(update_fields) & set(campos)):
+        return
+    instance._resumo_anterior = sender.objects.filter(pk=instance.pk).only(*campos).first()
+
+
+def atualizar_por_signal(sender, instance, created, raw=False, **kwargs):
+    """post_save de NFe/CTe: soma o documento novo ou troca os valores antigos pelos novos"""
+    anterior = instance.__dict__.pop('_resumo_anterior', None)
+    if raw or not (created or anterior):
+        return
+    tipo = sender.__name__
+    incrementos = _Incrementos()
+    dia = _somar_documento(incrementos, tipo, instance)
+    if anterior is not None:
+        dia_anterior = _somar_documento(incrementos, tipo, anterior, -1)
+        if tipo == 'NFe' and dia != dia_anterior:
+            itens = list(NFeItem.objects.filter(nfe_id=instance.pk))
+            _somar_itens(incrementos, itens, {instance.pk: dia_anterior}, -1)
+            _somar_itens(incrementos, itens, {instance.pk: dia})
+    _gravar_alteracao(incrementos)
+
+
+def remover_por_signal(sender, instance, **kwargs):
+    """pre_delete de NFe/CTe: subtrai o documento e seus itens (ainda gravados) dos resumos"""
+    tipo = sender.__name__
+    incrementos = _Incrementos()
+    dia = _somar_documento(incrementos, tipo, instance, -1)
+    if tipo == 'NFe':
+        _somar_itens(incrementos, NFeItem.objects.filter(nfe_id=instance.pk), {instance.pk: dia}, -1)
+    _gravar_alteracao(incrementos)
+
+
+def _soma(campo):
+    return Coalesce(Sum(campo), Value(Decimal(0)))
+
+
+def _texto(campo):
+    return Coalesce(campo, Value(''))
+
+
+def _agrupar(resumo, queryset, chaves: Dict, agregados: Dict, **fixos) -> List[Dict]:
+    """Recria linhas de `resumo` agrupando o queryset (campo do resumo -> expressão)"""
+    # Apelidos evitam conflito entre as anotações e os campos do modelo de origem
+    def apelido(campo):
+        return f'resumo_{campo}'
+
+    linhas = list(
+        queryset.order_by()
+        .annotate(**{apelido(campo): expressao for campo, expressao in chaves.items()})
+        .values(*map(apelido, chaves))
+        .annotate(**{apelido(campo): expressao for campo, expressao in agregados.items()})
+    )
+    campos = list(chaves) + list(agregados)
+    resumo.objects.bulk_create([
+        resumo(**fixos, **{campo: linha[apelido(campo)] for campo in campos}) for linha in linhas
+    ], batch_size=1000)
+    return linhas
+
+
+def reconstruir_resumos(tipos: Iterable[str] = None) -> Dict[str, int]:
+    """
+    Recalcula os resumos a partir de NFe/CTe (carga inicial ou após exclusões)
+
+    Returns:
+        {tipo: documentos contabilizados}
+    """
+    contagens = {}
+    with transaction.atomic():
+        for tipo in tipos or MODELOS:
+            modelo = MODELOS[tipo]
+            documentos = modelo.objects.all()
+            dia = TruncDate('data_emissao')
+            totais = {'quantidade': Count('id'), 'valor_total': _soma('valor_total')}
+
+            for resumo in (ResumoDiario, ResumoEmitente, ResumoDiarioEmitente):
+                resumo.objects.filter(tipo=tipo).delete()
+            dias = _agrupar(ResumoDiario, documentos, {'dia': dia}, totais, tipo=tipo)
+            emitente = {'emit_cnpj': _texto('emit_cnpj')}
+            com_nome = {**totais, 'emit_nome': Max('emit_nome')}
+            _agrupar(ResumoEmitente, documentos, emitente, com_nome, tipo=tipo)
+            _agrupar(ResumoDiarioEmitente, documentos, {'dia': dia, **emitente}, com_nome, tipo=tipo)
+
+            if modelo is NFe:
+                ResumoDiarioProduto.objects.all().delete()
+                _agrupar(
+                    ResumoDiarioProduto,
+                    NFeItem.objects.all(),
+                    {'dia': TruncDate('nfe__data_emissao'), 'codigo_produto': _texto('codigo_produto')},
+                    {'descricao': Max('descricao'), 'itens': Count('id'),
+                     'quantidade': _soma('quantidade'), 'valor_total': _soma('valor_total')},
+                )
+            else:
+                ResumoDiarioRota.objects.all().delete()
+                rota = {campo: _texto(campo) for campo in ('municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim')}
+                _agrupar(ResumoDiarioRota, documentos, {'dia': dia, **rota}, totais)
+
+            contagens[tipo] = sum(linha['resumo_quantidade'] for linha in dias)
+            incrementar_versao(tipo)
+        transaction.on_commit(invalidar_dashboard)
+    return contagens
+
+
+def invalidar_dashboard():
+    cache.delete(CHAVE_CACHE)
+
+
+def _calcular_dashboard() -> Dict:
+    inicio = timezone.localdate() - timedelta(days=DIAS_PERIODO)
+    no_periodo = Q(dia__gte=inicio)
+
+    # Agregação condicional: total e período em uma passada pelos resumos
+    stats = {tipo: {'total': 0, 'mes_atual': 0, 'valor_total': 0, 'valor_mes': 0} for tipo in MODELOS}
+    for linha in ResumoDiario.objects.values('tipo').annotate(
+        soma_quantidade=Sum('quantidade'),
+        soma_quantidade_mes=Sum('quantidade', filter=no_periodo),
+        soma_valor=Sum('valor_total'),
+        soma_valor_mes=Sum('valor_total', filter=no_periodo),
+    ):
+        if linha['tipo'] in stats:
+            stats[linha['tipo']] = {
+                'total': linha['soma_quantidade'] or 0,
+                'mes_atual': linha['soma_quantidade_mes'] or 0,
+                'valor_total': linha['soma_valor'] or 0,
+                'valor_mes': linha['soma_valor_mes'] or 0,
+            }
+
+    top_emitentes = list(
+        ResumoEmitente.objects.filter(tipo='NFe').order_by('-quantidade')
+        .values('emit_cnpj', 'emit_nome', total=F('quantidade'), valor=F('valor_total'))[:5]
+    )
+    return {'nfe_stats': stats['NFe'], 'cte_stats': stats['CTe'], 'top_emitentes': top_emitentes}
+
+
+def resumo_dashboard() -> Dict:
+    """
+    Estatísticas do dashboard (em cache até a próxima importação)
+
+    Returns:
+        {'nfe_stats': {...}, 'cte_stats': {...}, 'top_emitentes': [...]}, com
+        total, mes_atual, valor_total e valor_mes por tipo
+    """
+    resumo = cache.get(CHAVE_CACHE)
+    if resumo is None:
+        resumo = _calcular_dashboard()
+        cache.set(CHAVE_CACHE, resumo, getattr(settings, 'ESTATISTICAS_CACHE', 300))
+    return resumo
+
+
+def resumo_analiticos(dias: Optional[int] = None, limite: int = 10) -> Dict:
+    """
+    Top emitentes, produtos e rotas e NFe por mês a partir dos resumos diários
+
+    Args:
+        dias: Considera só os últimos N dias (None = todo o período)
+        limite: Linhas de cada ranking
+    """
+    periodo = Q(dia__gte=timezone.localdate() - timedelta(days=dias)) if dias else Q()
+
+    top_emitentes = [
+        {'emit_cnpj': linha['emit_cnpj'], 'emit_nome': linha['nome'], 'total': linha['total'], 'valor': linha['valor']}
+        for linha in ResumoDiarioEmitente.objects.filter(periodo, tipo='NFe')
+        .values('emit_cnpj')
+        .annotate(nome=Max('emit_nome'), total=Sum('quantidade'), valor=Sum('valor_total'))
+        .order_by('-total')[:limite]
+    ]
+
+    top_produtos = [
+        {'codigo_produto': linha['codigo_produto'], 'descricao': linha['nome'],
+         'qtd_total': linha['qtd_total'], 'valor_total': linha['valor']}
+        for linha in ResumoDiarioProduto.objects.filter(periodo)
+        .values('codigo_produto')
+        .annotate(nome=Max('descricao'), qtd_total=Sum('quantidade'), valor=Sum('valor_total'))
+        .order_by('-qtd_total')[:limite]
+    ]
+
+    top_rotas = list(
+        ResumoDiarioRota.objects.filter(periodo)
+        .values('municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim')
+        .annotate(total=Sum('quantidade'), valor=Sum('valor_total'))
+        .order_by('-total')[:limite]
+    )
+
+    vendas_por_mes = list(
+        ResumoDiario.objects.filter(periodo, tipo='NFe')
+        .annotate(mes=TruncMonth('dia'))
+        .values('mes')
+        .annotate(total=Sum('quantidade'), valor=Sum('valor_total'))
+        .order_by('-mes')[:12]
+    )
+
+    return {
+        'top_emitentes': top_emitentes,
+        'top_produtos': top_produtos,
+        'top_rotas': top_rotas,
+        'vendas_por_mes': vendas_por_mes,
+    }
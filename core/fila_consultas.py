@@ -0,0 +1,265 @@
+"""
+Fila de ConsultaSEFAZ processada fora das requisições web
+
+A própria tabela ConsultaSEFAZ é a fila: consultas PENDENTE (ou PROCESSANDO
+com lease vencido, de um worker que caiu) são reservadas com um UPDATE
+condicional que grava worker_id e lease_ate, então dois workers nunca pegam a
+mesma consulta. Só uma consulta por certificado fica em andamento de cada vez
+(todas avançam o mesmo cursor de NSU). O worker renova o lease das consultas
+em andamento a cada ciclo e também cria as consultas automáticas dos
+certificados. Uma consulta que falhou volta para a fila só depois de um
+intervalo crescente (lease_ate da consulta PENDENTE).
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List
+
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models_certificado import CertificadoDigital, ConfiguracaoConsulta, ConsultaSEFAZ
+
+logger = logging.getLogger(__name__)
+
+# Falhas seguidas antes de a consulta ir para ERRO
+MAX_TENTATIVAS = 3
+
+# Espera antes de tentar de novo uma consulta que falhou (dobra a cada tentativa)
+ESPERA_RETENTATIVA = 60
+
+
+def _reservaveis(agora):
+    # PENDENTE com lease_ate no futuro está aguardando a retentativa
+    return (
+        Q(status='PENDENTE', lease_ate__isnull=True) | Q(status='PENDENTE', lease_ate__lt=agora)
+        | Q(status='PROCESSANDO', lease_ate__lt=agora)
+    )
+
+
+def reservar_consultas(worker_id: str, limite: int, lease: int = 300) -> List[ConsultaSEFAZ]:
+    """
+    Reserva até `limite` consultas para o worker
+
+    Args:
+        worker_id: Identificador do worker
+        limite: Máximo de consultas a reservar
+        lease: Segundos de reserva (renovados enquanto a consulta roda)
+    """
+    if limite <= 0:
+        return []
+
+    agora = timezone.now()
+    # Certificados com consulta em andamento (lease válido) esperam ela terminar
+    em_andamento = ConsultaSEFAZ.objects.filter(status='PROCESSANDO', lease_ate__gte=agora).values('certificado_id')
+    candidatas = (
+        ConsultaSEFAZ.objects.filter(_reservaveis(agora))
+        .exclude(certificado_id__in=em_andamento)
+        .order_by('data_consulta')
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        # Linhas travadas por outro worker são puladas em vez de esperar
+        candidatas = candidatas.select_for_update(skip_locked=True)
+
+    reservadas, certificados = [], set()
+    with transaction.atomic():
+        # Sem fatiar em `limite`: a fila tem no máximo algumas consultas por certificado
+        for pk, certificado_id in list(candidatas.values_list('pk', 'certificado_id')):
+            if len(reservadas) >= limite:
+                break
+            if certificado_id in certificados:
+                continue
+            # UPDATE condicional: só um worker vê 1 linha afetada
+            ok = ConsultaSEFAZ.objects.filter(_reservaveis(agora), pk=pk).update(
+                status='PROCESSANDO',
+                worker_id=worker_id,
+                lease_ate=agora + timedelta(seconds=lease),
+                tentativas=F('tentativas') + 1,
+            )
+            if ok:
+                reservadas.append(pk)
+                certificados.add(certificado_id)
+    return list(ConsultaSEFAZ.objects.select_related('certificado').filter(pk__in=reservadas))
+
+
+def renovar_lease(pks, worker_id: str, lease: int = 300) -> int:
+    """Estende o lease das consultas ainda reservadas pelo worker"""
+    return ConsultaSEFAZ.objects.filter(pk__in=pks, worker_id=worker_id, status='PROCESSANDO').update(
+        lease_ate=timezone.now() + timedelta(seconds=lease)
+    )
+
+
+def _timeout_consulta(consulta: ConsultaSEFAZ):
+    """ConfiguracaoConsulta.timeout_consulta do dono do certificado (None = sem configuração, sem prazo)"""
+    return (
+        ConfiguracaoConsulta.objects.filter(usuario_id=consulta.certificado.usuario_id)
+        .values_list('timeout_consulta', flat=True).first()
+    )
+
+
+def processar_consulta(consulta: ConsultaSEFAZ, service=None) -> ConsultaSEFAZ:
+    """
+    Executa a consulta na SEFAZ e grava o status final
+
+    A sincronização respeita o timeout_consulta do usuário: ao vencer o prazo
+    a consulta termina com o que já foi gravado e o cursor de NSU continua de
+    onde parou na próxima.
+    """
+    from .sincronizacao import sincronizar_distribuicao
+
+    try:
+        if consulta.tipo_documento != 'NFE':
+            raise Exception(f"Consulta de {consulta.get_tipo_documento_display()} ainda não suportada")
+
+        resultado = sincronizar_distribuicao(consulta, service=service, timeout=_timeout_consulta(consulta))
+        log = (
+            f"{resultado.lotes} lotes, {resultado.documentos} documentos, "
+            f"{resultado.duplicados} já existentes, NSU {resultado.ult_nsu}/{resultado.max_nsu}"
+        )
+        if int(resultado.ult_nsu or 0) < int(resultado.max_nsu or 0):
+            log += " (interrompida pelo timeout_consulta; continua na próxima consulta)"
+        campos = {'status': 'CONCLUIDA', 'log_detalhado': log}
+    except Exception as e:
+        logger.exception("Erro na consulta SEFAZ %s", consulta.pk)
+        # Falha transitória volta para a fila até MAX_TENTATIVAS, após ESPERA_RETENTATIVA crescente
+        status = 'ERRO' if consulta.tentativas >= MAX_TENTATIVAS else 'PENDENTE'
+        campos = {'status': status, 'mensagem_erro': str(e)}
+
+    campos['lease_ate'] = None
+    if campos['status'] == 'PENDENTE':
+        espera = ESPERA_RETENTATIVA * 2 ** max(consulta.tentativas - 1, 0)
+        campos['lease_ate'] = timezone.now() + timedelta(seconds=espera)
+    else:
+        campos['data_conclusao'] = timezone.now()
+    ConsultaSEFAZ.objects.filter(pk=consulta.pk).update(worker_id='', **campos)
+    consulta.refresh_from_db()
+    return consulta
+
+
+def agendar_consultas_automaticas(agora: datetime = None) -> List[ConsultaSEFAZ]:
+    """
+    Cria consultas PENDENTE para os certificados com consulta automática
+
+    Com ConfiguracaoConsulta.consulta_automatica_ativa e horario_consulta, o
+    certificado é consultado uma vez por dia a partir do horário; caso
+    contrário, a cada intervalo_consulta minutos, contados da última consulta
+    automática criada (mesmo que tenha terminado em ERRO) ou da última
+    sincronização, o que for mais recente. Certificados com consulta pendente
+    ou em andamento não recebem outra.
+    """
+    agora = agora or timezone.now()
+    hoje = timezone.localtime(agora).date()
+
+    certificados = (
+        CertificadoDigital.objects
+        .filter(ativo=True, consulta_automatica=True, validade_inicio__lte=hoje, validade_fim__gte=hoje)
+        .exclude(consultas__status__in=['PENDENTE', 'PROCESSANDO'])
+        .annotate(ultima_automatica=Max('consultas__data_consulta', filter=Q(consultas__automatica=True)))
+    )
+    configuracoes = {
+        c.usuario_id: c
+        for c in ConfiguracaoConsulta.objects.filter(usuario__in=certificados.values('usuario'))
+    }
+
+    novas = []
+    for certificado in certificados:
+        ultima = certificado.ultima_consulta
+        # Tentativas que falharam também contam: sem isso, um certificado com erro seria reagendado a cada ciclo
+        tentativa = max(filter(None, (ultima, certificado.ultima_automatica)), default=None)
+        config = configuracoes.get(certificado.usuario_id)
+
+        if config and config.consulta_automatica_ativa and config.horario_consulta:
+            horario = timezone.make_aware(datetime.combine(hoje, config.horario_consulta))
+            devida = agora >= horario and (tentativa is None or tentativa < horario)
+        else:
+            devida = tentativa is None or agora - tentativa >= timedelta(minutes=certificado.intervalo_consulta)
+
+        if devida:
+            novas.append(ConsultaSEFAZ(
+                certificado=certificado,
+                tipo_documento='NFE',
+                data_inicio=timezone.localtime(ultima).date() if ultima else hoje,
+                data_fim=hoje,
+                status='PENDENTE',
+                automatica=True,
+            ))
+
+    return ConsultaSEFAZ.objects.bulk_create(novas)
+
+
+class SEFAZWorker:
+    """Worker que consome a fila de consultas com várias threads"""
+
+    def __init__(self, worker_id: str = None, concorrencia: int = 4, lease: int = 300, intervalo: float = 5):
+        """
+        Args:
+            worker_id: Identificador gravado nas consultas reservadas (padrão: host:pid)
+            concorrencia: Consultas simultâneas (1 = processa na thread atual)
+            lease: Segundos de reserva de cada consulta
+            intervalo: Segundos entre ciclos quando a fila está vazia
+        """
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.concorrencia = max(1, concorrencia)
+        self.lease = lease
+        self.intervalo = intervalo
+        self.processadas = 0
+        self._em_andamento = {}
+        self._executor = ThreadPoolExecutor(self.concorrencia) if self.concorrencia > 1 else None
+
+    def _executar(self, consulta):
+        try:
+            return processar_consulta(consulta)
+        finally:
+            # Cada thread do pool abre sua própria conexão: fecha ao terminar
+            if self._executor is not None:
+                connection.close()
+
+    def ciclo(self, agendar: bool = True) -> int:
+        """Agenda, renova leases e reserva consultas para as vagas livres; retorna quantas iniciou"""
+        if agendar:
+            agendar_consultas_automaticas()
+
+        for pk, futuro in list(self._em_andamento.items()):
+            if futuro is None or futuro.done():
+                del self._em_andamento[pk]
+                self.processadas += 1
+        renovar_lease(list(self._em_andamento), self.worker_id, self.lease)
+
+        consultas = reservar_consultas(self.worker_id, self.concorrencia - len(self._em_andamento), self.lease)
+        for consulta in consultas:
+            if self._executor is None:
+                self._executar(consulta)
+                self._em_andamento[consulta.pk] = None
+            else:
+                self._em_andamento[consulta.pk] = self._executor.submit(self._executar, consulta)
+        return len(consultas)
+
+    def executar(self, uma_vez: bool = False):
+        """Loop principal; com uma_vez, processa a fila atual e retorna"""
+        primeiro = True
+        try:
+            while True:
+                # Em uma_vez o agendamento roda só no início, para o loop terminar
+                iniciadas = self.ciclo(agendar=primeiro or not uma_vez)
+                primeiro = False
+                if uma_vez and not iniciadas and not self._pendentes():
+                    break
+                if not iniciadas:
+                    time.sleep(self.intervalo)
+        finally:
+            self.encerrar()
+
+    def _pendentes(self) -> bool:
+        return any(f is not None and not f.done() for f in self._em_andamento.values())
+
+    def encerrar(self):
+        """Aguarda as consultas em andamento"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.processadas += len(self._em_andamento)
+        self._em_andamento.clear()
@@ -0,0 +1,362 @@
+"""
+Importação em massa de XMLs fiscais (NFe e CTe)
+Parse em pool de processos e gravação em lotes com bulk_create
+"""
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .buffer_logs import BufferImportLog
+from .compressao import comprimir_arquivo
+from .dedup import IndiceChaves, chave_do_arquivo, tipo_da_chave
+from .estatisticas import registrar_documentos, registrar_itens
+from .models import NFe, NFeItem, NFeXML, CTe, CTeXML, ImportLog
+from .xml_parser import NFeStreaming, detectar_tipo, parse_nfe_xml, parse_cte_xml
+
+
+@dataclass
+class ResultadoImportacao:
+    """Totalizadores de uma execução do importador"""
+
+    arquivos: int = 0
+    importados: int = 0
+    erros: int = 0
+    duplicados: int = 0
+    duracao: float = 0.0
+
+    @property
+    def arquivos_por_segundo(self) -> float:
+        return self.arquivos / self.duracao if self.duracao else 0.0
+
+
+def listar_arquivos_xml(diretorio) -> Iterator[str]:
+    """Percorre o diretório recursivamente retornando os arquivos .xml"""
+    pendentes = [str(diretorio)]
+    while pendentes:
+        atual = pendentes.pop()
+        try:
+            entradas = os.scandir(atual)
+        except FileNotFoundError:
+            continue
+        with entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    pendentes.append(entrada.path)
+                elif entrada.name.lower().endswith('.xml'):
+                    yield entrada.path
+
+
+def _parsear_arquivo(caminho: str) -> Tuple[str, Optional[str], Optional[object], Optional[str], Optional[str]]:
+    """
+    Lê e parseia um arquivo (executado nos processos do pool)
+
+    Returns:
+        (caminho, tipo, registro, xml, erro)
+    """
+    try:
+        with open(caminho, 'rb') as f:
+            conteudo = f.read()
+        xml = conteudo.decode('utf-8')
+        tipo = detectar_tipo(xml)
+        if tipo == 'NFe':
+            return caminho, tipo, parse_nfe_xml(conteudo), xml, None
+        if tipo == 'CTe':
+            return caminho, tipo, parse_cte_xml(conteudo), xml, None
+        return caminho, None, None, None, 'Documento não reconhecido como NFe ou CTe'
+    except Exception as e:
+        return caminho, None, None, None, str(e)
+
+
+def importar_nfe_streaming(fonte, usuario=None, arquivo_nome=None, xml_content=None, tamanho_lote=200) -> NFe:
+    """
+    Importa uma NFe grande com parse incremental, gravando os itens em lotes
+
+    A NFe é criada quando o primeiro lote de itens fica pronto (ide/emit/dest já
+    lidos) e recebe totais e protocolo ao final, tudo na mesma transação.
+
+    Args:
+        fonte: Caminho do arquivo ou objeto file-like
+        xml_content: XML armazenado em NFe.xml_content (padrão: o arquivo, comprimido em blocos)
+    """
+    streaming = NFeStreaming(fonte, tamanho_lote=tamanho_lote)
+
+    with transaction.atomic():
+        nfe = None
+        for lote in streaming.lotes():
+            if nfe is None:
+                nfe = NFe.objects.create(
+                    **streaming.registro.campos(),
+                    arquivo_nome=arquivo_nome,
+                    usuario_importacao=usuario,
+                )
+            # Cada lote entra no resumo por produto ao ser gravado (memória fica O(lote))
+            registrar_itens(nfe, NFeItem.objects.bulk_create([NFeItem(nfe=nfe, **item.campos()) for item in lote]))
+
+        campos = streaming.registro.campos()
+        if xml_content is None and isinstance(fonte, (str, os.PathLike)):
+            # Bytes do arquivo comprimidos em blocos: o XML inteiro nunca vira str em memória
+            xml_content = comprimir_arquivo(fonte)
+
+        # A NFe entra nos resumos pelos signals de save (os itens já entraram por lote)
+        if nfe is None:
+            nfe = NFe.objects.create(
+                **campos, xml_content=xml_content, arquivo_nome=arquivo_nome, usuario_importacao=usuario
+            )
+        else:
+            for campo, valor in campos.items():
+                setattr(nfe, campo, valor)
+            nfe.xml_content = xml_content
+            nfe.save(update_fields=list(campos))
+
+    return nfe
+
+
+class ImportadorXML:
+    """Importa arquivos XML em paralelo gravando em transações grandes"""
+
+    def __init__(
+        self,
+        usuario=None,
+        workers: Optional[int] = None,
+        tamanho_lote: int = 500,
+        chunksize: int = 32,
+        limite_streaming: Optional[int] = None,
+        deduplicar: bool = True,
+        resumir_logs: bool = False,
+    ):
+        """
+        Args:
+            usuario: Usuário registrado como responsável pela importação
+            workers: Processos de parse (0 = parse no próprio processo)
+            tamanho_lote: Documentos gravados por transação
+            chunksize: Arquivos enviados por vez a cada processo
+            limite_streaming: Arquivos maiores que este tamanho (bytes) usam o parse
+                incremental (padrão: settings.XML_STREAMING_LIMITE; 0 desativa)
+            deduplicar: Descarta antes do parse os arquivos cuja chave (nome do arquivo
+                ou Id do XML) já está em NFe/CTe
+            resumir_logs: Grava um ImportLog de resumo por lote para os sucessos
+                (erros continuam um por arquivo)
+        """
+        self.usuario = usuario
+        self.workers = os.cpu_count() if workers is None else workers
+        self.tamanho_lote = tamanho_lote
+        self.chunksize = chunksize
+        if limite_streaming is None:
+            limite_streaming = getattr(settings, 'XML_STREAMING_LIMITE', 0)
+        self.limite_streaming = limite_streaming
+        self.indice = IndiceChaves([NFe, CTe]) if deduplicar else None
+        self.resumir_logs = resumir_logs
+        self.logs = None
+
+    def importar_diretorios(self, diretorios: Iterable) -> ResultadoImportacao:
+        """Importa todos os XMLs encontrados nos diretórios"""
+        caminhos = (c for d in diretorios for c in listar_arquivos_xml(d))
+        return self.importar(caminhos)
+
+    def importar(self, caminhos: Iterable[str]) -> ResultadoImportacao:
+        """Parseia e grava os arquivos informados"""
+        resultado = ResultadoImportacao()
+        inicio = time.perf_counter()
+        lote = []
+        grandes = []
+        duplicados = Counter()
+
+        if self.indice is not None:
+            if not self.indice.aquecido:
+                self.indice.aquecer()
+            caminhos = self._descartar_duplicados(caminhos, duplicados)
+
+        # Logs gravados em lote fora das transações dos documentos; o with garante
+        # a gravação do que já foi importado mesmo se a execução falhar no meio
+        with BufferImportLog(self.tamanho_lote, resumir_sucessos=self.resumir_logs, usuario=self.usuario) as logs:
+            self.logs = logs
+            for item in self._parsear(self._separar_grandes(caminhos, grandes)):
+                lote.append(item)
+                if len(lote) >= self.tamanho_lote:
+                    self._gravar_lote(lote, resultado)
+                    lote = []
+            if lote:
+                self._gravar_lote(lote, resultado)
+
+            # NFes grandes ficam fora do pool para não estourar a memória dos workers
+            for caminho in grandes:
+                self._importar_streaming(caminho, resultado)
+
+            if duplicados:
+                self._registrar_duplicados(duplicados, resultado)
+
+        resultado.duracao = time.perf_counter() - inicio
+        return resultado
+
+    def _descartar_duplicados(self, caminhos: Iterable[str], duplicados: Counter) -> Iterator[str]:
+        """Pula os arquivos com chave já importada (ou repetida nesta execução)"""
+        for caminho in caminhos:
+            chave = chave_do_arquivo(caminho)
+            if chave is None:
+                yield caminho
+            elif chave in self.indice:
+                duplicados[tipo_da_chave(chave) or 'NFe'] += 1
+            else:
+                self.indice.adicionar(chave)
+                yield caminho
+
+    def _registrar_duplicados(self, duplicados: Counter, resultado: ResultadoImportacao):
+        # Um registro por tipo com a contagem, em vez de um por arquivo
+        for tipo, quantidade in duplicados.items():
+            self.logs.registrar(
+                tipo, f"{quantidade} arquivo(s)", 'ignorado',
+                'Chave já importada (descartado antes do parse)', quantidade=quantidade,
+            )
+        total = sum(duplicados.values())
+        resultado.arquivos += total
+        resultado.duplicados += total
+
+    def _separar_grandes(self, caminhos: Iterable[str], grandes: list) -> Iterator[str]:
+        """Desvia para 'grandes' os arquivos acima do limite de streaming"""
+        for caminho in caminhos:
+            if self.limite_streaming and os.path.getsize(caminho) > self.limite_streaming:
+                grandes.append(caminho)
+            else:
+                yield caminho
+
+    def _importar_streaming(self, caminho: str, resultado: ResultadoImportacao):
+        nome = Path(caminho).name
+        resultado.arquivos += 1
+
+        with open(caminho, 'rb') as f:
+            tipo = detectar_tipo(f.read(2048))
+        if tipo != 'NFe':
+            # Só NFe tem itens; demais documentos grandes seguem o parse normal
+            resultado.arquivos -= 1
+            self._gravar_lote([_parsear_arquivo(caminho)], resultado)
+            return
+
+        try:
+            nfe = importar_nfe_streaming(
+                caminho, usuario=self.usuario, arquivo_nome=nome, tamanho_lote=self.tamanho_lote
+            )
+            log = self._log('NFe', nome, 'sucesso', None, nfe.chave_acesso)
+            resultado.importados += 1
+        except IntegrityError:
+            log = self._log('NFe', nome, 'erro', 'Documento já importado')
+            resultado.erros += 1
+        except Exception as e:
+            log = self._log('NFe', nome, 'erro', str(e))
+            resultado.erros += 1
+        self.logs.adicionar([log])
+
+    def _parsear(self, caminhos: Iterable[str]) -> Iterator[tuple]:
+        if not self.workers:
+            for caminho in caminhos:
+                yield _parsear_arquivo(caminho)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(_parsear_arquivo, caminhos, chunksize=self.chunksize)
+
+    def _gravar_lote(self, lote: List[tuple], resultado: ResultadoImportacao):
+        """Grava NFes, itens, CTes e logs do lote em uma única transação"""
+        nfes, ctes, logs = {}, {}, []
+
+        for caminho, tipo, dados, xml, erro in lote:
+            nome = Path(caminho).name
+            resultado.arquivos += 1
+            if erro:
+                logs.append(self._log(tipo or 'NFe', nome, 'erro', erro))
+                continue
+
+            destino = nfes if tipo == 'NFe' else ctes
+            chave = dados.chave_acesso
+            if chave in destino:
+                logs.append(self._log(tipo, nome, 'erro', 'Chave duplicada no lote', chave))
+                continue
+            destino[chave] = (nome, dados, xml)
+
+        with transaction.atomic():
+            self._descartar_existentes(NFe, nfes, 'NFe', logs)
+            self._descartar_existentes(CTe, ctes, 'CTe', logs)
+
+            self._gravar_nfes(nfes, logs)
+            self._gravar_ctes(ctes, logs)
+
+        self.logs.adicionar(logs)
+        resultado.importados += len(nfes) + len(ctes)
+        resultado.erros += sum(1 for log in logs if log.status == 'erro')
+
+    def _descartar_existentes(self, model, documentos: dict, tipo: str, logs: list):
+        if not documentos:
+            return
+        existentes = model.objects.filter(chave_acesso__in=list(documentos)).values_list('chave_acesso', flat=True)
+        for chave in existentes:
+            nome, _, _ = documentos.pop(chave)
+            logs.append(self._log(tipo, nome, 'erro', 'Documento já importado', chave))
+
+    def _gravar_nfes(self, nfes: dict, logs: list):
+        if not nfes:
+            return
+
+        objetos = [
+            NFe(**dados.campos(), xml_content=xml, arquivo_nome=nome, usuario_importacao=self.usuario)
+            for nome, dados, xml in nfes.values()
+        ]
+        NFe.objects.bulk_create(objetos, batch_size=self.tamanho_lote)
+
+        # Bancos sem RETURNING (MySQL) não preenchem o pk no bulk_create
+        if any(obj.pk is None for obj in objetos):
+            ids = dict(NFe.objects.filter(chave_acesso__in=list(nfes)).values_list('chave_acesso', 'id'))
+            for obj in objetos:
+                obj.pk = ids[obj.chave_acesso]
+
+        itens = [
+            NFeItem(nfe_id=obj.pk, **item.campos())
+            for obj in objetos
+            for item in nfes[obj.chave_acesso][1].itens
+        ]
+        NFeItem.objects.bulk_create(itens, batch_size=self.tamanho_lote * 4)
+        self._gravar_xmls(NFeXML, objetos)
+        registrar_documentos('NFe', objetos, itens)
+
+        for chave, (nome, _, _) in nfes.items():
+            logs.append(self._log('NFe', nome, 'sucesso', None, chave))
+
+    def _gravar_ctes(self, ctes: dict, logs: list):
+        if not ctes:
+            return
+
+        objetos = [
+            CTe(**dados.campos(), xml_content=xml, arquivo_nome=nome, usuario_importacao=self.usuario)
+            for nome, dados, xml in ctes.values()
+        ]
+        CTe.objects.bulk_create(objetos, batch_size=self.tamanho_lote)
+
+        if any(obj.pk is None for obj in objetos):
+            ids = dict(CTe.objects.filter(chave_acesso__in=list(ctes)).values_list('chave_acesso', 'id'))
+            for obj in objetos:
+                obj.pk = ids[obj.chave_acesso]
+        self._gravar_xmls(CTeXML, objetos)
+        registrar_documentos('CTe', objetos)
+
+        for chave, (nome, _, _) in ctes.items():
+            logs.append(self._log('CTe', nome, 'sucesso', None, chave))
+
+    def _gravar_xmls(self, modelo, objetos):
+        # bulk_create não passa pelo save(): o XML vai para a tabela separada aqui
+        xmls = [xml for xml in (obj.xml_para_gravar() for obj in objetos) if xml is not None]
+        modelo.objects.bulk_create(xmls, batch_size=self.tamanho_lote)
+
+    def _log(self, tipo, arquivo_nome, status, mensagem=None, chave_acesso=None) -> ImportLog:
+        return ImportLog(
+            tipo_documento=tipo,
+            arquivo_nome=arquivo_nome[:255],
+            status=status,
+            mensagem=mensagem,
+            chave_acesso=chave_acesso,
+            usuario=self.usuario,
+        )
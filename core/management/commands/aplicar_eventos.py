@@ -0,0 +1,48 @@
+"""
+Aplica em massa os eventos de NFe (cancelamentos) encontrados nos diretórios
+
+Uso:
+    python manage.py aplicar_eventos --diretorio /dados/eventos
+    python manage.py aplicar_eventos --diretorio /dados/eventos --lote 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.importacao import listar_arquivos_xml
+from core.models import NFe
+from core.xml_parser import parse_evento_nfe_xml
+
+
+class Command(BaseCommand):
+    help = 'Atualiza status/protocolo/motivo das NFes a partir de XMLs procEventoNFe (upsert em lotes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--diretorio', action='append', dest='diretorios', required=True,
+                            help='Diretório com os XMLs de eventos (pode ser repetido)')
+        parser.add_argument('--lote', type=int, default=2000, help='Eventos por upsert')
+
+    def handle(self, *args, **options):
+        self.arquivos, self.erros = 0, 0
+        inicio = time.perf_counter()
+        resultado = NFe.objects.aplicar_eventos(self._eventos(options['diretorios']), options['lote'])
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.arquivos} arquivos em {duracao:.1f}s - {resultado.atualizados} atualizadas, "
+            f"{resultado.inalterados} sem alteração, {resultado.ausentes} não importadas, {self.erros} erros"
+        ))
+
+    def _eventos(self, diretorios):
+        for diretorio in diretorios:
+            for caminho in listar_arquivos_xml(diretorio):
+                self.arquivos += 1
+                try:
+                    with open(caminho, 'rb') as f:
+                        conteudo = f.read()
+                    if b'procEventoNFe' not in conteudo[:512] and b'resEvento' not in conteudo[:512]:
+                        continue
+                    yield parse_evento_nfe_xml(conteudo)
+                except Exception as e:
+                    self.erros += 1
+                    self.stderr.write(f"{caminho}: {e}")
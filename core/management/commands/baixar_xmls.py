@@ -0,0 +1,44 @@
+"""
+Baixa da SEFAZ os XMLs completos dos documentos consultados
+
+Uso:
+    python manage.py baixar_xmls
+    python manage.py baixar_xmls --consulta 42 --concorrencia 16
+    python manage.py baixar_xmls --chave 3524...0 --chave 3124...5
+"""
+from django.core.management.base import BaseCommand
+
+from core.download_xml import DownloadXML
+from core.models_certificado import DocumentoConsultado
+
+
+class Command(BaseCommand):
+    help = 'Baixa os XMLs completos de documentos com xml_baixado=False'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chave', action='append', dest='chaves', help='Chave de acesso (pode ser repetida)')
+        parser.add_argument('--consulta', type=int, help='Apenas documentos desta ConsultaSEFAZ')
+        parser.add_argument('--certificado', type=int, help='Apenas documentos deste certificado')
+        parser.add_argument('--concorrencia', type=int, default=8, help='Downloads simultâneos')
+        parser.add_argument('--lote', type=int, default=200, help='Documentos gravados por bulk_update')
+        parser.add_argument('--limite', type=int, help='Máximo de documentos nesta execução')
+
+    def handle(self, *args, **options):
+        if options['chaves']:
+            documentos = DocumentoConsultado.objects.filter(chave_acesso__in=options['chaves'])
+        else:
+            documentos = DocumentoConsultado.objects.filter(xml_baixado=False)
+        if options['consulta']:
+            documentos = documentos.filter(consulta_id=options['consulta'])
+        if options['certificado']:
+            documentos = documentos.filter(consulta__certificado_id=options['certificado'])
+
+        download = DownloadXML(concorrencia=options['concorrencia'], tamanho_lote=options['lote'])
+        resultado = download.baixar(documentos.order_by('pk'), limite=options['limite'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.baixados}/{resultado.total} XMLs em {resultado.duracao:.1f}s "
+            f"({resultado.downloads_por_segundo:.1f} downloads/s) - {len(resultado.falhas)} falhas"
+        ))
+        for chave in resultado.falhas[:20]:
+            self.stdout.write(f"  falha: {chave}")
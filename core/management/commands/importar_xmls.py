@@ -0,0 +1,65 @@
+"""
+Importa em massa os XMLs de NFe e CTe dos diretórios configurados
+
+Uso:
+    python manage.py importar_xmls
+    python manage.py importar_xmls --diretorio /dados/NFe --workers 8 --lote 1000
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import ImportadorXML
+
+
+class Command(BaseCommand):
+    help = 'Importa XMLs de NFe/CTe em paralelo a partir de XML_DIRECTORIES'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--diretorio', action='append', dest='diretorios',
+            help='Diretório a importar (pode ser repetido). Padrão: settings.XML_DIRECTORIES'
+        )
+        parser.add_argument('--workers', type=int, default=None, help='Processos de parse (0 = sem pool)')
+        parser.add_argument('--lote', type=int, default=500, help='Documentos gravados por transação')
+        parser.add_argument(
+            '--limite-streaming', type=int, default=None,
+            help='Arquivos acima deste tamanho (bytes) usam parse incremental. Padrão: settings.XML_STREAMING_LIMITE'
+        )
+        parser.add_argument(
+            '--sem-deduplicacao', action='store_true',
+            help='Parseia todos os arquivos, sem descartar antes as chaves já importadas'
+        )
+        parser.add_argument(
+            '--resumir-logs', action='store_true',
+            help='Um ImportLog de resumo por lote para os sucessos, em vez de um por arquivo'
+        )
+        parser.add_argument('--usuario', help='Username registrado como responsável pela importação')
+
+    def handle(self, *args, **options):
+        diretorios = options['diretorios'] or list(settings.XML_DIRECTORIES.values())
+
+        usuario = None
+        if options['usuario']:
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado")
+
+        importador = ImportadorXML(
+            usuario=usuario,
+            workers=options['workers'],
+            tamanho_lote=options['lote'],
+            limite_streaming=options['limite_streaming'],
+            deduplicar=not options['sem_deduplicacao'],
+            resumir_logs=options['resumir_logs'],
+        )
+
+        self.stdout.write(f"Importando de: {', '.join(str(d) for d in diretorios)}")
+        resultado = importador.importar_diretorios(diretorios)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.arquivos} arquivos em {resultado.duracao:.1f}s "
+            f"({resultado.arquivos_por_segundo:.0f} arquivos/s) - "
+            f"{resultado.importados} importados, {resultado.duplicados} já importados, {resultado.erros} erros"
+        ))
@@ -0,0 +1,89 @@
+"""
+Copia o XML da coluna antiga xml_content de NFe/CTe para NFeXML/CTeXML
+
+Bancos criados antes da separação dos XMLs ainda têm a coluna xml_content
+nas tabelas de NFe e CTe, que os models não leem mais. Rode depois do
+migrate --run-syncdb (que cria as tabelas de XML). Valores já comprimidos
+são copiados sem recomprimir e documentos que já têm XML na tabela nova
+ficam como estão, então o comando pode ser interrompido e rodado de novo.
+
+Uso:
+    python manage.py migrar_xmls
+    python manage.py migrar_xmls --modelo nfe --lote 200
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+
+from core.models import NFe, NFeXML, CTe, CTeXML
+
+MODELOS = {
+    'nfe': (NFe, NFeXML),
+    'cte': (CTe, CTeXML),
+}
+
+COLUNA_ANTIGA = 'xml_content'
+
+
+class Command(BaseCommand):
+    help = 'Copia os XMLs da coluna antiga xml_content de NFe/CTe para as tabelas NFeXML/CTeXML (em lotes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modelo', choices=list(MODELOS), action='append',
+                            help='Tabela a migrar (pode ser repetido). Padrão: todas')
+        parser.add_argument('--lote', type=int, default=500, help='Linhas por transação')
+
+    def handle(self, *args, **options):
+        for nome in options['modelo'] or list(MODELOS):
+            documento, modelo_xml = MODELOS[nome]
+            conexao = connections[router.db_for_write(modelo_xml)]
+            with conexao.cursor() as cursor:
+                tabelas = conexao.introspection.table_names(cursor)
+                colunas = [
+                    coluna.name for coluna in
+                    conexao.introspection.get_table_description(cursor, documento._meta.db_table)
+                ]
+            if COLUNA_ANTIGA not in colunas:
+                self.stdout.write(f"{nome}: sem a coluna {COLUNA_ANTIGA}, nada a migrar")
+                continue
+            if modelo_xml._meta.db_table not in tabelas:
+                raise CommandError(
+                    f"Tabela {modelo_xml._meta.db_table} não existe: rode 'python manage.py migrate --run-syncdb'"
+                )
+
+            copiados = 0
+            for ultimo, lote in self._copiar(conexao, documento, modelo_xml, options['lote']):
+                copiados += lote
+                self.stdout.write(f"  {nome}: até pk {ultimo} - {copiados} copiados", ending='\r')
+            self.stdout.write(self.style.SUCCESS(f"{nome}: {copiados} XMLs copiados para {modelo_xml.__name__}"))
+
+    def _copiar(self, conexao, documento, modelo_xml, tamanho_lote):
+        """Percorre a tabela do documento por faixas de pk; yields (último pk, XMLs copiados)"""
+        qn = conexao.ops.quote_name
+        pk = qn(documento._meta.pk.column)
+        sql = (
+            f"SELECT {pk}, {qn(COLUNA_ANTIGA)} FROM {qn(documento._meta.db_table)} "
+            f"WHERE {pk} > %s AND {qn(COLUNA_ANTIGA)} IS NOT NULL ORDER BY {pk} LIMIT %s"
+        )
+        ultimo = 0
+        while True:
+            with conexao.cursor() as cursor:
+                cursor.execute(sql, [ultimo, tamanho_lote])
+                linhas = cursor.fetchall()
+            if not linhas:
+                return
+
+            existentes = set(
+                modelo_xml.objects.using(conexao.alias)
+                .filter(pk__in=[linha[0] for linha in linhas]).values_list('pk', flat=True)
+            )
+            # bytes (já comprimidos ou texto legado em BLOB) vão como estão; str é comprimido no save
+            novos = [
+                modelo_xml(documento_id=pk_documento, conteudo=bytes(valor) if isinstance(valor, memoryview) else valor)
+                for pk_documento, valor in linhas
+                if pk_documento not in existentes
+            ]
+            with transaction.atomic(using=conexao.alias):
+                modelo_xml.objects.using(conexao.alias).bulk_create(novos, ignore_conflicts=True)
+
+            ultimo = linhas[-1][0]
+            yield ultimo, len(novos)
@@ -0,0 +1,72 @@
+"""
+Treina o dicionário de compressão e recomprime os XMLs já gravados
+
+Uso:
+    python manage.py recomprimir_xmls --treinar 2000
+    python manage.py recomprimir_xmls --modelo nfe --lote 200 --pausa 0.5
+    python manage.py recomprimir_xmls --modelo cte --a-partir-de 150000
+"""
+import itertools
+
+from django.core.management.base import BaseCommand
+
+from core.compressao import descomprimir_xml, recomprimir, salvar_dicionario
+from core.models import NFeXML, CTeXML
+from core.models_certificado import DocumentoConsultado
+
+MODELOS = {
+    'nfe': (NFeXML, 'conteudo'),
+    'cte': (CTeXML, 'conteudo'),
+    'documentos': (DocumentoConsultado, 'xml_completo'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Recomprime NFe/CTe/DocumentoConsultado com o dicionário ativo (em lotes, retomável)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--treinar', type=int, default=0, metavar='N',
+                            help='Treina um novo dicionário com os N XMLs mais recentes antes de recomprimir')
+        parser.add_argument('--modelo', choices=list(MODELOS), action='append',
+                            help='Tabela a recomprimir (pode ser repetido). Padrão: todas')
+        parser.add_argument('--lote', type=int, default=500, help='Linhas por transação')
+        parser.add_argument('--pausa', type=float, default=0.0, help='Segundos de espera entre lotes')
+        parser.add_argument('--a-partir-de', type=int, default=0, help='Retoma a partir deste pk')
+
+    def handle(self, *args, **options):
+        nomes = options['modelo'] or list(MODELOS)
+
+        if options['treinar']:
+            amostras = itertools.islice(self._amostras(nomes, options['treinar']), options['treinar'])
+            dicionario = salvar_dicionario(amostras)
+            self.stdout.write(f"Novo dicionário: {dicionario}")
+
+        for nome in nomes:
+            modelo, campo = MODELOS[nome]
+            total, antes, depois = 0, 0, 0
+            for ultimo, regravadas, bytes_antes, bytes_depois in recomprimir(
+                modelo, campo, options['lote'], options['pausa'], options['a_partir_de']
+            ):
+                total += regravadas
+                antes += bytes_antes
+                depois += bytes_depois
+                self.stdout.write(f"  {nome}: até pk {ultimo} - {total} regravados", ending='\r')
+
+            razao = f" ({antes / depois:.1f}x)" if depois else ''
+            self.stdout.write(self.style.SUCCESS(
+                f"{nome}: {total} regravados, {antes / 1024:.0f} KB -> {depois / 1024:.0f} KB{razao}"
+            ))
+
+    def _amostras(self, nomes, limite):
+        # Mesmo número de amostras de cada tabela, dos documentos mais recentes
+        por_modelo = max(1, limite // len(nomes))
+        for nome in nomes:
+            modelo, campo = MODELOS[nome]
+            brutos = (
+                modelo.objects.exclude(**{f'{campo}__isnull': True})
+                .order_by('-pk').values_list(campo, flat=True)[:por_modelo]
+            )
+            for bruto in brutos:
+                xml = descomprimir_xml(bruto)
+                if xml:
+                    yield xml
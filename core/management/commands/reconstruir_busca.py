@@ -0,0 +1,27 @@
+"""
+Recria os índices de busca de NFe/CTe (FTS5 no SQLite, pg_trgm no PostgreSQL)
+
+Os índices são criados no migrate e mantidos por triggers; use este comando
+após restaurar um backup só das tabelas ou se a FTS ficar inconsistente.
+
+Uso:
+    python manage.py reconstruir_busca
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from core.busca import criar_indices
+
+
+class Command(BaseCommand):
+    help = 'Recria e repovoa os índices de busca de NFe/CTe'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Banco de dados')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        criar_indices(options['database'], reconstruir=True)
+        self.stdout.write(self.style.SUCCESS(f"Índices de busca recriados em {time.perf_counter() - inicio:.1f}s"))
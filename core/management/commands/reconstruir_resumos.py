@@ -0,0 +1,33 @@
+"""
+Recalcula as tabelas de resumo do dashboard e das análises (por dia, emitente,
+produto e rota)
+
+Necessário na primeira instalação e depois de alterações fora do ORM
+(SQL direto, QuerySet.update); importações e save/delete individuais mantêm
+os resumos atualizados.
+
+Uso:
+    python manage.py reconstruir_resumos
+    python manage.py reconstruir_resumos --tipo NFe
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.estatisticas import MODELOS, reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = 'Recalcula os resumos por dia, emitente, produto e rota usados no dashboard e nas análises'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', action='append', dest='tipos', choices=list(MODELOS),
+                            help='Só este tipo de documento (pode ser repetido)')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        contagens = reconstruir_resumos(options['tipos'])
+        duracao = time.perf_counter() - inicio
+
+        detalhes = ', '.join(f"{quantidade} {tipo}" for tipo, quantidade in contagens.items())
+        self.stdout.write(self.style.SUCCESS(f"Resumos reconstruídos em {duracao:.1f}s ({detalhes})"))
@@ -0,0 +1,38 @@
+"""
+Processa a fila de consultas SEFAZ em background
+
+Uso:
+    python manage.py sefaz_worker
+    python manage.py sefaz_worker --concorrencia 8 --lease 600
+    python manage.py sefaz_worker --uma-vez
+"""
+from django.core.management.base import BaseCommand
+
+from core.fila_consultas import SEFAZWorker
+
+
+class Command(BaseCommand):
+    help = 'Executa as consultas SEFAZ pendentes e agenda as consultas automáticas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concorrencia', type=int, default=4, help='Consultas simultâneas')
+        parser.add_argument('--lease', type=int, default=300, help='Segundos de reserva de cada consulta')
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre ciclos com a fila vazia')
+        parser.add_argument('--worker-id', help='Identificador do worker (padrão: host:pid)')
+        parser.add_argument('--uma-vez', action='store_true', help='Processa a fila atual e encerra')
+
+    def handle(self, *args, **options):
+        worker = SEFAZWorker(
+            worker_id=options['worker_id'],
+            concorrencia=options['concorrencia'],
+            lease=options['lease'],
+            intervalo=options['intervalo'],
+        )
+        self.stdout.write(f"Worker {worker.worker_id} ({worker.concorrencia} consultas simultâneas)")
+
+        try:
+            worker.executar(uma_vez=options['uma_vez'])
+        except KeyboardInterrupt:
+            self.stdout.write('Encerrando...')
+
+        self.stdout.write(self.style.SUCCESS(f"{worker.processadas} consultas processadas"))
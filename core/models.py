@@ -1,13 +1,67 @@
 """
 Models para gestão de XMLs fiscais (NFe e CTe)
 """
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django.contrib.auth.models import User
 
+from .compressao import XMLComprimidoField
+from .upsert import DocumentoFiscalQuerySet
 
-class NFe(models.Model):
+
+_SEM_ALTERACAO = object()
+
+
+class ComXMLSeparado:
+    """
+    Expõe `xml_content` de um documento cujo XML fica em outra tabela
+
+    O XML só é lido (um SELECT na tabela de XML, ou select_related('xml'))
+    quando o atributo é acessado; atribuições ficam pendentes até o save().
+    Listagens nunca trazem o XML.
+    """
+
+    @property
+    def xml_content(self):
+        pendente = self.__dict__.get('_xml_pendente', _SEM_ALTERACAO)
+        if pendente is not _SEM_ALTERACAO:
+            return pendente
+        if self.pk is None:
+            return None
+        try:
+            return self.xml.conteudo
+        except ObjectDoesNotExist:
+            return None
+
+    @xml_content.setter
+    def xml_content(self, valor):
+        self.__dict__['_xml_pendente'] = valor
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        pendente = self.__dict__.pop('_xml_pendente', _SEM_ALTERACAO)
+        if pendente is not _SEM_ALTERACAO:
+            modelo = self._meta.get_field('xml').related_model
+            self.xml, _ = modelo.objects.update_or_create(documento=self, defaults={'conteudo': pendente})
+
+    def xml_para_gravar(self):
+        """Instância do modelo de XML com o valor pendente (para bulk_create), ou None"""
+        pendente = self.__dict__.pop('_xml_pendente', _SEM_ALTERACAO)
+        if pendente is _SEM_ALTERACAO or pendente is None:
+            return None
+        return self._meta.get_field('xml').related_model(documento_id=self.pk, conteudo=pendente)
+
+
+class NFe(ComXMLSeparado, models.Model):
     """Nota Fiscal Eletrônica"""
 
+    # Colunas usadas nas listagens (views, API e admin carregam só estas)
+    CAMPOS_LISTAGEM = (
+        'id', 'chave_acesso', 'numero_nf', 'serie', 'data_emissao', 'emit_cnpj', 'emit_nome',
+        'emit_uf', 'dest_nome', 'valor_total', 'status_nfe',
+    )
+    CAMPO_STATUS = 'status_nfe'
+
     # Identificação
     chave_acesso = models.CharField(max_length=44, unique=True, db_index=True)
     numero_nf = models.CharField(max_length=20, null=True, blank=True)
@@ -47,12 +101,13 @@ class NFe(models.Model):
     protocolo = models.CharField(max_length=50, null=True, blank=True)
     motivo = models.TextField(null=True, blank=True)
 
-    # XML e controle
-    xml_content = models.TextField(null=True, blank=True)
+    # Controle (o XML fica em NFeXML/CTeXML, ver ComXMLSeparado)
     arquivo_nome = models.CharField(max_length=255, null=True, blank=True)
     data_importacao = models.DateTimeField(auto_now_add=True)
     usuario_importacao = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = DocumentoFiscalQuerySet.as_manager()
+
     class Meta:
         verbose_name = "NFe - Nota Fiscal Eletrônica"
         verbose_name_plural = "NFe - Notas Fiscais Eletrônicas"
@@ -60,6 +115,7 @@ class NFe(models.Model):
         indexes = [
             models.Index(fields=['-data_emissao']),
             models.Index(fields=['emit_cnpj', '-data_emissao']),
+            models.Index(fields=['numero_nf']),
         ]
 
     def __str__(self):
@@ -94,14 +150,22 @@ class NFeItem(models.Model):
         verbose_name = "Item de NFe"
         verbose_name_plural = "Itens de NFe"
         ordering = ['numero_item']
+        indexes = [models.Index(fields=['nfe', 'numero_item'])]  # páginas de /api/nfe/{id}/itens/
 
     def __str__(self):
         return f"Item {self.numero_item} - {self.descricao}"
 
 
-class CTe(models.Model):
+class CTe(ComXMLSeparado, models.Model):
     """Conhecimento de Transporte Eletrônico"""
 
+    # Colunas usadas nas listagens (views, API e admin carregam só estas)
+    CAMPOS_LISTAGEM = (
+        'id', 'chave_acesso', 'numero_ct', 'serie', 'data_emissao', 'emit_cnpj', 'emit_nome',
+        'emit_uf', 'dest_nome', 'municipio_inicio', 'municipio_fim', 'modal', 'valor_total', 'status_cte',
+    )
+    CAMPO_STATUS = 'status_cte'
+
     # Identificação
     chave_acesso = models.CharField(max_length=44, unique=True, db_index=True)
     numero_ct = models.CharField(max_length=20, null=True, blank=True)
@@ -152,12 +216,13 @@ class CTe(models.Model):
     protocolo = models.CharField(max_length=50, null=True, blank=True)
     motivo = models.TextField(null=True, blank=True)
 
-    # XML e controle
-    xml_content = models.TextField(null=True, blank=True)
+    # Controle (o XML fica em NFeXML/CTeXML, ver ComXMLSeparado)
     arquivo_nome = models.CharField(max_length=255, null=True, blank=True)
     data_importacao = models.DateTimeField(auto_now_add=True)
     usuario_importacao = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
+    objects = DocumentoFiscalQuerySet.as_manager()
+
     class Meta:
         verbose_name = "CTe - Conhecimento de Transporte"
         verbose_name_plural = "CTe - Conhecimentos de Transporte"
@@ -165,12 +230,174 @@ class CTe(models.Model):
         indexes = [
             models.Index(fields=['-data_emissao']),
             models.Index(fields=['emit_cnpj', '-data_emissao']),
+            models.Index(fields=['numero_ct']),
         ]
 
     def __str__(self):
         return f"CTe {self.numero_ct} - {self.emit_nome}"
 
 
+class NFeXML(models.Model):
+    """XML original da NFe, fora da tabela de listagem"""
+
+    documento = models.OneToOneField(NFe, on_delete=models.CASCADE, primary_key=True, related_name='xml')
+    conteudo = XMLComprimidoField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "XML de NFe"
+        verbose_name_plural = "XMLs de NFe"
+
+    def __str__(self):
+        return f"XML da NFe {self.documento_id}"
+
+
+class CTeXML(models.Model):
+    """XML original do CTe, fora da tabela de listagem"""
+
+    documento = models.OneToOneField(CTe, on_delete=models.CASCADE, primary_key=True, related_name='xml')
+    conteudo = XMLComprimidoField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "XML de CTe"
+        verbose_name_plural = "XMLs de CTe"
+
+    def __str__(self):
+        return f"XML do CTe {self.documento_id}"
+
+
+class ResumoDiario(models.Model):
+    """Quantidade e valor de NFe/CTe por dia de emissão (mantido na importação)"""
+
+    tipo = models.CharField(max_length=10)
+    dia = models.DateField(null=True, blank=True)
+    quantidade = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário"
+        verbose_name_plural = "Resumos Diários"
+        constraints = [models.UniqueConstraint(fields=['tipo', 'dia'], name='resumo_diario_unico')]
+
+    def __str__(self):
+        return f"{self.tipo} {self.dia}: {self.quantidade}"
+
+
+class ResumoEmitente(models.Model):
+    """Quantidade e valor de NFe/CTe por emitente (mantido na importação)"""
+
+    tipo = models.CharField(max_length=10)
+    emit_cnpj = models.CharField(max_length=14, blank=True, default='')
+    emit_nome = models.CharField(max_length=255, null=True, blank=True)
+    quantidade = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo por Emitente"
+        verbose_name_plural = "Resumos por Emitente"
+        constraints = [models.UniqueConstraint(fields=['tipo', 'emit_cnpj'], name='resumo_emitente_unico')]
+        indexes = [models.Index(fields=['tipo', '-quantidade'])]
+
+    def __str__(self):
+        return f"{self.tipo} {self.emit_cnpj}: {self.quantidade}"
+
+
+class ResumoDiarioEmitente(models.Model):
+    """Quantidade e valor de NFe/CTe por dia e emitente (mantido na importação)"""
+
+    tipo = models.CharField(max_length=10)
+    dia = models.DateField(null=True, blank=True)
+    emit_cnpj = models.CharField(max_length=14, blank=True, default='')
+    emit_nome = models.CharField(max_length=255, null=True, blank=True)
+    quantidade = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário por Emitente"
+        verbose_name_plural = "Resumos Diários por Emitente"
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'dia', 'emit_cnpj'], name='resumo_diario_emitente_unico')
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.dia} {self.emit_cnpj}: {self.quantidade}"
+
+
+class ResumoDiarioProduto(models.Model):
+    """Itens de NFe por dia e código de produto (mantido na importação)"""
+
+    dia = models.DateField(null=True, blank=True)
+    codigo_produto = models.CharField(max_length=60, blank=True, default='')
+    descricao = models.TextField(null=True, blank=True)
+    itens = models.IntegerField(default=0)
+    quantidade = models.DecimalField(max_digits=20, decimal_places=4, default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário por Produto"
+        verbose_name_plural = "Resumos Diários por Produto"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'codigo_produto'], name='resumo_diario_produto_unico')
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.codigo_produto}: {self.quantidade}"
+
+
+class ResumoDiarioRota(models.Model):
+    """Quantidade e valor de CTe por dia e rota (município/UF de início e fim)"""
+
+    dia = models.DateField(null=True, blank=True)
+    municipio_inicio = models.CharField(max_length=100, blank=True, default='')
+    uf_inicio = models.CharField(max_length=2, blank=True, default='')
+    municipio_fim = models.CharField(max_length=100, blank=True, default='')
+    uf_fim = models.CharField(max_length=2, blank=True, default='')
+    quantidade = models.IntegerField(default=0)
+    valor_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumo Diário por Rota"
+        verbose_name_plural = "Resumos Diários por Rota"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dia', 'municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim'],
+                name='resumo_diario_rota_unico',
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.municipio_inicio}/{self.uf_inicio} -> {self.municipio_fim}/{self.uf_fim}"
+
+
+class VersaoDados(models.Model):
+    """Contador de alterações por conjunto de dados (NFe, CTe, ImportLog), base dos ETags da API"""
+
+    nome = models.CharField(max_length=30, primary_key=True)
+    versao = models.BigIntegerField(default=0)
+    alterado_em = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Versão dos Dados"
+        verbose_name_plural = "Versões dos Dados"
+
+    def __str__(self):
+        return f"{self.nome} v{self.versao}"
+
+
+class DicionarioCompressao(models.Model):
+    """Dicionário zlib treinado nos XMLs (imutável: valores gravados referenciam o id)"""
+
+    dados = models.BinaryField()
+    amostras = models.IntegerField(default=0, help_text="Documentos usados no treino")
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Dicionário de Compressão"
+        verbose_name_plural = "Dicionários de Compressão"
+
+    def __str__(self):
+        return f"Dicionário {self.pk} ({len(self.dados)} bytes, {self.amostras} amostras)"
+
+
 class ImportLog(models.Model):
     """Log de importações"""
 
@@ -183,6 +410,7 @@ class ImportLog(models.Model):
         ('sucesso', 'Sucesso'),
         ('erro', 'Erro'),
         ('processando', 'Processando'),
+        ('ignorado', 'Ignorado (já importado)'),
     ]
 
     data_importacao = models.DateTimeField(auto_now_add=True)
@@ -191,6 +419,7 @@ class ImportLog(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processando')
     mensagem = models.TextField(null=True, blank=True)
     chave_acesso = models.CharField(max_length=44, null=True, blank=True)
+    quantidade = models.IntegerField(default=1, help_text="Arquivos resumidos neste registro")
     usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
 
     class Meta:
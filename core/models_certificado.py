@@ -5,6 +5,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .compressao import XMLComprimidoField
+
 
 class CertificadoDigital(models.Model):
     """Armazena certificados digitais A1 para consultas automáticas"""
@@ -84,10 +86,19 @@ class ConsultaSEFAZ(models.Model):
     mensagem_erro = models.TextField(blank=True)
     log_detalhado = models.TextField(blank=True)
 
+    # Fila (sefaz_worker): consulta reservada por um worker até lease_ate
+    automatica = models.BooleanField(default=False, help_text="Criada pelo agendamento automático")
+    worker_id = models.CharField(max_length=100, blank=True)
+    lease_ate = models.DateTimeField(null=True, blank=True)
+    tentativas = models.IntegerField(default=0)
+
     class Meta:
         verbose_name = "Consulta SEFAZ"
         verbose_name_plural = "Consultas SEFAZ"
         ordering = ['-data_consulta']
+        indexes = [
+            models.Index(fields=['status', 'lease_ate'], name='consulta_fila_idx'),
+        ]
 
     def __str__(self):
         return f"{self.tipo_documento} - {self.data_inicio} a {self.data_fim} - {self.status}"
@@ -125,7 +136,7 @@ class DocumentoConsultado(models.Model):
     valor_total = models.DecimalField(max_digits=15, decimal_places=2)
 
     # XML
-    xml_completo = models.TextField(blank=True)
+    xml_completo = XMLComprimidoField(blank=True, default='')
     xml_baixado = models.BooleanField(default=False)
 
     # Status
@@ -147,6 +158,26 @@ class DocumentoConsultado(models.Model):
         return f"{self.numero} - {self.emit_nome} - {self.papel_cnpj}"
 
 
+class CursorNSU(models.Model):
+    """Último NSU da distribuição DF-e já processado por certificado e CNPJ"""
+
+    certificado = models.ForeignKey(CertificadoDigital, on_delete=models.CASCADE, related_name='cursores_nsu')
+    cnpj = models.CharField(max_length=14)
+    ult_nsu = models.CharField(max_length=15, default='000000000000000')
+    max_nsu = models.CharField(max_length=15, default='000000000000000')
+    data_atualizacao = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Cursor NSU"
+        verbose_name_plural = "Cursores NSU"
+        constraints = [
+            models.UniqueConstraint(fields=['certificado', 'cnpj'], name='cursor_nsu_certificado_cnpj'),
+        ]
+
+    def __str__(self):
+        return f"{self.cnpj} - NSU {self.ult_nsu}/{self.max_nsu}"
+
+
 class ConfiguracaoConsulta(models.Model):
     """Configurações globais de consulta"""
 
@@ -0,0 +1,172 @@
+"""
+Paginação por cursor (keyset) para listas de NFe, CTe e ImportLog
+
+Paginator/PageNumberPagination fazem COUNT(*) e OFFSET, que ficam mais lentos
+a cada página. Aqui a página seguinte é filtrada a partir da última linha
+exibida (campo de ordenação + id), o que usa os índices de -data_emissao e
+custa o mesmo em qualquer profundidade. O total, quando pedido, é estimado.
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from django.db import connections
+from django.db.models import Q
+
+# Acima disto a contagem limitada para de contar (bancos sem estimativa do planejador)
+LIMITE_CONTAGEM = 10_000
+
+
+class CursorInvalido(ValueError):
+    """Cursor adulterado ou de outra ordenação"""
+
+
+@dataclass
+class PaginaCursor:
+    """Uma página de resultados e os cursores para as vizinhas"""
+
+    itens: List = field(default_factory=list)
+    proximo: Optional[str] = None
+    anterior: Optional[str] = None
+    total_estimado: Optional[int] = None
+
+    def __iter__(self):
+        return iter(self.itens)
+
+    def __len__(self):
+        return len(self.itens)
+
+    @property
+    def tem_proxima(self) -> bool:
+        return self.proximo is not None
+
+    @property
+    def tem_anterior(self) -> bool:
+        return self.anterior is not None
+
+
+def _ordenacao(queryset):
+    """(campo, decrescente) da primeira ordenação do queryset (padrão: -pk)"""
+    ordem = queryset.query.order_by or queryset.model._meta.ordering or ['-pk']
+    primeiro = ordem[0]
+    if not isinstance(primeiro, str):
+        raise ValueError('Paginação por cursor exige ordenação por nome de campo')
+    campo = primeiro.lstrip('-')
+    if campo == queryset.model._meta.pk.name:
+        campo = 'pk'
+    return campo, primeiro.startswith('-')
+
+
+def _codificar(campo, valor, pk, voltar=False) -> str:
+    dados = {'c': campo, 'v': valor, 'id': pk}
+    if voltar:
+        dados['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(dados, default=str).encode()).decode().rstrip('=')
+
+
+def _decodificar(cursor: str, campo: str, modelo):
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if dados['c'] != campo:
+            raise CursorInvalido('Cursor de outra ordenação')
+        valor = dados['v']
+        if valor is not None and campo != 'pk':
+            valor = modelo._meta.get_field(campo).to_python(valor)
+        return valor, int(dados['id']), bool(dados.get('r'))
+    except CursorInvalido:
+        raise
+    except Exception as e:
+        raise CursorInvalido('Cursor inválido') from e
+
+
+def _depois_de(campo, valor, pk, decrescente, nulos_no_fim, anulavel) -> Q:
+    """Linhas que vêm depois de (valor, pk) na ordem informada"""
+    op = 'lt' if decrescente else 'gt'
+    if campo == 'pk':
+        return Q(**{f'pk__{op}': pk})
+    if valor is None:
+        mesmos_nulos = Q(**{f'{campo}__isnull': True, f'pk__{op}': pk})
+        return mesmos_nulos if nulos_no_fim else Q(**{f'{campo}__isnull': False}) | mesmos_nulos
+    filtro = Q(**{f'{campo}__{op}': valor}) | Q(**{campo: valor, f'pk__{op}': pk})
+    if anulavel and nulos_no_fim:
+        filtro |= Q(**{f'{campo}__isnull': True})
+    return filtro
+
+
+def estimar_total(queryset, limite: int = LIMITE_CONTAGEM) -> int:
+    """
+    Total aproximado do queryset sem COUNT(*) completo
+
+    No PostgreSQL usa a estimativa de linhas do planejador (EXPLAIN); nos
+    demais bancos conta até `limite` linhas (o retorno satura em `limite`).
+    """
+    queryset = queryset.order_by()
+    conexao = connections[queryset.db]
+    if conexao.vendor == 'postgresql':
+        sql, params = queryset.values('pk').query.sql_with_params()
+        with conexao.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        return int(plano[0]['Plan']['Plan Rows'])
+    return queryset[:limite].count()
+
+
+def paginar(queryset, cursor: Optional[str] = None, tamanho: int = 20, estimar: bool = False) -> PaginaCursor:
+    """
+    Página do queryset a partir do cursor (None = primeira página)
+
+    A ordem é a do queryset (um campo, ex.: '-data_emissao'), desempatada pelo
+    id. Os NULL ficam onde o banco os coloca nessa ordem, para aproveitar os
+    índices existentes.
+
+    Raises:
+        CursorInvalido: cursor malformado ou gerado com outra ordenação
+    """
+    campo, decrescente = _ordenacao(queryset)
+    conexao = connections[queryset.db]
+    # NULL é o maior valor no PostgreSQL/Oracle e o menor no SQLite/MySQL
+    nulos_no_fim = conexao.features.nulls_order_largest != decrescente
+    anulavel = campo != 'pk' and queryset.model._meta.get_field(campo).null
+    sinal = '-' if decrescente else ''
+    ordem = [f'{sinal}{campo}', f'{sinal}pk'] if campo != 'pk' else [f'{sinal}pk']
+
+    voltar = False
+    filtrado = queryset
+    if cursor:
+        valor, pk, voltar = _decodificar(cursor, campo, queryset.model)
+        if voltar:
+            # Página anterior: percorre na ordem inversa e desinverte no fim
+            filtro = _depois_de(campo, valor, pk, not decrescente, not nulos_no_fim, anulavel)
+        else:
+            filtro = _depois_de(campo, valor, pk, decrescente, nulos_no_fim, anulavel)
+        filtrado = queryset.filter(filtro)
+
+    if voltar:
+        ordem = [o[1:] if o.startswith('-') else f'-{o}' for o in ordem]
+    linhas = list(filtrado.order_by(*ordem)[:tamanho + 1])
+    ha_mais = len(linhas) > tamanho
+    linhas = linhas[:tamanho]
+    if voltar:
+        linhas.reverse()
+
+    pk = queryset.model._meta.pk.attname
+
+    def cursor_de(obj, voltar_=False):
+        # Instâncias do modelo ou dicionários de values() (listagem rápida da API)
+        if isinstance(obj, dict):
+            return _codificar(campo, obj[pk if campo == 'pk' else campo], obj[pk], voltar_)
+        valor = obj.pk if campo == 'pk' else getattr(obj, campo)
+        return _codificar(campo, valor, obj.pk, voltar_)
+
+    pagina = PaginaCursor(itens=linhas)
+    if linhas:
+        if ha_mais or voltar:
+            pagina.proximo = cursor_de(linhas[-1])
+        if (cursor and not voltar) or (voltar and ha_mais):
+            pagina.anterior = cursor_de(linhas[0], voltar_=True)
+    if estimar:
+        pagina.total_estimado = estimar_total(queryset)
+    return pagina
@@ -0,0 +1,97 @@
+"""
+Credenciais e conexões reaproveitadas nas chamadas à SEFAZ
+
+O PFX é decodificado uma única vez em CredencialSEFAZ, que guarda os PEMs e um
+SSLContext já carregado com a chave do certificado. As sessões HTTP montam esse
+contexto num pool keep-alive (um pool por host do urllib3), evitando um novo
+handshake TCP/TLS a cada requisição SOAP.
+"""
+import os
+import ssl
+import tempfile
+
+import requests
+from requests.adapters import HTTPAdapter
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.hazmat.backends import default_backend
+
+# Conexões mantidas por host (um worker com N threads usa até N)
+CONEXOES_POR_HOST = 10
+
+
+class CredencialSEFAZ:
+    """Chave, certificado (PEM) e SSLContext de um certificado A1"""
+
+    __slots__ = ('key_pem', 'cert_pem', 'cadeia_pem', 'ssl_context')
+
+    def __init__(self, key_pem: bytes, cert_pem: bytes, cadeia_pem: bytes = b''):
+        self.key_pem = key_pem
+        self.cert_pem = cert_pem
+        self.cadeia_pem = cadeia_pem
+        self.ssl_context = self._criar_ssl_context()
+
+    @classmethod
+    def carregar(cls, certificado_pfx: bytes, senha: str) -> 'CredencialSEFAZ':
+        """Decodifica o arquivo .pfx"""
+        try:
+            private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
+                certificado_pfx,
+                senha.encode(),
+                backend=default_backend()
+            )
+        except Exception as e:
+            raise Exception(f"Erro ao carregar certificado: {e}")
+
+        key_pem = private_key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption()
+        )
+        cert_pem = certificate.public_bytes(encoding=serialization.Encoding.PEM)
+        cadeia_pem = b''.join(
+            c.public_bytes(encoding=serialization.Encoding.PEM) for c in additional_certificates or ()
+        )
+        return cls(key_pem, cert_pem, cadeia_pem)
+
+    def _criar_ssl_context(self) -> ssl.SSLContext:
+        # load_cert_chain só lê de arquivo: os PEMs ficam em disco apenas durante a carga
+        contexto = ssl.create_default_context()
+        with tempfile.TemporaryDirectory() as tmp:
+            cert_path = os.path.join(tmp, 'cert.pem')
+            key_path = os.path.join(tmp, 'key.pem')
+            with open(cert_path, 'wb') as f:
+                f.write(self.cert_pem + self.cadeia_pem)
+            with open(key_path, 'wb') as f:
+                f.write(self.key_pem)
+            contexto.load_cert_chain(cert_path, key_path)
+        return contexto
+
+
+class AdaptadorMTLS(HTTPAdapter):
+    """HTTPAdapter que apresenta o certificado do cliente via SSLContext"""
+
+    def __init__(self, ssl_context: ssl.SSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(*args, **kwargs)
+
+
+def criar_sessao(credencial: CredencialSEFAZ, conexoes_por_host: int = CONEXOES_POR_HOST) -> requests.Session:
+    """Sessão keep-alive autenticada com o certificado da credencial"""
+    sessao = requests.Session()
+    adaptador = AdaptadorMTLS(
+        credencial.ssl_context,
+        pool_connections=conexoes_por_host,
+        pool_maxsize=conexoes_por_host,
+    )
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', HTTPAdapter(pool_connections=conexoes_por_host, pool_maxsize=conexoes_por_host))
+    return sessao
@@ -0,0 +1,219 @@
+"""
+Limite de taxa e circuit breaker por endpoint da SEFAZ
+
+Cada URL de webservice tem um ControleEndpoint compartilhado pelas threads do
+processo, com:
+- TokenBucket adaptativo: reduz a taxa pela metade a cada "consumo indevido"
+  (cStat 656) ou erro 5xx e volta a subir aos poucos com respostas normais;
+- CircuitBreaker: após falhas seguidas o endpoint fica aberto e as chamadas
+  falham na hora (SEFAZIndisponivel) ou vão para a contingência, em vez de
+  prender a thread até o timeout. Depois do tempo de espera, uma sonda
+  NfeStatusServico (com resultado em cache) decide se o endpoint voltou.
+"""
+import re
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+
+_RE_CSTAT = re.compile(rb'<(?:\w+:)?cStat>(\d+)</')
+
+CSTAT_CONSUMO_INDEVIDO = '656'
+CSTAT_SERVICO_EM_OPERACAO = '107'
+
+
+class SEFAZIndisponivel(Exception):
+    """Endpoint com circuito aberto ou sem vaga no limite de taxa"""
+
+
+class TokenBucket:
+    """Token bucket com taxa adaptativa (redução multiplicativa, aumento aditivo)"""
+
+    def __init__(self, taxa: float, capacidade: float = None, taxa_minima: float = 0.2):
+        self.taxa_maxima = taxa
+        self.taxa_minima = min(taxa_minima, taxa)
+        self.taxa = taxa
+        self.capacidade = capacidade or max(1.0, taxa)
+        self.tokens = self.capacidade
+        self.atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        self.tokens = min(self.capacidade, self.tokens + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def adquirir(self, timeout: float = None) -> bool:
+        """Aguarda um token; False se não houver dentro do timeout"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._repor(agora)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                espera = (1 - self.tokens) / self.taxa
+            if limite is not None and agora + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def reduzir(self):
+        """Consumo indevido/sobrecarga: metade da taxa e esvazia o bucket"""
+        with self._lock:
+            self.taxa = max(self.taxa_minima, self.taxa / 2)
+            self.tokens = 0
+            self.atualizado = time.monotonic()
+
+    def recuperar(self):
+        """Resposta normal: sobe a taxa em 10% da máxima"""
+        with self._lock:
+            self.taxa = min(self.taxa_maxima, self.taxa + self.taxa_maxima / 10)
+
+
+class CircuitBreaker:
+    """Circuit breaker FECHADO -> ABERTO -> SEMI_ABERTO"""
+
+    FECHADO = 'FECHADO'
+    ABERTO = 'ABERTO'
+    SEMI_ABERTO = 'SEMI_ABERTO'
+
+    def __init__(self, limite_falhas: int = 5, tempo_aberto: float = 30):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.estado = self.FECHADO
+        self.falhas = 0
+        self.aberto_em = 0.0
+        # Chamada de teste em andamento (sonda + primeira chamada após o tempo aberto)
+        self.em_teste = False
+        self.teste_em = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self, sonda: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Indica se uma chamada pode seguir
+
+        Com o circuito aberto e o tempo de espera vencido, só um chamador faz o
+        teste: consulta a sonda (se houver) e, se o endpoint estiver saudável,
+        passa a SEMI_ABERTO e segue com a chamada. Os demais recebem False até o
+        teste terminar (registrar_sucesso/registrar_falha). Um teste que nunca
+        termina (chamador que desistiu antes de registrar) vence após tempo_aberto.
+        """
+        agora = time.monotonic()
+        with self._lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.em_teste and agora - self.teste_em < self.tempo_aberto:
+                return False
+            if self.estado == self.ABERTO and agora - self.aberto_em < self.tempo_aberto:
+                return False
+            self.em_teste, self.teste_em = True, agora
+        if sonda is not None and not sonda():
+            with self._lock:
+                self.estado = self.ABERTO
+                self.aberto_em = time.monotonic()
+                self.em_teste = False
+            return False
+        with self._lock:
+            self.estado = self.SEMI_ABERTO
+        return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.estado = self.FECHADO
+            self.falhas = 0
+            self.em_teste = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.estado == self.SEMI_ABERTO or self.falhas >= self.limite_falhas:
+                self.estado = self.ABERTO
+                self.aberto_em = time.monotonic()
+            self.em_teste = False
+
+
+class ControleEndpoint:
+    """Limite de taxa + circuit breaker de uma URL de webservice"""
+
+    def __init__(self, url: str, taxa: float, limite_falhas: int, tempo_aberto: float, espera_maxima: float = 10):
+        self.url = url
+        self.espera_maxima = espera_maxima
+        self.bucket = TokenBucket(taxa)
+        self.circuito = CircuitBreaker(limite_falhas, tempo_aberto)
+
+    def disponivel(self, sonda: Optional[Callable[[], bool]] = None) -> bool:
+        return self.circuito.permitir(sonda)
+
+    def aguardar_vez(self, timeout: float = None):
+        """Consome um token ou levanta SEFAZIndisponivel (espera no máximo espera_maxima)"""
+        if not self.bucket.adquirir(self.espera_maxima if timeout is None else timeout):
+            raise SEFAZIndisponivel(f"Limite de requisições atingido em {self.url}")
+
+    def registrar_resposta(self, status_code: int, conteudo: bytes):
+        """Alimenta limitador e circuito com o resultado de uma chamada"""
+        if status_code >= 500:
+            self.bucket.reduzir()
+            self.circuito.registrar_falha()
+            return
+        m = _RE_CSTAT.search(conteudo or b'')
+        if m and m.group(1).decode() == CSTAT_CONSUMO_INDEVIDO:
+            # Serviço no ar, mas acima do limite de consumo: reduz a taxa e conta como resposta
+            self.bucket.reduzir()
+            self.circuito.registrar_sucesso()
+            return
+        self.bucket.recuperar()
+        self.circuito.registrar_sucesso()
+
+    def registrar_falha(self):
+        """Timeout ou erro de conexão"""
+        self.circuito.registrar_falha()
+
+
+_controles = {}
+_controles_lock = threading.Lock()
+
+
+def controle_endpoint(url: str) -> ControleEndpoint:
+    """ControleEndpoint compartilhado da URL (criado no primeiro uso)"""
+    controle = _controles.get(url)
+    if controle is None:
+        with _controles_lock:
+            controle = _controles.get(url)
+            if controle is None:
+                controle = ControleEndpoint(
+                    url,
+                    taxa=getattr(settings, 'SEFAZ_REQUISICOES_POR_SEGUNDO', 5),
+                    limite_falhas=getattr(settings, 'SEFAZ_CIRCUITO_FALHAS', 5),
+                    tempo_aberto=getattr(settings, 'SEFAZ_CIRCUITO_ESPERA', 30),
+                    espera_maxima=getattr(settings, 'SEFAZ_ESPERA_LIMITE', 10),
+                )
+                _controles[url] = controle
+    return controle
+
+
+def limpar_controles():
+    """Descarta limitadores e circuitos (novos valores de configuração)"""
+    with _controles_lock:
+        _controles.clear()
+
+
+def saude_em_cache(url: str, sonda: Callable[[], bool], ttl: int = None) -> bool:
+    """
+    Resultado da sonda de status do endpoint, em cache por ttl segundos
+
+    O cache do Django é compartilhado entre workers quando configurado com
+    backend externo, então só um deles sonda a SEFAZ por período.
+    """
+    ttl = ttl if ttl is not None else getattr(settings, 'SEFAZ_STATUS_CACHE', 60)
+    chave = f"sefaz:status:{urlsplit(url).netloc}{urlsplit(url).path}"
+    saudavel = cache.get(chave)
+    if saudavel is None:
+        try:
+            saudavel = bool(sonda())
+        except Exception:
+            saudavel = False
+        cache.set(chave, saudavel, ttl)
+    return saudavel
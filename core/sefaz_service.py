@@ -3,13 +3,65 @@ Serviço de consulta automática na SEFAZ
 Integração com webservices da Receita Federal
 """
 
+import logging
+import threading
 import requests
+from urllib.parse import urlsplit
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import xml.etree.ElementTree as ET
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.hazmat.backends import default_backend
-import base64
+from django.conf import settings
+
+from .sefaz_conexao import CredencialSEFAZ, criar_sessao
+from .sefaz_resiliencia import (
+    CSTAT_SERVICO_EM_OPERACAO, SEFAZIndisponivel, controle_endpoint, saude_em_cache
+)
+from .distribuicao_dfe import DocumentoDFe, RetornoDistribuicao, decodificar_lote, ler_retorno_distribuicao
+from .xml_parser import parse_nfe_xml
+
+logger = logging.getLogger(__name__)
+
+# cUF (dois primeiros dígitos da chave de acesso) -> UF
+UF_POR_CODIGO = {
+    '11': 'RO', '12': 'AC', '13': 'AM', '14': 'RR', '15': 'PA', '16': 'AP', '17': 'TO',
+    '21': 'MA', '22': 'PI', '23': 'CE', '24': 'RN', '25': 'PB', '26': 'PE', '27': 'AL', '28': 'SE', '29': 'BA',
+    '31': 'MG', '32': 'ES', '33': 'RJ', '35': 'SP',
+    '41': 'PR', '42': 'SC', '43': 'RS',
+    '50': 'MS', '51': 'MT', '52': 'GO', '53': 'DF',
+}
+CODIGO_POR_UF = {uf: codigo for codigo, uf in UF_POR_CODIGO.items()}
+
+
+def uf_da_chave(chave_acesso: str) -> str:
+    """UF emissora pela chave de acesso ('35...' -> 'SP'); ValueError se o cUF não existe"""
+    try:
+        return UF_POR_CODIGO[chave_acesso[:2]]
+    except KeyError:
+        raise ValueError(f"cUF inválido na chave de acesso {chave_acesso!r}") from None
+
+
+# cStat do protNFe: autorizado o uso (100) / autorizado fora de prazo (150)
+CSTAT_AUTORIZADA = ('100', '150')
+
+
+def nfe_autorizada(xml, chave_acesso: str = None) -> bool:
+    """True se o XML é um nfeProc com NFe e protocolo de autorização (da chave informada)"""
+    try:
+        root = ET.fromstring(xml.encode('utf-8') if isinstance(xml, str) else xml)
+    except ET.ParseError:
+        return False
+    if root.tag.rsplit('}', 1)[-1] != 'nfeProc':
+        return False
+    locais = {}
+    for elemento in root.iter():
+        locais.setdefault(elemento.tag.rsplit('}', 1)[-1], elemento)
+    protocolo = locais.get('infProt')
+    if 'NFe' not in locais or protocolo is None:
+        return False
+    dados = {filho.tag.rsplit('}', 1)[-1]: (filho.text or '').strip() for filho in protocolo}
+    if dados.get('cStat') not in CSTAT_AUTORIZADA:
+        return False
+    return chave_acesso is None or dados.get('chNFe') == chave_acesso
 
 
 class SEFAZConsultaService:
@@ -28,58 +80,124 @@ class SEFAZConsultaService:
         'CE': 'https://nfe.sefaz.ce.gov.br/nfe2/services/NFeStatusServico4',
     }
 
+    # Contingência (SVC) usada quando o circuito do webservice da UF está aberto
+    WEBSERVICES_CONTINGENCIA = {
+        'SVC-AN': 'https://www.svc.fazenda.gov.br/NFeStatusServico4/NFeStatusServico4.asmx',
+        'SVC-RS': 'https://nfe.svrs.rs.gov.br/ws/NfeStatusServico/NfeStatusServico4.asmx',
+    }
+    CONTINGENCIA_POR_UF = {
+        'SP': 'SVC-AN', 'RJ': 'SVC-AN', 'MG': 'SVC-AN', 'RS': 'SVC-AN', 'SC': 'SVC-AN', 'CE': 'SVC-AN',
+        'PR': 'SVC-RS', 'BA': 'SVC-RS', 'PE': 'SVC-RS', 'GO': 'SVC-RS',
+    }
+
+    # Ambiente Nacional: distribuição de DF-e de interesse (todas as UFs)
+    WEBSERVICE_DISTRIBUICAO = 'https://www1.nfe.fazenda.gov.br/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx'
+
     WEBSERVICES_CTE = {
         'SP': 'https://nfe.fazenda.sp.gov.br/ws/ctestatusservico.asmx',
         'RJ': 'https://cte.fazenda.rj.gov.br/ws/ctestatusservico.asmx',
         'MG': 'https://cte.fazenda.mg.gov.br/cte/services/CTeStatusServico',
     }
 
-    def __init__(self, certificado_pfx: bytes, senha: str):
+    def __init__(self, certificado_pfx: bytes, senha: str, credencial: CredencialSEFAZ = None):
         """
         Inicializa o serviço com certificado digital
 
         Args:
             certificado_pfx: Bytes do arquivo .pfx
             senha: Senha do certificado
+            credencial: Credencial já decodificada (evita reler o .pfx)
         """
         self.certificado_pfx = certificado_pfx
         self.senha = senha
-        self.cert_pem = None
-        self.key_pem = None
-        self._carregar_certificado()
+        self.credencial = credencial or CredencialSEFAZ.carregar(certificado_pfx, senha)
+        self.cert_pem = self.credencial.cert_pem
+        self.key_pem = self.credencial.key_pem
+        self._sessao = None
+        self._sessao_lock = threading.Lock()
+
+    @property
+    def sessao(self) -> requests.Session:
+        """Sessão keep-alive com mTLS, criada no primeiro uso"""
+        if self._sessao is None:
+            with self._sessao_lock:
+                if self._sessao is None:
+                    self._sessao = criar_sessao(self.credencial)
+        return self._sessao
+
+    def _post(self, url: str, soap_body: str, timeout: int) -> requests.Response:
+        """Envia um envelope SOAP pela sessão do certificado"""
+        base = getattr(settings, 'SEFAZ_ENDPOINT_BASE', '')
+        if base:
+            # Ambiente de teste/benchmark: mesmo caminho num servidor local
+            url = base.rstrip('/') + urlsplit(url).path
+        return self.sessao.post(
+            url,
+            data=soap_body.encode('utf-8'),
+            headers={'Content-Type': 'application/soap+xml; charset=utf-8'},
+            timeout=timeout
+        )
+
+    def _chamar(self, url: str, soap_body: str, timeout: int, uf: str = None) -> requests.Response:
+        """
+        Envia o SOAP respeitando o limite de taxa e o circuito do endpoint
 
-    def _carregar_certificado(self):
-        """Carrega e converte certificado PFX para PEM"""
+        Com o circuito aberto, usa a contingência da UF (se houver) ou levanta
+        SEFAZIndisponivel sem tentar a conexão.
+        """
+        controle = controle_endpoint(url)
+        if not controle.disponivel(self._sonda_status(uf)):
+            contingencia = self.WEBSERVICES_CONTINGENCIA.get(self.CONTINGENCIA_POR_UF.get(uf))
+            if not contingencia or not controle_endpoint(contingencia).disponivel():
+                raise SEFAZIndisponivel(f"Webservice indisponível: {url}")
+            url, controle = contingencia, controle_endpoint(contingencia)
+
+        controle.aguardar_vez()
         try:
-            # Carregar certificado
-            private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
-                self.certificado_pfx,
-                self.senha.encode(),
-                backend=default_backend()
-            )
-
-            # Converter para PEM (necessário para requests)
-            from cryptography.hazmat.primitives import serialization
-
-            self.key_pem = private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.PKCS8,
-                encryption_algorithm=serialization.NoEncryption()
-            )
-
-            self.cert_pem = certificate.public_bytes(
-                encoding=serialization.Encoding.PEM
-            )
+            response = self._post(url, soap_body, timeout)
+        except (requests.Timeout, requests.ConnectionError):
+            controle.registrar_falha()
+            raise
+        controle.registrar_resposta(response.status_code, response.content)
+        return response
+
+    def _sonda_status(self, uf: str = None):
+        """Sonda NfeStatusServico da UF (resultado em cache) para o circuit breaker"""
+        url = self.WEBSERVICES_NFE.get(uf)
+        if not url:
+            return None
+        return lambda: saude_em_cache(url, lambda: self.status_servico(uf))
 
-        except Exception as e:
-            raise Exception(f"Erro ao carregar certificado: {e}")
+    def status_servico(self, uf: str = 'SP') -> bool:
+        """Consulta NfeStatusServico da UF; True se em operação (cStat 107)"""
+        soap_body = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
+            <soap:Body>
+                <nfeDadosMsg xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeStatusServico4">
+                    <consStatServ versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe">
+                        <tpAmb>1</tpAmb>
+                        <cUF>{self._get_codigo_uf(uf)}</cUF>
+                        <xServ>STATUS</xServ>
+                    </consStatServ>
+                </nfeDadosMsg>
+            </soap:Body>
+        </soap:Envelope>"""
+
+        response = self._post(self.WEBSERVICES_NFE[uf], soap_body, timeout=10)
+        return f'<cStat>{CSTAT_SERVICO_EM_OPERACAO}</cStat>'.encode() in response.content
+
+    def fechar(self):
+        """Fecha as conexões abertas pela sessão"""
+        if self._sessao is not None:
+            self._sessao.close()
 
     def consultar_nfe_destinadas(
         self,
         cnpj: str,
         data_inicio: datetime,
         data_fim: datetime,
-        uf: str = 'SP'
+        uf: str = 'SP',
+        ult_nsu: str = '0'
     ) -> List[Dict]:
         """
         Consulta NFes destinadas ao CNPJ
@@ -89,23 +207,44 @@ class SEFAZConsultaService:
             data_inicio: Data inicial da consulta
             data_fim: Data final da consulta
             uf: UF para consulta
+            ult_nsu: Último NSU já recebido (retorna apenas documentos posteriores)
 
         Returns:
             Lista de dicionários com dados das NFes encontradas
         """
+        retorno = self.consultar_distribuicao(cnpj, ult_nsu, uf)
+        return [dados for dados in map(self.dados_documento, retorno.documentos) if dados]
+
+    def consultar_distribuicao(
+        self, cnpj: str, ult_nsu: str = '0', uf: str = 'SP', ignorar=None, ignorar_completos=None, timeout: float = 60
+    ) -> RetornoDistribuicao:
+        """
+        Consulta um lote da distribuição DF-e a partir do NSU informado
+
+        Args:
+            cnpj: CNPJ interessado
+            ult_nsu: Último NSU já processado
+            uf: UF do autor da consulta
+            ignorar: IndiceChaves com as chaves já gravadas (não são parseadas)
+            ignorar_completos: IndiceChaves das chaves já com XML completo (procNFe só é descartado nelas)
+            timeout: Segundos de espera pela resposta
+
+        Returns:
+            RetornoDistribuicao com cStat, ultNSU, maxNSU e os documentos do lote
+        """
 
         # Montar SOAP envelope
-        soap_body = """<?xml version="1.0" encoding="UTF-8"?>
+        soap_body = f"""<?xml version="1.0" encoding="UTF-8"?>
         <soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
             <soap:Body>
-                <nfeDistDFeInteresse xmlns="http://www.portalfiscal.inf.br/nfe">
+                <nfeDistDFeInteresse xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe">
                     <nfeDadosMsg>
                         <distDFeInt versao="1.01" xmlns="http://www.portalfiscal.inf.br/nfe">
                             <tpAmb>1</tpAmb>
                             <cUFAutor>{self._get_codigo_uf(uf)}</cUFAutor>
                             <CNPJ>{cnpj}</CNPJ>
                             <distNSU>
-                                <ultNSU>000000000000000</ultNSU>
+                                <ultNSU>{int(ult_nsu or 0):015d}</ultNSU>
                             </distNSU>
                         </distDFeInt>
                     </nfeDadosMsg>
@@ -115,17 +254,13 @@ class SEFAZConsultaService:
 
         try:
             # Fazer requisição com certificado
-            response = requests.post(
-                self.WEBSERVICES_NFE.get(uf),
-                data=soap_body,
-                headers={'Content-Type': 'application/soap+xml; charset=utf-8'},
-                cert=(self.cert_pem, self.key_pem),
-                timeout=60
-            )
+            response = self._chamar(self.WEBSERVICE_DISTRIBUICAO, soap_body, timeout=timeout)
 
-            # Parsear resposta XML
-            return self._parsear_resposta_nfe(response.text)
+            # Bytes: os docZip são lidos sem decodificar a resposta
+            return ler_retorno_distribuicao(response.content, ignorar=ignorar, ignorar_completos=ignorar_completos)
 
+        except SEFAZIndisponivel:
+            raise
         except Exception as e:
             raise Exception(f"Erro na consulta SEFAZ: {e}")
 
@@ -165,6 +300,45 @@ class SEFAZConsultaService:
         # Implementação de consulta CTe
         pass
 
+    def baixar_nfe_distribuicao(self, chave_acesso: str, cnpj: str, uf: str = 'SP') -> Optional[str]:
+        """
+        Baixa o nfeProc pela chave de acesso (consChNFe da distribuição DF-e)
+
+        Args:
+            chave_acesso: Chave de 44 dígitos
+            cnpj: CNPJ interessado (emitente, destinatário ou autorizado no XML)
+            uf: UF do autor da consulta
+
+        Returns:
+            XML do nfeProc autorizado ou None se a SEFAZ não devolver a NFe completa
+        """
+
+        soap_body = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
+            <soap:Body>
+                <nfeDistDFeInteresse xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe">
+                    <nfeDadosMsg>
+                        <distDFeInt versao="1.01" xmlns="http://www.portalfiscal.inf.br/nfe">
+                            <tpAmb>1</tpAmb>
+                            <cUFAutor>{self._get_codigo_uf(uf)}</cUFAutor>
+                            <CNPJ>{cnpj}</CNPJ>
+                            <consChNFe>
+                                <chNFe>{chave_acesso}</chNFe>
+                            </consChNFe>
+                        </distDFeInt>
+                    </nfeDadosMsg>
+                </nfeDistDFeInteresse>
+            </soap:Body>
+        </soap:Envelope>"""
+
+        response = self._chamar(self.WEBSERVICE_DISTRIBUICAO, soap_body, timeout=30)
+
+        # Sem procNFe (só resNFe/eventos, cStat 137/640...) a NFe fica para nova tentativa
+        for doc in ler_retorno_distribuicao(response.content).documentos:
+            if doc.tipo == 'procNFe' and doc.xml and nfe_autorizada(doc.xml, chave_acesso):
+                return doc.xml
+        return None
+
     def baixar_xml_completo(self, chave_acesso: str, uf: str = 'SP') -> Optional[str]:
         """
         Baixa XML completo pela chave de acesso
@@ -177,7 +351,7 @@ class SEFAZConsultaService:
             String com XML completo ou None se erro
         """
 
-        soap_body = """<?xml version="1.0" encoding="UTF-8"?>
+        soap_body = f"""<?xml version="1.0" encoding="UTF-8"?>
         <soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">
             <soap:Body>
                 <nfeConsultaNF xmlns="http://www.portalfiscal.inf.br/nfe">
@@ -193,13 +367,7 @@ class SEFAZConsultaService:
         </soap:Envelope>"""
 
         try:
-            response = requests.post(
-                self.WEBSERVICES_NFE.get(uf),
-                data=soap_body,
-                headers={'Content-Type': 'application/soap+xml; charset=utf-8'},
-                cert=(self.cert_pem, self.key_pem),
-                timeout=30
-            )
+            response = self._chamar(self.WEBSERVICES_NFE.get(uf), soap_body, timeout=30, uf=uf)
 
             # Extrair XML da resposta
             root = ET.fromstring(response.text)
@@ -210,20 +378,13 @@ class SEFAZConsultaService:
             print(f"Erro ao baixar XML: {e}")
             return None
 
-    def _parsear_resposta_nfe(self, xml_response: str) -> List[Dict]:
+    def _parsear_resposta_nfe(self, xml_response) -> List[Dict]:
         """Parseia resposta XML da SEFAZ e extrai dados das NFes"""
         documentos = []
 
         try:
-            root = ET.fromstring(xml_response)
-
-            # Navegar no XML e extrair dados
-            # (Implementação específica depende do formato de resposta da SEFAZ)
-
-            for doc in root.findall('.//docZip'):
-                # Decodificar e parsear cada documento
-                xml_doc = base64.b64decode(doc.text).decode('utf-8')
-                dados = self._extrair_dados_nfe(xml_doc)
+            for doc in decodificar_lote(xml_response):
+                dados = self.dados_documento(doc)
                 if dados:
                     documentos.append(dados)
 
@@ -232,36 +393,63 @@ class SEFAZConsultaService:
 
         return documentos
 
-    def _extrair_dados_nfe(self, xml_nfe: str) -> Optional[Dict]:
-        """Extrai dados principais de uma NFe"""
-        try:
-            root = ET.fromstring(xml_nfe)
+    def dados_documento(self, doc: DocumentoDFe) -> Optional[Dict]:
+        """Converte NFe completa (procNFe) ou resumo (resNFe) nos campos de DocumentoConsultado"""
+        if doc.duplicado:
+            return None
 
-            # Namespace NFe
-            ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+        if doc.erro:
+            logger.warning('Erro ao decodificar NSU %s: %s', doc.nsu, doc.erro)
+            return None
 
-            # Extrair dados
-            inf_nfe = root.find('.//nfe:infNFe', ns)
-            if not inf_nfe:
-                return None
+        if doc.tipo == 'procNFe':
+            nfe = doc.registro
+            return {
+                'chave_acesso': nfe.chave_acesso,
+                'numero': nfe.numero_nf or '',
+                'serie': nfe.serie or '',
+                'data_emissao': nfe.data_emissao,
+                'emit_cnpj': nfe.emit_cnpj or '',
+                'emit_nome': nfe.emit_nome or '',
+                'dest_cnpj': nfe.dest_cnpj_cpf or '',
+                'dest_nome': nfe.dest_nome or '',
+                'valor_total': nfe.valor_total or 0,
+                'xml_completo': doc.xml,
+            }
 
-            chave = inf_nfe.get('Id', '').replace('NFe', '')
+        if doc.tipo == 'resNFe':
+            # Resumo não traz número/série: vêm da chave (posições 23-25 e 26-34)
+            res = doc.registro
+            return {
+                'chave_acesso': res.chave_acesso,
+                'numero': res.chave_acesso[25:34].lstrip('0'),
+                'serie': res.chave_acesso[22:25].lstrip('0') or '0',
+                'data_emissao': res.data_emissao,
+                'emit_cnpj': res.emit_cnpj or '',
+                'emit_nome': res.emit_nome or '',
+                'dest_cnpj': '',
+                'dest_nome': '',
+                'valor_total': res.valor_total or 0,
+                'xml_completo': '',
+            }
 
-            ide = inf_nfe.find('.//nfe:ide', ns)
-            emit = inf_nfe.find('.//nfe:emit', ns)
-            dest = inf_nfe.find('.//nfe:dest', ns)
-            total = inf_nfe.find('.//nfe:total/nfe:ICMSTot', ns)
+        return None
+
+    def _extrair_dados_nfe(self, xml_nfe: str) -> Optional[Dict]:
+        """Extrai dados principais de uma NFe"""
+        try:
+            nfe = parse_nfe_xml(xml_nfe)
 
             return {
-                'chave_acesso': chave,
-                'numero': ide.find('nfe:nNF', ns).text if ide.find('nfe:nNF', ns) is not None else '',
-                'serie': ide.find('nfe:serie', ns).text if ide.find('nfe:serie', ns) is not None else '',
-                'data_emissao': ide.find('nfe:dhEmi', ns).text if ide.find('nfe:dhEmi', ns) is not None else '',
-                'emit_cnpj': emit.find('.//nfe:CNPJ', ns).text if emit.find('.//nfe:CNPJ', ns) is not None else '',
-                'emit_nome': emit.find('.//nfe:xNome', ns).text if emit.find('.//nfe:xNome', ns) is not None else '',
-                'dest_cnpj': dest.find('.//nfe:CNPJ', ns).text if dest and dest.find('.//nfe:CNPJ', ns) is not None else '',
-                'dest_nome': dest.find('.//nfe:xNome', ns).text if dest and dest.find('.//nfe:xNome', ns) is not None else '',
-                'valor_total': total.find('nfe:vNF', ns).text if total and total.find('nfe:vNF', ns) is not None else '0',
+                'chave_acesso': nfe.chave_acesso,
+                'numero': nfe.numero_nf or '',
+                'serie': nfe.serie or '',
+                'data_emissao': nfe.data_emissao,
+                'emit_cnpj': nfe.emit_cnpj or '',
+                'emit_nome': nfe.emit_nome or '',
+                'dest_cnpj': nfe.dest_cnpj_cpf or '',
+                'dest_nome': nfe.dest_nome or '',
+                'valor_total': nfe.valor_total or 0,
                 'xml_completo': xml_nfe
             }
 
@@ -271,11 +459,7 @@ class SEFAZConsultaService:
 
     def _get_codigo_uf(self, uf: str) -> str:
         """Retorna código da UF para SEFAZ"""
-        codigos = {
-            'SP': '35', 'RJ': '33', 'MG': '31', 'RS': '43', 'PR': '41',
-            'SC': '42', 'BA': '29', 'PE': '26', 'CE': '23', 'GO': '52',
-        }
-        return codigos.get(uf, '35')
+        return CODIGO_POR_UF.get(uf, '35')
 
     def validar_certificado(self) -> Dict:
         """
@@ -302,3 +486,39 @@ class SEFAZConsultaService:
                 'valido': False,
                 'erro': str(e)
             }
+
+
+# Serviços por certificado: (id, data_atualizacao) -> SEFAZConsultaService
+_servicos = {}
+_servicos_lock = threading.Lock()
+
+
+def obter_servico(certificado) -> SEFAZConsultaService:
+    """
+    Retorna o serviço compartilhado do certificado no processo
+
+    O .pfx é decodificado e as conexões são abertas uma vez por certificado;
+    ao salvar o certificado (novo .pfx/senha) a data_atualizacao muda e o
+    serviço é recriado.
+    """
+    chave = (certificado.pk, certificado.data_atualizacao)
+    servico = _servicos.get(certificado.pk)
+    if servico is not None and servico[0] == chave:
+        return servico[1]
+
+    with _servicos_lock:
+        servico = _servicos.get(certificado.pk)
+        if servico is None or servico[0] != chave:
+            if servico is not None:
+                servico[1].fechar()
+            servico = (chave, SEFAZConsultaService(bytes(certificado.arquivo_pfx), certificado.senha_pfx))
+            _servicos[certificado.pk] = servico
+    return servico[1]
+
+
+def limpar_servicos():
+    """Fecha as sessões e descarta os serviços em cache"""
+    with _servicos_lock:
+        for _, servico in _servicos.values():
+            servico.fechar()
+        _servicos.clear()
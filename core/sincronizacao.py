@@ -0,0 +1,164 @@
+"""
+Sincronização incremental da distribuição DF-e por cursor de NSU
+
+Cada certificado/CNPJ guarda o último NSU processado (CursorNSU). A
+sincronização pede lotes a partir desse NSU até ultNSU == maxNSU, gravando
+os DocumentoConsultado de cada lote e o novo cursor na mesma transação:
+se o processo cair no meio, o próximo sync recomeça do último lote gravado.
+O cursor é travado (select_for_update) na gravação e só avança: duas
+sincronizações do mesmo certificado nunca fazem o NSU voltar.
+Um procNFe que chega depois do resNFe da mesma chave completa o registro
+(xml_completo/xml_baixado). Eventos de cancelamento do lote atualizam a
+situação das NFe já importadas.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .dedup import IndiceChaves
+from .distribuicao_dfe import CSTAT_DOCUMENTOS_LOCALIZADOS, CSTAT_NENHUM_DOCUMENTO, TIPOS_EVENTO
+from .models import NFe
+from .models_certificado import CursorNSU, DocumentoConsultado, ConsultaSEFAZ
+from .sefaz_service import SEFAZConsultaService, obter_servico
+
+# Segundos de espera pela resposta de cada lote
+TIMEOUT_LOTE = 60
+
+
+@dataclass
+class ResultadoSincronizacao:
+    """Totalizadores de uma sincronização"""
+
+    lotes: int = 0
+    documentos: int = 0
+    duplicados: int = 0
+    completados: int = 0  # resumos já gravados que receberam o procNFe
+    eventos: int = 0  # NFe com situação alterada por evento (cancelamento)
+    ult_nsu: str = ''
+    max_nsu: str = ''
+    duracoes: List[float] = field(default_factory=list)  # segundos por lote (consulta + gravação)
+
+
+def sincronizar_distribuicao(
+    consulta: ConsultaSEFAZ,
+    service: SEFAZConsultaService = None,
+    cnpj: str = None,
+    uf: str = 'SP',
+    max_lotes: int = None,
+    timeout: float = None,
+) -> ResultadoSincronizacao:
+    """
+    Busca os documentos novos desde o último NSU do certificado/CNPJ
+
+    Args:
+        consulta: ConsultaSEFAZ à qual os documentos serão vinculados
+        service: Serviço já inicializado (padrão: criado a partir do certificado)
+        cnpj: CNPJ interessado (padrão: CNPJ do certificado)
+        uf: UF do autor da consulta
+        max_lotes: Limite de lotes nesta execução (None = até sincronizar)
+        timeout: Segundos para a sincronização inteira; cada lote espera no máximo
+            o tempo restante e nenhum lote começa depois do prazo (None = sem prazo)
+
+    Returns:
+        ResultadoSincronizacao
+    """
+    certificado = consulta.certificado
+    cnpj = cnpj or certificado.cnpj
+    if service is None:
+        service = obter_servico(certificado)
+
+    cursor, _ = CursorNSU.objects.get_or_create(certificado=certificado, cnpj=cnpj)
+    resultado = ResultadoSincronizacao(ult_nsu=cursor.ult_nsu, max_nsu=cursor.max_nsu)
+    # Sem aquecer: um lote tem até 50 chaves, uma consulta por lote basta
+    indice = IndiceChaves([DocumentoConsultado])
+    indice_completos = IndiceChaves([DocumentoConsultado], filtros={'xml_baixado': True})
+
+    limite = None if timeout is None else time.monotonic() + timeout
+
+    while max_lotes is None or resultado.lotes < max_lotes:
+        espera = TIMEOUT_LOTE
+        if limite is not None:
+            espera = min(espera, limite - time.monotonic())
+            if espera <= 0:
+                break
+        inicio = time.perf_counter()
+        if resultado.lotes:
+            # Outra sincronização do certificado pode ter avançado o cursor
+            cursor.refresh_from_db(fields=['ult_nsu', 'max_nsu'])
+        retorno = service.consultar_distribuicao(
+            cnpj, cursor.ult_nsu, uf, ignorar=indice, ignorar_completos=indice_completos, timeout=espera
+        )
+
+        if retorno.cstat not in (CSTAT_DOCUMENTOS_LOCALIZADOS, CSTAT_NENHUM_DOCUMENTO):
+            raise Exception(f"SEFAZ rejeitou a consulta: {retorno.cstat} - {retorno.motivo}")
+
+        # chave -> documento do lote; o procNFe prevalece sobre o resNFe da mesma chave
+        documentos, eventos = {}, []
+        for doc in retorno.documentos:
+            if doc.duplicado:
+                resultado.duplicados += 1
+                continue
+            if doc.tipo in TIPOS_EVENTO and doc.registro is not None:
+                eventos.append(doc.registro)
+                continue
+            dados = service.dados_documento(doc)
+            if dados and dados['data_emissao']:
+                anterior = documentos.get(dados['chave_acesso'])
+                if anterior is not None:
+                    resultado.duplicados += 1
+                if anterior is None or (dados['xml_completo'] and not anterior.xml_baixado):
+                    documentos[dados['chave_acesso']] = _documento_consultado(consulta, cnpj, dados)
+        resumos = [d for d in documentos.values() if not d.xml_baixado]
+        completos_lote = [d for d in documentos.values() if d.xml_baixado]
+        # procNFe de chaves com resumo gravado: completa o registro em vez de contar como novo
+        completados = set(
+            DocumentoConsultado.objects.filter(
+                chave_acesso__in=[d.chave_acesso for d in completos_lote]
+            ).values_list('chave_acesso', flat=True)
+        ) if completos_lote else set()
+        novos = len(documentos) - len(completados)
+
+        with transaction.atomic():
+            DocumentoConsultado.objects.bulk_create(resumos, ignore_conflicts=True)
+            DocumentoConsultado.objects.bulk_create(
+                completos_lote, update_conflicts=True,
+                unique_fields=['chave_acesso'], update_fields=['xml_completo', 'xml_baixado'],
+            )
+            cursor = CursorNSU.objects.select_for_update().get(pk=cursor.pk)
+            if int(retorno.ult_nsu or 0) > int(cursor.ult_nsu or 0):
+                cursor.ult_nsu = retorno.ult_nsu
+            if int(retorno.max_nsu or 0) > int(cursor.max_nsu or 0):
+                cursor.max_nsu = retorno.max_nsu
+            cursor.save(update_fields=['ult_nsu', 'max_nsu', 'data_atualizacao'])
+            if eventos:
+                resultado.eventos += NFe.objects.aplicar_eventos(eventos).atualizados
+            if novos:
+                ConsultaSEFAZ.objects.filter(pk=consulta.pk).update(
+                    total_encontrados=F('total_encontrados') + novos
+                )
+
+        resultado.lotes += 1
+        resultado.duracoes.append(time.perf_counter() - inicio)
+        resultado.documentos += novos
+        resultado.completados += len(completados)
+        resultado.ult_nsu, resultado.max_nsu = cursor.ult_nsu, cursor.max_nsu
+
+        if retorno.sincronizado:
+            break
+
+    certificado.ultima_consulta = timezone.now()
+    certificado.save(update_fields=['ultima_consulta'])
+    return resultado
+
+
+def _documento_consultado(consulta, cnpj, dados) -> DocumentoConsultado:
+    return DocumentoConsultado(
+        consulta=consulta,
+        papel_cnpj='EMITENTE' if dados['emit_cnpj'] == cnpj else 'DESTINATARIO',
+        xml_baixado=bool(dados['xml_completo']),
+        **dados,
+    )
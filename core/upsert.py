@@ -0,0 +1,191 @@
+"""
+Atualização em massa da situação de NFe/CTe (status, protocolo, motivo)
+
+Cancelamentos, denegações e reautorizações chegam em lotes grandes (eventos
+da distribuição DF-e, reprocessamentos). Em vez de um save() por documento,
+cada lote faz um SELECT das situações atuais e um único INSERT ... ON
+CONFLICT DO UPDATE (bulk_create com update_conflicts) só com as linhas que
+mudaram.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, Union
+
+from django.db import connections, models, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from .xml_parser import EventoNFeRegistro, STATUS_POR_CSTAT, parse_evento_nfe_xml
+
+# cStat do retEvento: evento registrado (135), registrado fora do prazo/sem vínculo (136, 155)
+CSTAT_EVENTO_REGISTRADO = ('135', '136', '155')
+
+# tpEvento -> nova situação do documento
+STATUS_POR_EVENTO = {
+    '110111': STATUS_POR_CSTAT['135'],  # cancelamento
+    '110112': STATUS_POR_CSTAT['135'],  # cancelamento por substituição
+}
+
+
+@dataclass
+class ResultadoUpsert:
+    """Contagens de um upsert de situações"""
+
+    inseridos: int = 0
+    atualizados: int = 0
+    inalterados: int = 0
+    ausentes: int = 0  # chaves inexistentes com criar=False
+
+    def __add__(self, outro: 'ResultadoUpsert') -> 'ResultadoUpsert':
+        return ResultadoUpsert(
+            self.inseridos + outro.inseridos,
+            self.atualizados + outro.atualizados,
+            self.inalterados + outro.inalterados,
+            self.ausentes + outro.ausentes,
+        )
+
+
+def _lotes(itens, tamanho):
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class DocumentoFiscalQuerySet(models.QuerySet):
+    """QuerySet de NFe/CTe com upsert da situação (o model define CAMPO_STATUS)"""
+
+    @property
+    def campos_situacao(self):
+        return (self.model.CAMPO_STATUS, 'protocolo', 'motivo')
+
+    def upsert_situacoes(
+        self, registros: Iterable[Union[Dict, object]], criar: bool = True, tamanho_lote: int = 2000
+    ) -> ResultadoUpsert:
+        """
+        Aplica em massa mudanças de situação
+
+        Args:
+            registros: Dicts (ou registros do parser) com chave_acesso e os campos de
+                situação a alterar; com criar, os demais campos entram na inserção
+            criar: Insere as chaves ainda não gravadas (False = só conta como ausentes)
+            tamanho_lote: Chaves por SELECT/upsert
+        """
+        resultado = ResultadoUpsert()
+        for lote in _lotes(registros, tamanho_lote):
+            resultado += self._upsert_lote(lote, criar)
+        return resultado
+
+    def _upsert_lote(self, lote, criar) -> ResultadoUpsert:
+        campos = self.campos_situacao
+        por_chave = {}
+        for registro in lote:
+            dados = dict(registro) if isinstance(registro, dict) else registro.campos()
+            dados.pop('xml_content', None)  # XML fica em NFeXML/CTeXML
+            por_chave[dados['chave_acesso']] = dados  # repetidas no lote: vale a última
+
+        atuais = {
+            linha[0]: linha[1:]
+            for linha in self.filter(chave_acesso__in=list(por_chave)).values_list('chave_acesso', *campos)
+        }
+
+        resultado = ResultadoUpsert()
+        novos, alterados = [], []
+        for chave, dados in por_chave.items():
+            atual = atuais.get(chave)
+            if atual is None:
+                if criar:
+                    novos.append(self.model(**dados))
+                else:
+                    resultado.ausentes += 1
+                continue
+            # Campo de situação não informado mantém o valor gravado
+            novo = tuple(dados.get(campo, valor) for campo, valor in zip(campos, atual))
+            if novo == atual:
+                resultado.inalterados += 1
+            else:
+                alterados.append((chave,) + novo)
+
+        # Importados aqui: estatisticas e versoes importam os models
+        from .estatisticas import registrar_documentos
+        from .versoes import incrementar_versao
+
+        with transaction.atomic(using=self.db):
+            if novos:
+                # registrar_documentos também incrementa a versão do modelo
+                self.bulk_create(novos, update_conflicts=True, unique_fields=self._unicos(), update_fields=list(campos))
+                registrar_documentos(self.model.__name__, novos)
+            if alterados:
+                self._upsert_situacao(alterados)
+                incrementar_versao(self.model.__name__)
+        resultado.inseridos = len(novos)
+        resultado.atualizados = len(alterados)
+        return resultado
+
+    def _unicos(self):
+        # MySQL não aceita unique_fields (ON DUPLICATE KEY usa qualquer chave única)
+        if connections[self.db].features.supports_update_conflicts_with_target:
+            return ['chave_acesso']
+        return None
+
+    def _upsert_situacao(self, linhas):
+        """
+        INSERT ... ON CONFLICT DO UPDATE só com chave e campos de situação
+
+        bulk_create enviaria todas as colunas do documento; aqui cada linha leva
+        só o necessário para o UPDATE (data_importacao é a única outra NOT NULL).
+        """
+        conexao = connections[self.db]
+        opcoes = self.model._meta
+        situacao = [opcoes.get_field(nome) for nome in self.campos_situacao]
+        campos = [opcoes.get_field('chave_acesso'), opcoes.get_field('data_importacao')] + situacao
+        unicos = [opcoes.get_field(nome).column for nome in self._unicos() or ()]
+        sufixo = conexao.ops.on_conflict_suffix_sql(
+            campos, OnConflict.UPDATE, [campo.column for campo in situacao], unicos
+        )
+
+        qn = conexao.ops.quote_name
+        colunas = ', '.join(qn(campo.column) for campo in campos)
+        marcadores = '(' + ', '.join(['%s'] * len(campos)) + ')'
+        agora = opcoes.get_field('data_importacao').get_db_prep_save(timezone.now(), conexao)
+        tamanho = max(1, conexao.ops.bulk_batch_size(campos, linhas))
+
+        with conexao.cursor() as cursor:
+            for inicio in range(0, len(linhas), tamanho):
+                lote = linhas[inicio:inicio + tamanho]
+                parametros = []
+                for chave, *valores in lote:
+                    parametros += [chave, agora, *valores]
+                cursor.execute(
+                    f"INSERT INTO {qn(opcoes.db_table)} ({colunas}) "
+                    f"VALUES {', '.join([marcadores] * len(lote))} {sufixo}",
+                    parametros,
+                )
+
+    def aplicar_eventos(self, eventos: Iterable, tamanho_lote: int = 2000) -> ResultadoUpsert:
+        """
+        Aplica eventos (procEventoNFe/resEvento) que mudam a situação, como o cancelamento
+
+        Args:
+            eventos: EventoNFeRegistro ou XML dos eventos; os que não mudam a situação
+                (CC-e, manifestação) ou não foram registrados são ignorados
+        """
+        def situacoes():
+            for evento in eventos:
+                if not isinstance(evento, EventoNFeRegistro):
+                    evento = parse_evento_nfe_xml(evento)
+                status = STATUS_POR_EVENTO.get(evento.tipo_evento)
+                # resEvento não traz cStat: só é distribuído depois de registrado
+                if status is None or evento.cstat not in (None,) + CSTAT_EVENTO_REGISTRADO:
+                    continue
+                yield {
+                    'chave_acesso': evento.chave_acesso,
+                    self.model.CAMPO_STATUS: status,
+                    'protocolo': evento.protocolo,
+                    'motivo': evento.justificativa or evento.descricao,
+                }
+
+        return self.upsert_situacoes(situacoes(), criar=False, tamanho_lote=tamanho_lote)
@@ -0,0 +1,47 @@
+"""
+Versões dos dados para validação condicional (ETag/Last-Modified)
+
+Cada conjunto (NFe, CTe, ImportLog) tem um contador em VersaoDados
+incrementado na mesma transação que altera os dados: importações, upserts
+de situação, gravação de logs e, via signals, save/delete individuais.
+Ler as versões é uma consulta por chave primária, barata o bastante para
+rodar antes de qualquer agregação.
+"""
+from typing import Dict, Iterable, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import VersaoDados
+
+
+def incrementar_versao(*nomes: str):
+    """Soma 1 à versão dos conjuntos informados (dentro da transação corrente)"""
+    agora = timezone.now()
+    for nome in nomes:
+        if VersaoDados.objects.filter(nome=nome).update(versao=F('versao') + 1, alterado_em=agora):
+            continue
+        try:
+            with transaction.atomic():
+                VersaoDados.objects.create(nome=nome, versao=1, alterado_em=agora)
+        except IntegrityError:
+            VersaoDados.objects.filter(nome=nome).update(versao=F('versao') + 1, alterado_em=agora)
+
+
+def versoes(nomes: Iterable[str]) -> Dict[str, Tuple[int, object]]:
+    """{nome: (versão, alterado_em)}; conjuntos nunca alterados vêm como (0, None)"""
+    nomes = list(nomes)
+    atuais = {
+        nome: (versao, alterado_em)
+        for nome, versao, alterado_em in VersaoDados.objects.filter(nome__in=nomes)
+        .values_list('nome', 'versao', 'alterado_em')
+    }
+    return {nome: atuais.get(nome, (0, None)) for nome in nomes}
+
+
+def incrementar_por_signal(sender, **kwargs):
+    """post_save/post_delete de NFe e CTe (bulk_create/upserts incrementam explicitamente)"""
+    if kwargs.get('raw'):
+        return
+    incrementar_versao(sender.__name__)
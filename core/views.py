@@ -6,10 +6,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
-from django.core.paginator import Paginator
-from .models import NFe, NFeItem, CTe, ImportLog
-from datetime import datetime, timedelta
+from django.db.models import Sum
+from .models import NFe, CTe, ImportLog
+from .busca import filtro_busca
+from .estatisticas import resumo_analiticos, resumo_dashboard
+from .paginacao import CursorInvalido, paginar
+
+# Ordenações aceitas em ?ordem= (campos indexados ou pequenos; o id desempata no cursor)
+ORDENS_NFE = ('-data_emissao', 'data_emissao', '-valor_total', 'valor_total', '-numero_nf', 'numero_nf')
+ORDENS_CTE = ('-data_emissao', 'data_emissao', '-valor_total', 'valor_total', '-numero_ct', 'numero_ct')
+
+
+def _ordem(request, permitidas):
+    """?ordem= se estiver entre as permitidas; senão a primeira (padrão)"""
+    ordem = request.GET.get('ordem', '')
+    return ordem if ordem in permitidas else permitidas[0]
 
 
 def login_view(request):
@@ -37,49 +48,38 @@ def logout_view(request):
     return redirect('login')
 
 
+def _pagina(request, queryset, tamanho):
+    """Página por cursor (?cursor=); cursor inválido volta à primeira página"""
+    try:
+        return paginar(queryset, request.GET.get('cursor'), tamanho, estimar=True)
+    except CursorInvalido:
+        return paginar(queryset, None, tamanho, estimar=True)
+
+
 @login_required
 def dashboard(request):
     """Dashboard principal com estatísticas mobile-first"""
 
-    # Período padrão: últimos 30 dias
-    data_inicio = datetime.now() - timedelta(days=30)
-
-    # Estatísticas NFe
-    nfe_stats = {
-        'total': NFe.objects.count(),
-        'mes_atual': NFe.objects.filter(data_emissao__gte=data_inicio).count(),
-        'valor_total': NFe.objects.aggregate(Sum('valor_total'))['valor_total__sum'] or 0,
-        'valor_mes': NFe.objects.filter(
-            data_emissao__gte=data_inicio
-        ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0,
-    }
-
-    # Estatísticas CTe
-    cte_stats = {
-        'total': CTe.objects.count(),
-        'mes_atual': CTe.objects.filter(data_emissao__gte=data_inicio).count(),
-        'valor_total': CTe.objects.aggregate(Sum('valor_total'))['valor_total__sum'] or 0,
-        'valor_mes': CTe.objects.filter(
-            data_emissao__gte=data_inicio
-        ).aggregate(Sum('valor_total'))['valor_total__sum'] or 0,
-    }
+    # Totais e top emitentes vêm das tabelas de resumo (em cache)
+    resumo = resumo_dashboard()
+    nfe_stats = resumo['nfe_stats']
+    cte_stats = resumo['cte_stats']
 
     # Últimas importações
     ultimos_logs = ImportLog.objects.select_related('usuario').order_by('-data_importacao')[:10]
 
     # Top 5 emitentes NFe
-    top_emitentes = NFe.objects.values(
-        'emit_cnpj', 'emit_nome'
-    ).annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-total')[:5]
+    top_emitentes = resumo['top_emitentes']
 
     # Últimas NFes
-    ultimas_nfes = NFe.objects.select_related('usuario_importacao').order_by('-data_emissao')[:5]
+    ultimas_nfes = NFe.objects.select_related('usuario_importacao').only(
+        *NFe.CAMPOS_LISTAGEM, 'usuario_importacao__username'
+    ).order_by('-data_emissao')[:5]
 
     # Últimos CTes
-    ultimos_ctes = CTe.objects.select_related('usuario_importacao').order_by('-data_emissao')[:5]
+    ultimos_ctes = CTe.objects.select_related('usuario_importacao').only(
+        *CTe.CAMPOS_LISTAGEM, 'usuario_importacao__username'
+    ).order_by('-data_emissao')[:5]
 
     context = {
         'nfe_stats': nfe_stats,
@@ -97,17 +97,12 @@ def dashboard(request):
 def nfe_list(request):
     """Lista de NFes com filtros e paginação mobile-first"""
 
-    # Filtros
-    nfes = NFe.objects.all()
+    # Filtros (só as colunas exibidas na lista)
+    nfes = NFe.objects.only(*NFe.CAMPOS_LISTAGEM)
 
     search = request.GET.get('search', '')
     if search:
-        nfes = nfes.filter(
-            Q(numero_nf__icontains=search) |
-            Q(emit_nome__icontains=search) |
-            Q(dest_nome__icontains=search) |
-            Q(chave_acesso__icontains=search)
-        )
+        nfes = nfes.filter(filtro_busca(NFe, search))
 
     emit_cnpj = request.GET.get('emit_cnpj', '')
     if emit_cnpj:
@@ -122,13 +117,10 @@ def nfe_list(request):
         nfes = nfes.filter(data_emissao__lte=data_fim)
 
     # Ordenação
-    ordem = request.GET.get('ordem', '-data_emissao')
-    nfes = nfes.order_by(ordem)
+    nfes = nfes.order_by(_ordem(request, ORDENS_NFE))
 
-    # Paginação
-    paginator = Paginator(nfes, 20)
-    page = request.GET.get('page', 1)
-    nfes_page = paginator.get_page(page)
+    # Paginação por cursor (sem COUNT/OFFSET)
+    nfes_page = _pagina(request, nfes, 20)
 
     # Totalizadores
     totais = nfes.aggregate(
@@ -150,8 +142,8 @@ def nfe_list(request):
 @login_required
 def nfe_detail(request, pk):
     """Detalhes de uma NFe mobile-first"""
-    nfe = get_object_or_404(NFe, pk=pk)
-    itens = nfe.itens.all()
+    nfe = get_object_or_404(NFe.objects.prefetch_related('itens'), pk=pk)
+    itens = nfe.itens.all()  # já carregados pelo prefetch
 
     context = {
         'nfe': nfe,
@@ -165,26 +157,18 @@ def nfe_detail(request, pk):
 def cte_list(request):
     """Lista de CTes com filtros e paginação mobile-first"""
 
-    # Filtros
-    ctes = CTe.objects.all()
+    # Filtros (só as colunas exibidas na lista)
+    ctes = CTe.objects.only(*CTe.CAMPOS_LISTAGEM)
 
     search = request.GET.get('search', '')
     if search:
-        ctes = ctes.filter(
-            Q(numero_ct__icontains=search) |
-            Q(emit_nome__icontains=search) |
-            Q(dest_nome__icontains=search) |
-            Q(chave_acesso__icontains=search)
-        )
+        ctes = ctes.filter(filtro_busca(CTe, search))
 
     # Ordenação
-    ordem = request.GET.get('ordem', '-data_emissao')
-    ctes = ctes.order_by(ordem)
+    ctes = ctes.order_by(_ordem(request, ORDENS_CTE))
 
-    # Paginação
-    paginator = Paginator(ctes, 20)
-    page = request.GET.get('page', 1)
-    ctes_page = paginator.get_page(page)
+    # Paginação por cursor (sem COUNT/OFFSET)
+    ctes_page = _pagina(request, ctes, 20)
 
     # Totalizadores
     totais = ctes.aggregate(
@@ -229,14 +213,12 @@ def import_logs(request):
     if status:
         logs = logs.filter(status=status)
 
-    # Paginação
-    paginator = Paginator(logs, 50)
-    page = request.GET.get('page', 1)
-    logs_page = paginator.get_page(page)
+    # Paginação por cursor (sem COUNT/OFFSET)
+    logs_page = _pagina(request, logs, 50)
 
     # Estatísticas
     stats = ImportLog.objects.values('tipo_documento', 'status').annotate(
-        total=Count('id')
+        total=Sum('quantidade')
     )
 
     context = {
@@ -253,31 +235,11 @@ def import_logs(request):
 def analytics(request):
     """Análises e relatórios mobile-first"""
 
-    # Vendas por mês (NFe)
-    from django.db.models.functions import TruncMonth
-
-    vendas_mes = NFe.objects.annotate(
-        mes=TruncMonth('data_emissao')
-    ).values('mes').annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-mes')[:12]
-
-    # Top produtos (mais vendidos)
-    top_produtos = NFeItem.objects.values(
-        'codigo_produto', 'descricao'
-    ).annotate(
-        qtd_total=Sum('quantidade'),
-        valor_total=Sum('valor_total')
-    ).order_by('-qtd_total')[:10]
-
-    # Rotas mais usadas (CTe)
-    top_rotas = CTe.objects.values(
-        'municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim'
-    ).annotate(
-        total=Count('id'),
-        valor=Sum('valor_total')
-    ).order_by('-total')[:10]
+    # Rankings e vendas por mês vêm dos resumos diários
+    resumo = resumo_analiticos()
+    vendas_mes = resumo['vendas_por_mes']
+    top_produtos = resumo['top_produtos']
+    top_rotas = resumo['top_rotas']
 
     context = {
         'vendas_mes': vendas_mes,
@@ -6,6 +6,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+from django.utils import timezone
 from datetime import datetime, timedelta
 from .models_certificado import (
     CertificadoDigital, ConsultaSEFAZ,
@@ -95,13 +96,10 @@ def consulta_sefaz(request, certificado_id):
                 tipo_documento=tipo_doc,
                 data_inicio=data_inicio,
                 data_fim=data_fim,
-                status='PROCESSANDO'
+                status='PENDENTE'
             )
 
-            # Iniciar consulta em background (ou síncrona para teste)
-            from django.core.management import call_command
-            # call_command('processar_consulta_sefaz', consulta.id)
-
+            # Processada pelo worker em background (manage.py sefaz_worker)
             messages.success(request, 'Consulta iniciada! Aguarde o processamento.')
             return redirect('consulta_resultado', consulta_id=consulta.id)
 
@@ -130,34 +128,30 @@ def consulta_resultado(request, consulta_id):
         messages.error(request, 'Acesso negado')
         return redirect('certificados_list')
 
-    # Documentos por papel
-    docs_emitente = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    # Documentos por papel (sem o XML completo, que só é lido na importação)
+    documentos = DocumentoConsultado.objects.filter(consulta=consulta).defer('xml_completo')
+
+    docs_emitente = documentos.filter(
         papel_cnpj='EMITENTE'
     )
 
-    docs_destinatario = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    docs_destinatario = documentos.filter(
         papel_cnpj='DESTINATARIO'
     )
 
-    docs_transportador = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    docs_transportador = documentos.filter(
         papel_cnpj='TRANSPORTADOR'
     )
 
-    docs_tomador = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    docs_tomador = documentos.filter(
         papel_cnpj='TOMADOR'
     )
 
-    docs_remetente = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    docs_remetente = documentos.filter(
         papel_cnpj='REMETENTE'
     )
 
-    docs_recebedor = DocumentoConsultado.objects.filter(
-        consulta=consulta,
+    docs_recebedor = documentos.filter(
         papel_cnpj='RECEBEDOR'
     )
 
@@ -201,16 +195,39 @@ def importar_documento(request, documento_id):
     try:
         # Importar para NFe ou CTe
         if documento.consulta.tipo_documento == 'NFE':
+            import io
+            from django.conf import settings
+            from django.db import transaction
             from .models import NFe, NFeItem
+            from .importacao import importar_nfe_streaming
+            from .estatisticas import registrar_itens
             from .xml_parser import parse_nfe_xml
 
-            # Parsear XML e criar NFe
-            dados = parse_nfe_xml(documento.xml_completo)
-            # Criar NFe no banco...
+            xml = documento.xml_completo
+            streaming = (
+                request.POST.get('streaming') == '1'
+                or len(xml) > getattr(settings, 'XML_STREAMING_LIMITE', 0) > 0
+            )
 
-            documento.importado = True
-            documento.data_importacao = datetime.now()
-            documento.save()
+            with transaction.atomic():
+                if streaming:
+                    # NFes grandes: itens gravados em lotes sem montar a árvore inteira
+                    importar_nfe_streaming(io.StringIO(xml), usuario=request.user, xml_content=xml)
+                else:
+                    registro = parse_nfe_xml(xml)
+                    nfe = NFe.objects.create(
+                        **registro.campos(),
+                        xml_content=xml,
+                        usuario_importacao=request.user,
+                    )
+                    itens = NFeItem.objects.bulk_create([
+                        NFeItem(nfe=nfe, **item.campos()) for item in registro.itens
+                    ])
+                    registrar_itens(nfe, itens)
+
+                documento.importado = True
+                documento.data_importacao = timezone.now()
+                documento.save()
 
             return JsonResponse({'sucesso': True, 'mensagem': 'Documento importado!'})
 
@@ -0,0 +1,540 @@
+"""
+Parser de XMLs fiscais (NFe e CTe)
+Converte o XML autorizado nos campos dos models NFe, NFeItem e CTe
+
+Os caminhos de cada campo são compilados uma única vez em tabelas aninhadas
+por tag qualificada; o documento é percorrido uma vez, visitando apenas os
+grupos mapeados (infAdic, transp, pag etc. são ignorados sem busca).
+"""
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional
+
+NS_NFE = 'http://www.portalfiscal.inf.br/nfe'
+NS_CTE = 'http://www.portalfiscal.inf.br/cte'
+
+# Situação do documento a partir do cStat do protocolo
+STATUS_POR_CSTAT = {
+    '100': 'autorizada',
+    '101': 'cancelada',
+    '135': 'cancelada',
+    '151': 'cancelada',
+    '110': 'denegada',
+    '301': 'denegada',
+    '302': 'denegada',
+}
+
+
+def detectar_tipo(xml) -> Optional[str]:
+    """Retorna 'NFe' ou 'CTe' conforme o namespace do documento"""
+    inicio = xml[:2048]
+    if isinstance(inicio, bytes):
+        inicio = inicio.decode('utf-8', errors='ignore')
+    if NS_NFE in inicio:
+        return 'NFe'
+    if NS_CTE in inicio:
+        return 'CTe'
+    return None
+
+
+def _decimal(valor):
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        return None
+
+
+def _data(valor):
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        return None
+
+
+# ============================================================
+# Registros
+# ============================================================
+
+class _Registro:
+    """Base dos registros: atributos fixos (__slots__) com os campos do model"""
+
+    __slots__ = ()
+    CAMPOS = ()
+
+    def __init__(self, **valores):
+        for campo in self.__slots__:
+            setattr(self, campo, None)
+        for campo, valor in valores.items():
+            setattr(self, campo, valor)
+
+    def campos(self) -> Dict:
+        """Dict com os campos do model, pronto para Model(**registro.campos())"""
+        return {campo: getattr(self, campo) for campo in self.CAMPOS}
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.campos()!r}>"
+
+
+class NFeItemRegistro(_Registro):
+    """Item (det) de uma NFe"""
+
+    CAMPOS = (
+        'numero_item', 'codigo_produto', 'descricao', 'ncm', 'cfop', 'cest', 'unidade',
+        'quantidade', 'valor_unitario', 'valor_total', 'ean',
+        'valor_icms', 'valor_ipi', 'valor_pis', 'valor_cofins',
+    )
+    __slots__ = CAMPOS
+
+
+class NFeRegistro(_Registro):
+    """Cabeçalho, emitente, destinatário, totais e protocolo de uma NFe"""
+
+    CAMPOS = (
+        'chave_acesso', 'numero_nf', 'serie', 'data_emissao',
+        'emit_cnpj', 'emit_nome', 'emit_fantasia', 'emit_ie', 'emit_endereco',
+        'emit_municipio', 'emit_uf', 'emit_cep',
+        'dest_cnpj_cpf', 'dest_nome', 'dest_ie', 'dest_endereco',
+        'dest_municipio', 'dest_uf', 'dest_cep',
+        'valor_total', 'valor_produtos', 'valor_icms', 'valor_ipi',
+        'valor_pis', 'valor_cofins', 'valor_tributos',
+        'status_nfe', 'protocolo', 'motivo',
+    )
+    __slots__ = CAMPOS + ('itens',)
+
+    def __init__(self, **valores):
+        super().__init__(**valores)
+        if self.itens is None:
+            self.itens = []
+
+
+class CTeRegistro(_Registro):
+    """Dados de um CTe"""
+
+    CAMPOS = (
+        'chave_acesso', 'numero_ct', 'serie', 'data_emissao',
+        'emit_cnpj', 'emit_nome', 'emit_fantasia', 'emit_ie', 'emit_endereco',
+        'emit_municipio', 'emit_uf',
+        'rem_cnpj', 'rem_nome', 'rem_ie', 'rem_municipio', 'rem_uf',
+        'dest_cnpj', 'dest_nome', 'dest_ie', 'dest_municipio', 'dest_uf',
+        'modal', 'tipo_servico', 'cfop', 'natureza_operacao',
+        'municipio_inicio', 'uf_inicio', 'municipio_fim', 'uf_fim',
+        'valor_total', 'valor_receber', 'valor_carga', 'valor_icms',
+        'status_cte', 'protocolo', 'motivo',
+    )
+    __slots__ = CAMPOS
+
+
+class ResumoNFeRegistro(_Registro):
+    """Resumo de NFe (resNFe) entregue pela distribuição DF-e"""
+
+    CAMPOS = (
+        'chave_acesso', 'emit_cnpj', 'emit_nome', 'emit_ie', 'data_emissao', 'tipo_nf',
+        'valor_total', 'protocolo', 'data_recebimento', 'situacao',
+    )
+    __slots__ = CAMPOS
+
+
+class EventoNFeRegistro(_Registro):
+    """Evento de NFe (procEventoNFe ou resEvento): cancelamento, CC-e, manifestação..."""
+
+    CAMPOS = (
+        'chave_acesso', 'autor_cnpj', 'tipo_evento', 'sequencia', 'data_evento', 'descricao',
+        'justificativa', 'cstat', 'motivo', 'protocolo', 'data_registro',
+    )
+    __slots__ = CAMPOS
+
+
+# ============================================================
+# Mapeamento caminho -> campo
+# ============================================================
+
+# Destinos dos valores
+_DOC, _ITEM, _END_EMIT, _END_DEST = range(4)
+
+# Partes que compõem emit_endereco/dest_endereco
+_PARTES_ENDERECO = ('xLgr', 'nro', 'xCpl', 'xBairro')
+
+
+def _compilar(destino, base, campos):
+    """Monta {caminho: (destino, campo, conversor)} para um grupo"""
+    return {f'{base}/{tag}': (destino, campo, conv) for tag, (campo, conv) in campos.items()}
+
+
+_MAPA_NFE = {}
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/ide', {
+    'nNF': ('numero_nf', None), 'serie': ('serie', None), 'dhEmi': ('data_emissao', _data),
+}))
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/emit', {
+    'CNPJ': ('emit_cnpj', None), 'CPF': ('emit_cnpj', None), 'xNome': ('emit_nome', None),
+    'xFant': ('emit_fantasia', None), 'IE': ('emit_ie', None),
+}))
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/emit/enderEmit', {
+    'xMun': ('emit_municipio', None), 'UF': ('emit_uf', None), 'CEP': ('emit_cep', None),
+}))
+_MAPA_NFE.update(_compilar(_END_EMIT, 'infNFe/emit/enderEmit', {p: (p, None) for p in _PARTES_ENDERECO}))
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/dest', {
+    'CNPJ': ('dest_cnpj_cpf', None), 'CPF': ('dest_cnpj_cpf', None), 'xNome': ('dest_nome', None),
+    'IE': ('dest_ie', None),
+}))
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/dest/enderDest', {
+    'xMun': ('dest_municipio', None), 'UF': ('dest_uf', None), 'CEP': ('dest_cep', None),
+}))
+_MAPA_NFE.update(_compilar(_END_DEST, 'infNFe/dest/enderDest', {p: (p, None) for p in _PARTES_ENDERECO}))
+_MAPA_NFE.update(_compilar(_DOC, 'infNFe/total/ICMSTot', {
+    'vNF': ('valor_total', _decimal), 'vProd': ('valor_produtos', _decimal), 'vICMS': ('valor_icms', _decimal),
+    'vIPI': ('valor_ipi', _decimal), 'vPIS': ('valor_pis', _decimal), 'vCOFINS': ('valor_cofins', _decimal),
+    'vTotTrib': ('valor_tributos', _decimal),
+}))
+_MAPA_NFE.update(_compilar(_DOC, 'protNFe/infProt', {
+    'cStat': ('status_nfe', None), 'nProt': ('protocolo', None), 'xMotivo': ('motivo', None),
+}))
+_MAPA_NFE.update(_compilar(_ITEM, 'infNFe/det/prod', {
+    'cProd': ('codigo_produto', None), 'xProd': ('descricao', None), 'NCM': ('ncm', None),
+    'CFOP': ('cfop', None), 'CEST': ('cest', None), 'uCom': ('unidade', None),
+    'qCom': ('quantidade', _decimal), 'vUnCom': ('valor_unitario', _decimal),
+    'vProd': ('valor_total', _decimal), 'cEAN': ('ean', None),
+}))
+# Grupos de imposto têm um nível variável (ICMS00, ICMSSN102, IPITrib...) representado por '*'
+_MAPA_NFE.update({
+    'infNFe/det/imposto/ICMS/*/vICMS': (_ITEM, 'valor_icms', _decimal),
+    'infNFe/det/imposto/IPI/*/vIPI': (_ITEM, 'valor_ipi', _decimal),
+    'infNFe/det/imposto/PIS/*/vPIS': (_ITEM, 'valor_pis', _decimal),
+    'infNFe/det/imposto/COFINS/*/vCOFINS': (_ITEM, 'valor_cofins', _decimal),
+})
+
+_MAPA_CTE = {}
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/ide', {
+    'nCT': ('numero_ct', None), 'serie': ('serie', None), 'dhEmi': ('data_emissao', _data),
+    'modal': ('modal', None), 'tpServ': ('tipo_servico', None), 'CFOP': ('cfop', None),
+    'natOp': ('natureza_operacao', None), 'xMunIni': ('municipio_inicio', None), 'UFIni': ('uf_inicio', None),
+    'xMunFim': ('municipio_fim', None), 'UFFim': ('uf_fim', None),
+}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/emit', {
+    'CNPJ': ('emit_cnpj', None), 'xNome': ('emit_nome', None), 'xFant': ('emit_fantasia', None),
+    'IE': ('emit_ie', None),
+}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/emit/enderEmit', {'xMun': ('emit_municipio', None), 'UF': ('emit_uf', None)}))
+_MAPA_CTE.update(_compilar(_END_EMIT, 'infCte/emit/enderEmit', {p: (p, None) for p in _PARTES_ENDERECO}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/rem', {
+    'CNPJ': ('rem_cnpj', None), 'CPF': ('rem_cnpj', None), 'xNome': ('rem_nome', None), 'IE': ('rem_ie', None),
+}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/rem/enderReme', {'xMun': ('rem_municipio', None), 'UF': ('rem_uf', None)}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/dest', {
+    'CNPJ': ('dest_cnpj', None), 'CPF': ('dest_cnpj', None), 'xNome': ('dest_nome', None), 'IE': ('dest_ie', None),
+}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/dest/enderDest', {'xMun': ('dest_municipio', None), 'UF': ('dest_uf', None)}))
+_MAPA_CTE.update(_compilar(_DOC, 'infCte/vPrest', {
+    'vTPrest': ('valor_total', _decimal), 'vRec': ('valor_receber', _decimal),
+}))
+_MAPA_CTE.update({
+    'infCte/infCTeNorm/infCarga/vCarga': (_DOC, 'valor_carga', _decimal),
+    'infCte/imp/ICMS/*/vICMS': (_DOC, 'valor_icms', _decimal),
+})
+_MAPA_CTE.update(_compilar(_DOC, 'protCTe/infProt', {
+    'cStat': ('status_cte', None), 'nProt': ('protocolo', None), 'xMotivo': ('motivo', None),
+}))
+
+
+_MAPA_RES_NFE = _compilar(_DOC, 'resNFe', {
+    'chNFe': ('chave_acesso', None), 'CNPJ': ('emit_cnpj', None), 'CPF': ('emit_cnpj', None),
+    'xNome': ('emit_nome', None), 'IE': ('emit_ie', None), 'dhEmi': ('data_emissao', _data),
+    'tpNF': ('tipo_nf', None), 'vNF': ('valor_total', _decimal), 'nProt': ('protocolo', None),
+    'dhRecbto': ('data_recebimento', _data), 'cSitNFe': ('situacao', None),
+})
+
+_MAPA_EVENTO = {}
+_MAPA_EVENTO.update(_compilar(_DOC, 'procEventoNFe/evento/infEvento', {
+    'chNFe': ('chave_acesso', None), 'CNPJ': ('autor_cnpj', None), 'CPF': ('autor_cnpj', None),
+    'tpEvento': ('tipo_evento', None), 'nSeqEvento': ('sequencia', int), 'dhEvento': ('data_evento', _data),
+}))
+_MAPA_EVENTO.update(_compilar(_DOC, 'procEventoNFe/evento/infEvento/detEvento', {
+    'descEvento': ('descricao', None), 'xJust': ('justificativa', None),
+}))
+_MAPA_EVENTO.update(_compilar(_DOC, 'procEventoNFe/retEvento/infEvento', {
+    'cStat': ('cstat', None), 'xMotivo': ('motivo', None), 'nProt': ('protocolo', None),
+    'dhRegEvento': ('data_registro', _data),
+}))
+_MAPA_EVENTO.update(_compilar(_DOC, 'resEvento', {
+    'chNFe': ('chave_acesso', None), 'CNPJ': ('autor_cnpj', None), 'CPF': ('autor_cnpj', None),
+    'tpEvento': ('tipo_evento', None), 'nSeqEvento': ('sequencia', int), 'dhEvento': ('data_evento', _data),
+    'xEvento': ('descricao', None), 'nProt': ('protocolo', None), 'dhRecbto': ('data_registro', _data),
+}))
+
+
+def _compilar_arvore(mapa, ns, raiz):
+    """Converte {'infNFe/ide/nNF': alvo} em tabelas aninhadas por tag qualificada"""
+    arvore = {}
+    prefixo = raiz + '/'
+    for caminho, alvo in mapa.items():
+        if not caminho.startswith(prefixo):
+            continue
+        partes = caminho[len(prefixo):].split('/')
+        no = arvore
+        for parte in partes[:-1]:
+            no = no.setdefault(parte if parte == '*' else f'{{{ns}}}{parte}', {})
+        no[f'{{{ns}}}{partes[-1]}'] = alvo
+    return arvore
+
+
+# ============================================================
+# Leitores
+# ============================================================
+
+class _Leitor:
+    """Percorre os grupos mapeados do documento preenchendo o registro"""
+
+    NS = ''
+    RAIZ = ''
+    PROTOCOLO = ''
+    TAG_ITEM = None
+    STATUS = ''
+    ARVORE = {}
+    ARVORE_PROTOCOLO = {}
+
+    def __init__(self, registro):
+        self.registro = registro
+        self.item = None
+        self.end_emit = []
+        self.end_dest = []
+
+    def ler(self, xml):
+        root = ET.fromstring(xml)
+        tag_raiz = f'{{{self.NS}}}{self.RAIZ}'
+        inf = root if root.tag == tag_raiz else root.find(f'.//{tag_raiz}')
+        if inf is None:
+            raise ValueError(f'XML sem {self.RAIZ}')
+
+        registro = self.registro
+        registro.chave_acesso = inf.get('Id', '')[3:]
+        self.percorrer(inf, self.ARVORE)
+
+        prot = root.find(f'{{{self.NS}}}{self.PROTOCOLO}')
+        if prot is not None:
+            self.percorrer(prot, self.ARVORE_PROTOCOLO)
+
+        return self.finalizar()
+
+    def finalizar(self):
+        """Monta endereços e traduz o cStat após todos os grupos lidos"""
+        registro = self.registro
+        if self.end_emit:
+            registro.emit_endereco = ', '.join(self.end_emit)
+        if self.end_dest:
+            registro.dest_endereco = ', '.join(self.end_dest)
+        cstat = getattr(registro, self.STATUS)
+        setattr(registro, self.STATUS, STATUS_POR_CSTAT.get(cstat, cstat))
+        return registro
+
+    def percorrer(self, elem, tabela):
+        coringa = tabela.get('*')
+        for filho in elem:
+            alvo = coringa if coringa is not None else tabela.get(filho.tag)
+            if alvo is None:
+                continue
+            if type(alvo) is dict:
+                if filho.tag == self.TAG_ITEM:
+                    self.abrir_item(filho)
+                    self.percorrer(filho, alvo)
+                    self.fechar_item()
+                else:
+                    self.percorrer(filho, alvo)
+                continue
+
+            valor = filho.text
+            if not valor:
+                continue
+            valor = valor.strip()
+            destino, campo, conv = alvo
+            if conv is not None:
+                valor = conv(valor)
+            if destino == _DOC:
+                setattr(self.registro, campo, valor)
+            elif destino == _ITEM:
+                setattr(self.item, campo, valor)
+            elif destino == _END_EMIT:
+                self.end_emit.append(valor)
+            else:
+                self.end_dest.append(valor)
+
+    def abrir_item(self, elem):
+        pass
+
+    def fechar_item(self):
+        pass
+
+
+class _LeitorNFe(_Leitor):
+    NS = NS_NFE
+    RAIZ = 'infNFe'
+    PROTOCOLO = 'protNFe'
+    TAG_ITEM = f'{{{NS_NFE}}}det'
+    STATUS = 'status_nfe'
+    ARVORE = _compilar_arvore(_MAPA_NFE, NS_NFE, 'infNFe')
+    ARVORE_PROTOCOLO = _compilar_arvore(_MAPA_NFE, NS_NFE, 'protNFe')
+
+    def abrir_item(self, elem):
+        self.item = NFeItemRegistro(numero_item=int(elem.get('nItem', len(self.registro.itens) + 1)))
+
+    def fechar_item(self):
+        self.registro.itens.append(self.item)
+        self.item = None
+
+
+class _LeitorCTe(_Leitor):
+    NS = NS_CTE
+    RAIZ = 'infCte'
+    PROTOCOLO = 'protCTe'
+    STATUS = 'status_cte'
+    ARVORE = _compilar_arvore(_MAPA_CTE, NS_CTE, 'infCte')
+    ARVORE_PROTOCOLO = _compilar_arvore(_MAPA_CTE, NS_CTE, 'protCTe')
+
+
+class _LeitorSimples(_Leitor):
+    """Leitor para documentos sem itens/protocolo: o mapa parte do elemento raiz"""
+
+    ARVORES = {}
+
+    def ler(self, xml):
+        root = ET.fromstring(xml)
+        arvore = self.ARVORES.get(root.tag)
+        if arvore is None:
+            raise ValueError(f'Elemento raiz inesperado: {root.tag}')
+        self.percorrer(root, arvore)
+        return self.registro
+
+
+class _LeitorResumoNFe(_LeitorSimples):
+    ARVORES = {f'{{{NS_NFE}}}resNFe': _compilar_arvore(_MAPA_RES_NFE, NS_NFE, 'resNFe')}
+
+
+class _LeitorEventoNFe(_LeitorSimples):
+    ARVORES = {
+        f'{{{NS_NFE}}}procEventoNFe': _compilar_arvore(_MAPA_EVENTO, NS_NFE, 'procEventoNFe'),
+        f'{{{NS_NFE}}}resEvento': _compilar_arvore(_MAPA_EVENTO, NS_NFE, 'resEvento'),
+    }
+
+
+class _LeitorNFeStreaming(_LeitorNFe):
+    """Leitor que entrega os itens em lotes em vez de acumulá-los no registro"""
+
+    def __init__(self, registro):
+        super().__init__(registro)
+        self.lote = []
+
+    def fechar_item(self):
+        self.lote.append(self.item)
+        self.item = None
+
+
+class NFeStreaming:
+    """
+    Parse incremental (iterparse) de NFes muito grandes
+
+    Cada grupo filho de infNFe (ide, emit, dest, det, total...) é lido assim que
+    fechado e em seguida removido da árvore, então a memória não cresce com a
+    quantidade de itens. Os itens são entregues em lotes por lotes(); o cabeçalho
+    (ide/emit/dest) já está preenchido em registro quando o primeiro lote sai, e
+    totais/protocolo ficam completos após consumir todos os lotes.
+
+    Uso:
+        streaming = NFeStreaming('/dados/NFe/grande.xml', tamanho_lote=200)
+        for lote in streaming.lotes():
+            ...
+        streaming.registro.valor_total
+    """
+
+    def __init__(self, fonte, tamanho_lote: int = 200):
+        """
+        Args:
+            fonte: Caminho do arquivo ou objeto file-like (BytesIO/StringIO)
+            tamanho_lote: Itens por lote entregue
+        """
+        self.fonte = fonte
+        self.tamanho_lote = tamanho_lote
+        self.registro = NFeRegistro()
+        self.total_itens = 0
+
+    def lotes(self) -> Iterator[List[NFeItemRegistro]]:
+        leitor = _LeitorNFeStreaming(self.registro)
+        tag_inf = f'{{{NS_NFE}}}infNFe'
+        tag_prot = f'{{{NS_NFE}}}protNFe'
+        inf = None
+        profundidade = 0
+        profundidade_inf = -1
+
+        for evento, elem in ET.iterparse(self.fonte, events=('start', 'end')):
+            if evento == 'start':
+                profundidade += 1
+                if elem.tag == tag_inf:
+                    inf = elem
+                    profundidade_inf = profundidade
+                    self.registro.chave_acesso = elem.get('Id', '')[3:]
+                continue
+
+            profundidade -= 1
+            if profundidade == profundidade_inf:
+                # Grupo filho direto de infNFe fechado: lê, descarta e libera
+                tabela = leitor.ARVORE.get(elem.tag)
+                if tabela is not None:
+                    if elem.tag == leitor.TAG_ITEM:
+                        leitor.abrir_item(elem)
+                        leitor.percorrer(elem, tabela)
+                        leitor.fechar_item()
+                    else:
+                        leitor.percorrer(elem, tabela)
+                inf.remove(elem)
+                if len(leitor.lote) >= self.tamanho_lote:
+                    yield self._entregar(leitor)
+            elif elem is inf:
+                profundidade_inf = -1
+            elif elem.tag == tag_prot:
+                leitor.percorrer(elem, leitor.ARVORE_PROTOCOLO)
+                elem.clear()
+
+        if inf is None:
+            raise ValueError('XML sem infNFe')
+        if leitor.lote:
+            yield self._entregar(leitor)
+        leitor.finalizar()
+
+    def _entregar(self, leitor) -> List[NFeItemRegistro]:
+        lote, leitor.lote = leitor.lote, []
+        self.total_itens += len(lote)
+        return lote
+
+
+def parse_nfe_xml(xml) -> NFeRegistro:
+    """
+    Parseia XML de NFe (nfeProc ou NFe) em uma única passada
+
+    Args:
+        xml: Conteúdo do XML (str ou bytes)
+
+    Returns:
+        NFeRegistro com os itens em registro.itens
+    """
+    return _LeitorNFe(NFeRegistro()).ler(xml)
+
+
+def parse_cte_xml(xml) -> CTeRegistro:
+    """
+    Parseia XML de CTe (cteProc ou CTe) em uma única passada
+
+    Args:
+        xml: Conteúdo do XML (str ou bytes)
+
+    Returns:
+        CTeRegistro
+    """
+    return _LeitorCTe(CTeRegistro()).ler(xml)
+
+
+def parse_res_nfe_xml(xml) -> ResumoNFeRegistro:
+    """Parseia o resumo de NFe (resNFe) da distribuição DF-e"""
+    return _LeitorResumoNFe(ResumoNFeRegistro()).ler(xml)
+
+
+def parse_evento_nfe_xml(xml) -> EventoNFeRegistro:
+    """Parseia evento de NFe (procEventoNFe ou resEvento)"""
+    return _LeitorEventoNFe(EventoNFeRegistro()).ler(xml)
@@ -0,0 +1,97 @@
+"""
+Benchmark da listagem de NFes da API
+Compara ModelSerializer + JSONRenderer com api.lista_rapida (values() + orjson/json),
+incluindo a consulta, em páginas de 1000 linhas num banco de teste descartável
+
+Uso:
+    python scripts/bench_listagem.py
+    python scripts/bench_listagem.py --linhas 5000 --pagina 1000 --repeticoes 10
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone as tz
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xml_manager.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import lista_rapida  # noqa: E402
+from api.serializers import NFeListSerializer  # noqa: E402
+from core.models import NFe  # noqa: E402
+from tests.amostras import chave_teste  # noqa: E402
+
+CAMPOS = list(NFeListSerializer.Meta.fields)
+
+
+def via_serializer(pagina):
+    queryset = NFe.objects.only(*CAMPOS).order_by('-data_emissao', '-pk')[:pagina]
+    return JSONRenderer().render(NFeListSerializer(queryset, many=True).data)
+
+
+def via_lista_rapida(pagina):
+    linhas = NFe.objects.values(*CAMPOS).order_by('-data_emissao', '-pk')[:pagina]
+    return lista_rapida.JSONRapidoRenderer().render(lista_rapida.serializar_linhas(NFe, CAMPOS, linhas))
+
+
+def medir(funcao, pagina, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(pagina)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return pagina / melhor
+
+
+def executar(args):
+    base = datetime(2024, 1, 1, tzinfo=tz.utc)
+    NFe.objects.bulk_create([
+        NFe(
+            chave_acesso=chave_teste(n), numero_nf=str(n), serie='1', data_emissao=base + timedelta(minutes=n),
+            emit_cnpj='12345678000190', emit_nome=f'Emitente {n % 50}', dest_nome=f'Destinatário {n % 200}',
+            valor_total=Decimal(n) / 7, status_nfe='autorizada',
+        )
+        for n in range(1, args.linhas + 1)
+    ], batch_size=500)
+    pagina = min(args.pagina, args.linhas)
+
+    referencia = medir(via_serializer, pagina, args.repeticoes)
+    rapida = medir(via_lista_rapida, pagina, args.repeticoes)
+    with mock.patch.object(lista_rapida, 'orjson', None):
+        sem_orjson = medir(via_lista_rapida, pagina, args.repeticoes)
+
+    print(f"Páginas de {pagina} NFes ({args.linhas} no banco, melhor de {args.repeticoes})")
+    print(f"  ModelSerializer + JSONRenderer: {referencia:10.0f} linhas/s")
+    print(f"  lista_rapida (json padrão):     {sem_orjson:10.0f} linhas/s  ({sem_orjson / referencia:.2f}x)")
+    if lista_rapida.orjson is not None:
+        print(f"  lista_rapida (orjson):          {rapida:10.0f} linhas/s  ({rapida / referencia:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--linhas', type=int, default=5000)
+    parser.add_argument('--pagina', type=int, default=1000)
+    parser.add_argument('--repeticoes', type=int, default=10)
+    args = parser.parse_args()
+
+    # Banco de teste descartável: não toca no banco configurado
+    nome = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        executar(args)
+    finally:
+        connection.creation.destroy_test_db(nome, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
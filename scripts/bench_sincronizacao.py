@@ -0,0 +1,114 @@
+"""
+Benchmark ponta a ponta da sincronização DF-e contra o servidor stub local
+Mede busca (HTTP) + decodificação + parse + gravação, num banco de teste descartável
+
+Uso:
+    python scripts/bench_sincronizacao.py
+    python scripts/bench_sincronizacao.py --documentos 5000 --latencia 0.05 --prob-656 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'xml_manager.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from core.models_certificado import CertificadoDigital, ConsultaSEFAZ  # noqa: E402
+from core.sefaz_resiliencia import limpar_controles  # noqa: E402
+from core.sefaz_service import SEFAZConsultaService  # noqa: E402
+from core.sincronizacao import sincronizar_distribuicao  # noqa: E402
+from tests.amostras import gerar_certificado_pfx  # noqa: E402
+from tests.sefaz_stub import ServidorSEFAZStub  # noqa: E402
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def executar(args):
+    pfx = gerar_certificado_pfx('1234')
+    user = User.objects.create_user(username='bench')
+    certificado = CertificadoDigital.objects.create(
+        usuario=user, nome='Bench', cnpj='98765432000110', arquivo_pfx=pfx, senha_pfx='1234',
+        validade_inicio=date(2024, 1, 1), validade_fim=date(2099, 1, 1),
+    )
+    consulta = ConsultaSEFAZ.objects.create(
+        certificado=certificado, tipo_documento='NFE', data_inicio=date(2024, 1, 1), data_fim=date(2024, 12, 31)
+    )
+    service = SEFAZConsultaService(pfx, '1234')
+
+    stub = ServidorSEFAZStub(
+        total_documentos=args.documentos, tamanho_lote=args.lote, itens=args.itens, latencia=args.latencia,
+        prob_656=args.prob_656, prob_erro=args.prob_erro, semente=args.semente,
+    )
+    duracoes, documentos, rejeicoes = [], 0, 0
+    with stub, override_settings(
+        SEFAZ_ENDPOINT_BASE=stub.url,
+        SEFAZ_REQUISICOES_POR_SEGUNDO=args.taxa,
+        SEFAZ_CIRCUITO_FALHAS=args.max_rejeicoes + 1,
+    ):
+        limpar_controles()
+        inicio = time.perf_counter()
+        while True:
+            try:
+                resultado = sincronizar_distribuicao(consulta, service=service)
+            except Exception:
+                # 656/5xx injetados: o cursor já gravado permite retomar do último lote
+                rejeicoes += 1
+                if rejeicoes > args.max_rejeicoes:
+                    raise
+                continue
+            duracoes += resultado.duracoes
+            documentos += resultado.documentos
+            if int(resultado.ult_nsu) >= args.documentos:
+                break
+        total = time.perf_counter() - inicio
+        requisicoes = sum(stub.requisicoes.values())
+
+    service.fechar()
+    print(f"{documentos} documentos ({args.itens} itens por NFe) em {len(duracoes)} lotes de {args.lote}")
+    print(f"  total:        {total:8.2f} s  ({documentos / total:8.0f} docs/s)")
+    print(f"  lote p50:     {statistics.median(duracoes) * 1000:8.1f} ms")
+    print(f"  lote p99:     {percentil(duracoes, 99) * 1000:8.1f} ms")
+    print(f"  requisições:  {requisicoes:8d}  (rejeições/erros: {rejeicoes})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documentos', type=int, default=2000)
+    parser.add_argument('--lote', type=int, default=50, help='docZips por resposta')
+    parser.add_argument('--itens', type=int, default=10)
+    parser.add_argument('--latencia', type=float, default=0.0, help='Segundos por resposta do stub')
+    parser.add_argument('--prob-656', type=float, default=0.0)
+    parser.add_argument('--prob-erro', type=float, default=0.0)
+    parser.add_argument('--taxa', type=float, default=1000, help='Requisições/s do limitador')
+    parser.add_argument('--max-rejeicoes', type=int, default=100)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    # Banco de teste descartável: não toca no banco configurado
+    nome = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        executar(args)
+    finally:
+        connection.creation.destroy_test_db(nome, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
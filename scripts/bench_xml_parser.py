@@ -0,0 +1,87 @@
+"""
+Micro-benchmark do parser de XMLs fiscais
+Compara core.xml_parser (passada única) com a abordagem ElementTree + find()
+
+Uso:
+    python scripts/bench_xml_parser.py
+    python scripts/bench_xml_parser.py --documentos 2000 --itens 50
+"""
+import argparse
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from core.xml_parser import parse_nfe_xml  # noqa: E402
+from tests.amostras import gerar_nfe_xml  # noqa: E402
+
+NS = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
+
+CAMPOS_CABECALHO = [
+    './/nfe:ide/nfe:nNF', './/nfe:ide/nfe:serie', './/nfe:ide/nfe:dhEmi',
+    './/nfe:emit/nfe:CNPJ', './/nfe:emit/nfe:xNome', './/nfe:emit/nfe:xFant', './/nfe:emit/nfe:IE',
+    './/nfe:enderEmit/nfe:xMun', './/nfe:enderEmit/nfe:UF', './/nfe:enderEmit/nfe:CEP',
+    './/nfe:dest/nfe:CNPJ', './/nfe:dest/nfe:xNome', './/nfe:dest/nfe:IE',
+    './/nfe:enderDest/nfe:xMun', './/nfe:enderDest/nfe:UF', './/nfe:enderDest/nfe:CEP',
+    './/nfe:ICMSTot/nfe:vNF', './/nfe:ICMSTot/nfe:vProd', './/nfe:ICMSTot/nfe:vICMS',
+    './/nfe:ICMSTot/nfe:vIPI', './/nfe:ICMSTot/nfe:vPIS', './/nfe:ICMSTot/nfe:vCOFINS',
+    './/nfe:infProt/nfe:cStat', './/nfe:infProt/nfe:nProt', './/nfe:infProt/nfe:xMotivo',
+]
+
+CAMPOS_ITEM = [
+    './/nfe:cProd', './/nfe:xProd', './/nfe:NCM', './/nfe:CFOP', './/nfe:uCom',
+    './/nfe:qCom', './/nfe:vUnCom', './/nfe:vProd', './/nfe:cEAN',
+    './/nfe:vICMS', './/nfe:vIPI', './/nfe:vPIS', './/nfe:vCOFINS',
+]
+
+
+def parse_elementtree(xml):
+    """Referência: árvore completa e find() com busca descendente por campo"""
+    root = ET.fromstring(xml)
+    dados = {}
+    for caminho in CAMPOS_CABECALHO:
+        elem = root.find(caminho, NS)
+        dados[caminho] = elem.text if elem is not None else None
+    itens = []
+    for det in root.findall('.//nfe:det', NS):
+        item = {}
+        for caminho in CAMPOS_ITEM:
+            elem = det.find(caminho, NS)
+            item[caminho] = elem.text if elem is not None else None
+        itens.append(item)
+    dados['itens'] = itens
+    return dados
+
+
+def medir(funcao, documentos, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        for doc in documentos:
+            funcao(doc)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return len(documentos) / melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documentos', type=int, default=1000)
+    parser.add_argument('--itens', type=int, default=10)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    documentos = [gerar_nfe_xml(n, itens=args.itens).encode() for n in range(1, args.documentos + 1)]
+
+    referencia = medir(parse_elementtree, documentos, args.repeticoes)
+    passada_unica = medir(parse_nfe_xml, documentos, args.repeticoes)
+
+    print(f"{args.documentos} NFes com {args.itens} itens cada")
+    print(f"  ElementTree + find(): {referencia:10.0f} docs/s")
+    print(f"  core.xml_parser:      {passada_unica:10.0f} docs/s  ({passada_unica / referencia:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
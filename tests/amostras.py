@@ -0,0 +1,158 @@
+"""
+XMLs de exemplo usados nos testes
+"""
+
+
+def chave_teste(numero: int, modelo: str = '55', cuf: str = '35') -> str:
+    """Gera uma chave de acesso de 44 dígitos"""
+    return f"{cuf}2401{'12345678000190'}{modelo}001{numero:09d}1{numero:08d}0"[:44]
+
+
+def gerar_nfe_xml(numero: int = 1, itens: int = 2, chave: str = None, cstat: str = '100') -> str:
+    """Gera um nfeProc mínimo com a quantidade de itens informada"""
+    chave = chave or chave_teste(numero)
+    dets = ''.join(
+        f'<det nItem="{i}"><prod><cProd>P{i:04d}</cProd><cEAN>7890000000{i:03d}</cEAN>'
+        f'<xProd>Produto {i}</xProd><NCM>12345678</NCM><CFOP>5102</CFOP><uCom>UN</uCom>'
+        f'<qCom>2.0000</qCom><vUnCom>10.0000000000</vUnCom><vProd>20.00</vProd></prod>'
+        f'<imposto><ICMS><ICMS00><vICMS>3.60</vICMS></ICMS00></ICMS>'
+        f'<PIS><PISAliq><vPIS>0.33</vPIS></PISAliq></PIS>'
+        f'<COFINS><COFINSAliq><vCOFINS>1.52</vCOFINS></COFINSAliq></COFINS></imposto></det>'
+        for i in range(1, itens + 1)
+    )
+    total = f'{itens * 20:.2f}'
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00">'
+        f'<NFe><infNFe Id="NFe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><natOp>Venda</natOp><mod>55</mod><serie>1</serie><nNF>{numero}</nNF>'
+        '<dhEmi>2024-01-15T10:30:00-03:00</dhEmi></ide>'
+        '<emit><CNPJ>12345678000190</CNPJ><xNome>Empresa Teste</xNome><xFant>Teste</xFant>'
+        '<enderEmit><xLgr>Rua A</xLgr><nro>10</nro><xBairro>Centro</xBairro><xMun>São Paulo</xMun>'
+        '<UF>SP</UF><CEP>01001000</CEP></enderEmit><IE>111111111111</IE></emit>'
+        '<dest><CNPJ>98765432000110</CNPJ><xNome>Cliente Teste</xNome>'
+        '<enderDest><xLgr>Rua B</xLgr><nro>20</nro><xMun>Campinas</xMun><UF>SP</UF><CEP>13010000</CEP></enderDest>'
+        '<IE>222222222222</IE></dest>'
+        f'{dets}'
+        f'<total><ICMSTot><vICMS>{itens * 3.6:.2f}</vICMS><vProd>{total}</vProd><vIPI>0.00</vIPI>'
+        f'<vPIS>{itens * 0.33:.2f}</vPIS><vCOFINS>{itens * 1.52:.2f}</vCOFINS><vNF>{total}</vNF>'
+        '<vTotTrib>0.00</vTotTrib></ICMSTot></total>'
+        '<infAdic><infCpl>Documento de teste</infCpl></infAdic>'
+        '</infNFe></NFe>'
+        f'<protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><nProt>135240000000{numero:03d}</nProt>'
+        f'<cStat>{cstat}</cStat><xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>'
+        '</nfeProc>'
+    )
+
+
+def gerar_cte_xml(numero: int = 1, chave: str = None) -> str:
+    """Gera um cteProc mínimo"""
+    chave = chave or chave_teste(numero, modelo='57')
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<cteProc xmlns="http://www.portalfiscal.inf.br/cte" versao="4.00">'
+        f'<CTe><infCte Id="CTe{chave}" versao="4.00">'
+        f'<ide><cUF>35</cUF><CFOP>5353</CFOP><natOp>Transporte</natOp><serie>1</serie><nCT>{numero}</nCT>'
+        '<dhEmi>2024-02-10T08:00:00-03:00</dhEmi><modal>01</modal><tpServ>0</tpServ>'
+        '<xMunIni>São Paulo</xMunIni><UFIni>SP</UFIni><xMunFim>Curitiba</xMunFim><UFFim>PR</UFFim></ide>'
+        '<emit><CNPJ>11222333000144</CNPJ><IE>333333333333</IE><xNome>Transportadora Teste</xNome>'
+        '<enderEmit><xLgr>Av C</xLgr><nro>1</nro><xMun>São Paulo</xMun><UF>SP</UF></enderEmit></emit>'
+        '<rem><CNPJ>12345678000190</CNPJ><xNome>Empresa Teste</xNome>'
+        '<enderReme><xMun>São Paulo</xMun><UF>SP</UF></enderReme></rem>'
+        '<dest><CNPJ>98765432000110</CNPJ><xNome>Cliente Teste</xNome>'
+        '<enderDest><xMun>Curitiba</xMun><UF>PR</UF></enderDest></dest>'
+        '<vPrest><vTPrest>350.00</vTPrest><vRec>350.00</vRec></vPrest>'
+        '<imp><ICMS><ICMS00><vICMS>42.00</vICMS></ICMS00></ICMS></imp>'
+        '<infCTeNorm><infCarga><vCarga>15000.00</vCarga></infCarga></infCTeNorm>'
+        '</infCte></CTe>'
+        f'<protCTe versao="4.00"><infProt><chCTe>{chave}</chCTe><nProt>135240000000{numero:03d}</nProt>'
+        '<cStat>100</cStat><xMotivo>Autorizado o uso do CT-e</xMotivo></infProt></protCTe>'
+        '</cteProc>'
+    )
+
+
+def gerar_res_nfe_xml(numero: int = 1, chave: str = None) -> str:
+    """Gera um resumo de NFe (resNFe) da distribuição DF-e"""
+    chave = chave or chave_teste(numero)
+    return (
+        '<resNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.01">'
+        f'<chNFe>{chave}</chNFe><CNPJ>12345678000190</CNPJ><xNome>Empresa Teste</xNome>'
+        '<IE>111111111111</IE><dhEmi>2024-01-15T10:30:00-03:00</dhEmi><tpNF>1</tpNF>'
+        f'<vNF>{numero * 10:.2f}</vNF><digVal>abc=</digVal><dhRecbto>2024-01-15T10:31:00-03:00</dhRecbto>'
+        f'<nProt>135240000000{numero:03d}</nProt><cSitNFe>1</cSitNFe></resNFe>'
+    )
+
+
+def gerar_evento_nfe_xml(chave: str, tipo_evento: str = '110111', cstat: str = '135') -> str:
+    """Gera um procEventoNFe (padrão: cancelamento homologado)"""
+    return (
+        '<procEventoNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.00">'
+        '<evento versao="1.00"><infEvento Id="ID' + tipo_evento + chave + '01">'
+        f'<cOrgao>35</cOrgao><tpAmb>1</tpAmb><CNPJ>12345678000190</CNPJ><chNFe>{chave}</chNFe>'
+        f'<dhEvento>2024-01-16T09:00:00-03:00</dhEvento><tpEvento>{tipo_evento}</tpEvento>'
+        '<nSeqEvento>1</nSeqEvento><verEvento>1.00</verEvento>'
+        '<detEvento versao="1.00"><descEvento>Cancelamento</descEvento>'
+        '<nProt>135240000000001</nProt><xJust>Erro na emissao do documento</xJust></detEvento>'
+        '</infEvento></evento>'
+        '<retEvento versao="1.00"><infEvento><tpAmb>1</tpAmb><cOrgao>35</cOrgao>'
+        f'<cStat>{cstat}</cStat><xMotivo>Evento registrado e vinculado a NF-e</xMotivo>'
+        f'<chNFe>{chave}</chNFe><tpEvento>{tipo_evento}</tpEvento><nSeqEvento>1</nSeqEvento>'
+        '<dhRegEvento>2024-01-16T09:00:05-03:00</dhRegEvento><nProt>135240000009999</nProt>'
+        '</infEvento></retEvento></procEventoNFe>'
+    )
+
+
+def gerar_resposta_dist_dfe(documentos, ult_nsu: int = None, max_nsu: int = None, cstat: str = '138') -> str:
+    """
+    Gera resposta SOAP do nfeDistDFeInteresse
+
+    Args:
+        documentos: Lista de (nsu, schema, xml)
+    """
+    import base64
+    import gzip
+
+    zips = ''.join(
+        f'<docZip NSU="{nsu:015d}" schema="{schema}">'
+        f'{base64.b64encode(gzip.compress(xml.encode())).decode()}</docZip>'
+        for nsu, schema, xml in documentos
+    )
+    ult_nsu = ult_nsu if ult_nsu is not None else max((d[0] for d in documentos), default=0)
+    max_nsu = max_nsu if max_nsu is not None else ult_nsu
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body>'
+        '<nfeDistDFeInteresseResponse xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe">'
+        '<nfeDistDFeInteresseResult>'
+        '<retDistDFeInt xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.01">'
+        f'<tpAmb>1</tpAmb><verAplic>1.0</verAplic><cStat>{cstat}</cStat><xMotivo>Documento localizado</xMotivo>'
+        f'<dhResp>2024-01-16T10:00:00-03:00</dhResp><ultNSU>{ult_nsu:015d}</ultNSU><maxNSU>{max_nsu:015d}</maxNSU>'
+        f'<loteDistDFeInt>{zips}</loteDistDFeInt></retDistDFeInt>'
+        '</nfeDistDFeInteresseResult></nfeDistDFeInteresseResponse></soap:Body></soap:Envelope>'
+    )
+
+
+def gerar_certificado_pfx(senha: str = '1234', cnpj: str = '98765432000110') -> bytes:
+    """Gera um certificado A1 (.pfx) autoassinado"""
+    from datetime import datetime, timedelta
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    from cryptography.x509.oid import NameOID
+
+    chave = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nome = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, f'EMPRESA TESTE:{cnpj}')])
+    agora = datetime.utcnow()
+    certificado = (
+        x509.CertificateBuilder()
+        .subject_name(nome).issuer_name(nome)
+        .public_key(chave.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora - timedelta(days=1))
+        .not_valid_after(agora + timedelta(days=365))
+        .sign(chave, hashes.SHA256())
+    )
+    return pkcs12.serialize_key_and_certificates(
+        b'teste', chave, certificado, None, serialization.BestAvailableEncryption(senha.encode())
+    )
@@ -0,0 +1,214 @@
+"""
+Servidor SOAP local que imita os webservices da SEFAZ
+
+Atende nfeDistDFeInteresse (lotes de docZip gzip+base64 gerados a partir de
+tests.amostras, ou o procNFe de uma chave com consChNFe), consSitNFe e consStatServ, com latência, rejeições 656,
+erros 5xx e timeouts injetáveis. Usado nos testes e em
+scripts/bench_sincronizacao.py junto com settings.SEFAZ_ENDPOINT_BASE.
+
+Uso:
+    with ServidorSEFAZStub(total_documentos=500, latencia=0.05) as stub:
+        with override_settings(SEFAZ_ENDPOINT_BASE=stub.url):
+            ...
+"""
+import base64
+import gzip
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .amostras import chave_teste, gerar_nfe_xml, gerar_res_nfe_xml
+
+_RE_ULT_NSU = re.compile(rb'<ultNSU>(\d+)</ultNSU>')
+_RE_CHAVE = re.compile(rb'<chNFe>(\d{44})</chNFe>')
+
+_ENVELOPE = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope"><soap:Body>{}</soap:Body></soap:Envelope>'
+)
+
+
+class ServidorSEFAZStub:
+    """Stand-in HTTP dos webservices SEFAZ (um único host para todos os endpoints)"""
+
+    def __init__(
+        self,
+        total_documentos: int = 100,
+        tamanho_lote: int = 50,
+        itens: int = 3,
+        latencia: float = 0.0,
+        prob_656: float = 0.0,
+        prob_erro: float = 0.0,
+        prob_timeout: float = 0.0,
+        atraso_timeout: float = 5.0,
+        semente: int = 0,
+    ):
+        """
+        Args:
+            total_documentos: NSUs disponíveis na distribuição (ímpares procNFe, pares resNFe)
+            tamanho_lote: docZips por resposta (a SEFAZ devolve até 50)
+            itens: Itens por NFe completa
+            latencia: Segundos de espera antes de cada resposta
+            prob_656: Probabilidade de responder cStat 656 (consumo indevido)
+            prob_erro: Probabilidade de responder HTTP 500
+            prob_timeout: Probabilidade de segurar a resposta por atraso_timeout segundos
+            semente: Semente das falhas aleatórias (execuções reprodutíveis)
+        """
+        self.total_documentos = total_documentos
+        self.tamanho_lote = tamanho_lote
+        self.itens = itens
+        self.latencia = latencia
+        self.prob_656 = prob_656
+        self.prob_erro = prob_erro
+        self.prob_timeout = prob_timeout
+        self.atraso_timeout = atraso_timeout
+        self.requisicoes = Counter()
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self._doczips = {}
+        self._servidor = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, porta = self._servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar(self) -> 'ServidorSEFAZStub':
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, como a sessão do serviço espera
+
+            def do_POST(self):
+                corpo = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, resposta = stub.responder(corpo)
+                dados = resposta.encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/soap+xml; charset=utf-8')
+                    self.send_header('Content-Length', str(len(dados)))
+                    self.end_headers()
+                    self.wfile.write(dados)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # cliente desistiu (timeout)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._servidor.daemon_threads = True
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def encerrar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.encerrar()
+
+    def _sortear(self, probabilidade):
+        if not probabilidade:
+            return False
+        with self._lock:
+            return self._aleatorio.random() < probabilidade
+
+    def responder(self, corpo: bytes):
+        """(status HTTP, corpo SOAP) para a requisição recebida"""
+        if b'distDFeInt' in corpo:
+            operacao = 'distribuicao'
+        elif b'consSitNFe' in corpo:
+            operacao = 'consulta_chave'
+        elif b'consStatServ' in corpo:
+            operacao = 'status'
+        else:
+            operacao = 'desconhecida'
+        with self._lock:
+            self.requisicoes[operacao] += 1
+
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self._sortear(self.prob_timeout):
+            time.sleep(self.atraso_timeout)
+        if self._sortear(self.prob_erro):
+            return 500, _ENVELOPE.format('<soap:Fault><soap:Reason>Erro interno</soap:Reason></soap:Fault>')
+
+        if operacao == 'distribuicao':
+            return 200, self._distribuicao(corpo)
+        if operacao == 'consulta_chave':
+            return 200, self._consulta_chave(corpo)
+        if operacao == 'status':
+            return 200, self._ret('retConsStatServ', '107', 'Servico em Operacao')
+        return 500, _ENVELOPE.format('<soap:Fault><soap:Reason>Operacao desconhecida</soap:Reason></soap:Fault>')
+
+    def _ret(self, tag, cstat, motivo, conteudo=''):
+        return _ENVELOPE.format(
+            f'<{tag} xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.01"><tpAmb>1</tpAmb>'
+            f'<cStat>{cstat}</cStat><xMotivo>{motivo}</xMotivo>{conteudo}</{tag}>'
+        )
+
+    def _doczip(self, nsu: int) -> str:
+        doczip = self._doczips.get(nsu)
+        if doczip is None:
+            if nsu % 2:
+                schema, xml = 'procNFe_v4.00.xsd', gerar_nfe_xml(nsu, itens=self.itens)
+            else:
+                schema, xml = 'resNFe_v1.01.xsd', gerar_res_nfe_xml(nsu)
+            conteudo = base64.b64encode(gzip.compress(xml.encode('utf-8'))).decode()
+            doczip = f'<docZip NSU="{nsu:015d}" schema="{schema}">{conteudo}</docZip>'
+            self._doczips[nsu] = doczip
+        return doczip
+
+    def _distribuicao(self, corpo: bytes) -> str:
+        if self._sortear(self.prob_656):
+            return self._ret('retDistDFeInt', '656', 'Rejeicao: Consumo Indevido')
+
+        if b'consChNFe' in corpo:
+            return self._consulta_chave_distribuicao(corpo)
+
+        m = _RE_ULT_NSU.search(corpo)
+        ult = int(m.group(1)) if m else 0
+        nsus = range(ult + 1, min(ult + self.tamanho_lote, self.total_documentos) + 1)
+        maximo = f'<maxNSU>{self.total_documentos:015d}</maxNSU>'
+        if not nsus:
+            return self._ret('retDistDFeInt', '137', 'Nenhum documento localizado',
+                             f'<ultNSU>{ult:015d}</ultNSU>{maximo}')
+        lote = ''.join(self._doczip(nsu) for nsu in nsus)
+        return self._ret(
+            'retDistDFeInt', '138', 'Documento localizado',
+            f'<ultNSU>{nsus[-1]:015d}</ultNSU>{maximo}<loteDistDFeInt>{lote}</loteDistDFeInt>'
+        )
+
+    def _consulta_chave_distribuicao(self, corpo: bytes) -> str:
+        """consChNFe: procNFe da chave (número ímpar) ou só o resNFe (número par)"""
+        chave = _RE_CHAVE.search(corpo).group(1).decode()
+        numero = int(chave[25:34])
+        if numero % 2:
+            schema, xml = 'procNFe_v4.00.xsd', gerar_nfe_xml(numero, itens=self.itens, chave=chave)
+        else:
+            schema, xml = 'resNFe_v1.01.xsd', gerar_res_nfe_xml(numero, chave=chave)
+        conteudo = base64.b64encode(gzip.compress(xml.encode('utf-8'))).decode()
+        return self._ret(
+            'retDistDFeInt', '138', 'Documento localizado',
+            f'<ultNSU>{0:015d}</ultNSU><maxNSU>{0:015d}</maxNSU><loteDistDFeInt>'
+            f'<docZip NSU="{0:015d}" schema="{schema}">{conteudo}</docZip></loteDistDFeInt>'
+        )
+
+    def _consulta_chave(self, corpo: bytes) -> str:
+        m = _RE_CHAVE.search(corpo)
+        chave = m.group(1).decode() if m else chave_teste(1)
+        return self._ret(
+            'retConsSitNFe', '100', 'Autorizado o uso da NF-e',
+            f'<chNFe>{chave}</chNFe><protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe>'
+            '<nProt>135240000000001</nProt><cStat>100</cStat></infProt></protNFe>'
+        )
@@ -1,7 +1,9 @@
 """
 Testes para a API REST
 """
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -40,7 +42,8 @@ class NFeAPITest(TestCase):
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/api/nfe/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
+        self.assertIsInstance(response.data['results'], list)
+        self.assertEqual(response.data['results'][0]['numero_nf'], '123')
 
     def test_nfe_detail(self):
         """Testa detalhes de uma NFe"""
@@ -61,6 +64,28 @@ class NFeAPITest(TestCase):
         response = self.client.get('/api/nfe/?cnpj=12345678000190')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_nfe_detail_inclui_xml(self):
+        """Testa que o detalhe traz o XML da tabela separada quando pedido em ?fields="""
+        self.nfe.xml_content = '<nfeProc/>'
+        self.nfe.save()
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f'/api/nfe/{self.nfe.id}/')
+        self.assertNotIn('xml_content', response.data)
+        response = self.client.get(f'/api/nfe/{self.nfe.id}/', {'fields': 'numero_nf,xml_content'})
+        self.assertEqual(response.data['xml_content'], '<nfeProc/>')
+
+    def test_nfe_list_nao_le_xml(self):
+        """Testa que a listagem não toca no XML nem em colunas fora do serializer"""
+        self.nfe.xml_content = '<nfeProc/>'
+        self.nfe.save()
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/nfe/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = ' '.join(q['sql'] for q in queries)
+        self.assertNotIn('core_nfexml', sql)
+        self.assertNotIn('dest_endereco', sql)
+
 
 class DashboardAPITest(TestCase):
     """Testes para a API de Dashboard"""
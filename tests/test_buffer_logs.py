@@ -0,0 +1,73 @@
+"""
+Testes para a gravação em lote dos ImportLog
+"""
+import tempfile
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.buffer_logs import BufferImportLog
+from core.importacao import ImportadorXML
+from core.models import ImportLog
+from .amostras import gerar_nfe_xml
+
+
+class BufferImportLogTest(TestCase):
+    """Testes para BufferImportLog"""
+
+    def test_grava_ao_atingir_tamanho(self):
+        buffer = BufferImportLog(tamanho=3, intervalo=3600)
+        for n in range(2):
+            buffer.registrar('NFe', f'{n}.xml', 'sucesso')
+        self.assertEqual(ImportLog.objects.count(), 0)
+
+        # Um único INSERT para o lote (mais o incremento da versão de ImportLog)
+        with CaptureQueriesContext(connection) as consultas:
+            buffer.registrar('NFe', '2.xml', 'sucesso')
+        inserts = [c for c in consultas if c['sql'].startswith('INSERT INTO "core_importlog"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(ImportLog.objects.count(), 3)
+        self.assertEqual(len(buffer), 0)
+        buffer.fechar()
+
+    def test_grava_por_intervalo(self):
+        buffer = BufferImportLog(tamanho=1000, intervalo=0)
+        buffer.registrar('NFe', 'a.xml', 'erro', 'Falha')
+        self.assertEqual(ImportLog.objects.count(), 1)
+        buffer.fechar()
+
+    def test_with_grava_pendentes_mesmo_com_excecao(self):
+        """Testa a gravação final ao sair do bloco com erro"""
+        with self.assertRaises(RuntimeError):
+            with BufferImportLog(tamanho=1000, intervalo=3600) as buffer:
+                buffer.registrar('NFe', 'a.xml', 'sucesso')
+                raise RuntimeError('falhou no meio')
+        self.assertEqual(ImportLog.objects.count(), 1)
+
+    def test_resumir_sucessos(self):
+        """Testa sucessos agrupados por tipo e erros mantidos por arquivo"""
+        with BufferImportLog(tamanho=1000, intervalo=3600, resumir_sucessos=True) as buffer:
+            for n in range(5):
+                buffer.registrar('NFe', f'{n}.xml', 'sucesso')
+            buffer.registrar('CTe', 'c.xml', 'sucesso')
+            buffer.registrar('NFe', 'ruim.xml', 'erro', 'XML inválido')
+
+        self.assertEqual(ImportLog.objects.count(), 3)
+        self.assertEqual(ImportLog.objects.get(tipo_documento='NFe', status='sucesso').quantidade, 5)
+        self.assertEqual(ImportLog.objects.get(status='erro').arquivo_nome, 'ruim.xml')
+
+
+class ImportadorLogsTest(TestCase):
+    """Testes para os logs do ImportadorXML"""
+
+    def test_importador_resumindo_logs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for numero in range(1, 6):
+                Path(tmp, f'nfe{numero}.xml').write_text(gerar_nfe_xml(numero))
+            ImportadorXML(workers=0, tamanho_lote=2, resumir_logs=True).importar_diretorios([tmp])
+
+        logs = ImportLog.objects.filter(status='sucesso')
+        self.assertEqual(sum(log.quantidade for log in logs), 5)
+        self.assertLess(logs.count(), 5)
@@ -0,0 +1,83 @@
+"""
+Testes para a busca indexada de NFe/CTe
+"""
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.busca import buscar, filtro_busca
+from core.models import NFe, CTe
+from .amostras import chave_teste
+
+
+class BuscaTest(TestCase):
+    """Testes para filtro_busca/buscar"""
+
+    @classmethod
+    def setUpTestData(cls):
+        nomes = ['Empresa Alfa Ltda', 'Comércio Beta', 'ALFABETO Papelaria']
+        for n, nome in enumerate(nomes, start=1):
+            NFe.objects.create(chave_acesso=chave_teste(n), numero_nf=str(100 + n), emit_nome=nome,
+                               dest_nome='Cliente Gama')
+        CTe.objects.create(chave_acesso=chave_teste(9, modelo='57'), numero_ct='7', emit_nome='Transportes Alfa')
+
+    def _numeros(self, termo, modelo=NFe):
+        return sorted(modelo.objects.filter(filtro_busca(modelo, termo)).values_list('numero_nf', flat=True))
+
+    def test_trecho_do_nome_sem_diferenciar_caixa(self):
+        self.assertEqual(self._numeros('alfa'), ['101', '103'])
+        self.assertEqual(self._numeros('papel alfa'), ['103'])
+        self.assertEqual(self._numeros('gama'), ['101', '102', '103'])
+
+    def test_chave_e_numero_vao_ao_indice_da_coluna(self):
+        self.assertEqual(filtro_busca(NFe, chave_teste(2)).children, [('chave_acesso', chave_teste(2))])
+        self.assertEqual(self._numeros(chave_teste(2)), ['102'])
+        self.assertEqual(self._numeros('103'), ['103'])
+        self.assertEqual(self._numeros(chave_teste(1)[-12:]), ['101'])
+
+    def test_termo_curto_usa_icontains(self):
+        self.assertEqual(self._numeros('Be'), ['102', '103'])
+
+    def test_indice_acompanha_alteracoes(self):
+        nfe = NFe.objects.get(numero_nf='102')
+        nfe.emit_nome = 'Distribuidora Delta'
+        nfe.save()
+        self.assertEqual(self._numeros('beta'), [])
+        self.assertEqual(self._numeros('delta'), ['102'])
+
+        nfe.delete()
+        self.assertEqual(self._numeros('delta'), [])
+
+    def test_buscar_retorna_total_na_mesma_consulta(self):
+        with self.assertNumQueries(1):
+            nfes, total = buscar(NFe.objects.order_by('numero_nf'), 'gama', limite=2)
+        self.assertEqual([n.numero_nf for n in nfes], ['101', '102'])
+        self.assertEqual(total, 3)
+        self.assertEqual(buscar(NFe.objects.all(), 'inexistente'), ([], 0))
+
+    def test_usa_fts_no_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 só no SQLite')
+        sql = str(NFe.objects.filter(filtro_busca(NFe, 'alfa')).query)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+
+class BuscaAPITest(TestCase):
+    """Testes para a busca na API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='api', password='x'))
+        NFe.objects.create(chave_acesso=chave_teste(1), numero_nf='1', emit_nome='Empresa Alfa')
+        CTe.objects.create(chave_acesso=chave_teste(2, modelo='57'), numero_ct='2', emit_nome='Alfa Cargas')
+
+    def test_search_api(self):
+        dados = self.client.get('/api/search/', {'q': 'alfa'}).json()
+        self.assertEqual(dados['total_results'], 2)
+        self.assertEqual(dados['nfes'][0]['numero_nf'], '1')
+
+    def test_search_nos_viewsets(self):
+        dados = self.client.get('/api/cte/', {'search': 'carga'}).json()
+        self.assertEqual([cte['numero_ct'] for cte in dados['results']], ['2'])
@@ -0,0 +1,80 @@
+"""
+Testes para o cache de consultas da API
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import QueryDict
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.cache_consultas import contadores, em_cache, normalizar_parametros
+from core.models import NFe
+from core.versoes import incrementar_versao
+from .amostras import chave_teste
+
+
+class CacheConsultasTest(TestCase):
+    """Testes para core.cache_consultas"""
+
+    def setUp(self):
+        cache.clear()
+        self.chamadas = 0
+
+    def _calcular(self):
+        self.chamadas += 1
+        return {'valor': self.chamadas}
+
+    def test_normaliza_parametros(self):
+        a = QueryDict('cnpj=123&data_inicio=2024-01-01&ordering=-valor_total&cursor=abc&search=')
+        b = QueryDict('data_inicio=2024-01-01 &cnpj=123')
+        self.assertEqual(normalizar_parametros(a), normalizar_parametros(b))
+        self.assertNotEqual(normalizar_parametros(a), normalizar_parametros(QueryDict('cnpj=999')))
+
+    def test_acerto_ate_a_versao_mudar(self):
+        self.assertEqual(em_cache('teste', ['NFe'], {}, self._calcular), ({'valor': 1}, False))
+        self.assertEqual(em_cache('teste', ['NFe'], {}, self._calcular), ({'valor': 1}, True))
+        # Outra dependência não invalida
+        incrementar_versao('CTe')
+        self.assertTrue(em_cache('teste', ['NFe'], {}, self._calcular)[1])
+
+        incrementar_versao('NFe')
+        self.assertEqual(em_cache('teste', ['NFe'], {}, self._calcular), ({'valor': 2}, False))
+        self.assertEqual(contadores()['teste'], {'acertos': 2, 'falhas': 2, 'taxa_acerto': 0.5})
+
+
+class CacheAPITest(TestCase):
+    """Testes para o cache nos endpoints"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='api', password='x'))
+        NFe.objects.create(chave_acesso=chave_teste(1), numero_nf='1', emit_cnpj='1', valor_total=Decimal('10'))
+
+    def test_totais_em_cache_e_invalidados_na_importacao(self):
+        for url in ('/api/nfe/totais/', '/api/nfe/por_emitente/', '/api/cte/totais/', '/api/cte/rotas/',
+                    '/api/statistics/', '/api/statistics/?dias=30'):
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS', url)
+            with self.assertNumQueries(1):  # só as versões
+                self.assertEqual(self.client.get(url)['X-Cache'], 'HIT', url)
+
+        NFe.objects.create(chave_acesso=chave_teste(2), numero_nf='2', emit_cnpj='1', valor_total=Decimal('5'))
+        resposta = self.client.get('/api/nfe/totais/')
+        self.assertEqual(resposta['X-Cache'], 'MISS')
+        self.assertEqual(resposta.json()['total_notas'], 2)
+        self.assertEqual(self.client.get('/api/cte/totais/')['X-Cache'], 'HIT')
+
+    def test_parametros_separam_entradas(self):
+        self.client.get('/api/nfe/totais/?cnpj=1')
+        self.assertEqual(self.client.get('/api/nfe/totais/?cnpj=2')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/nfe/totais/?cnpj=1&ordering=-valor_total')['X-Cache'], 'HIT')
+
+    def test_contadores_so_para_admin(self):
+        self.client.get('/api/cte/rotas/')
+        self.assertEqual(self.client.get('/api/cache/').status_code, 403)
+
+        admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get('/api/cache/').json()['cte_rotas']['falhas'], 1)
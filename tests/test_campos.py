@@ -0,0 +1,80 @@
+"""
+Testes para ?fields= / ?exclude= na API
+"""
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.models import CTe, ImportLog, NFe
+from .amostras import chave_teste
+
+
+class CamposSelecionadosTest(TestCase):
+    """Serializer e SELECT restritos aos campos pedidos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='campos', password='x')
+        cls.nfe = NFe.objects.create(
+            chave_acesso=chave_teste(1), numero_nf='1', emit_nome='Emitente', emit_endereco='Rua A, 1',
+            valor_total=Decimal('10.00'), xml_content='<nfeProc/>',
+        )
+        cls.cte = CTe.objects.create(chave_acesso=chave_teste(1, '57'), numero_ct='7', xml_content='<cteProc/>')
+        ImportLog.objects.create(tipo_documento='NFE', arquivo_nome='a.xml', status='sucesso', usuario=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, url, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, params)
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        sql = ' '.join(q['sql'] for q in consultas if 'core_' in q['sql'])
+        return json.loads(resposta.content), sql
+
+    def test_detalhe_sem_xml_por_padrao(self):
+        for url in (f'/api/nfe/{self.nfe.pk}/', f'/api/cte/{self.cte.pk}/'):
+            dados, sql = self._get(url)
+            self.assertNotIn('xml_content', dados)
+            self.assertIn('chave_acesso', dados)
+            self.assertNotIn('_xml', sql)
+
+    def test_fields_restringe_resposta_e_colunas(self):
+        dados, sql = self._get(f'/api/nfe/{self.nfe.pk}/', fields='numero_nf,valor_total')
+        self.assertEqual(dados, {'numero_nf': '1', 'valor_total': '10.00'})
+        self.assertNotIn('emit_endereco', sql)
+        self.assertNotIn('emit_nome', sql)
+
+        dados, sql = self._get('/api/cte/', fields='id,numero_ct')
+        self.assertEqual(dados['results'], [{'id': self.cte.pk, 'numero_ct': '7'}])
+        self.assertNotIn('emit_nome', sql)
+
+    def test_xml_so_quando_pedido(self):
+        dados, sql = self._get(f'/api/cte/{self.cte.pk}/', fields='numero_ct,xml_content')
+        self.assertEqual(dados, {'numero_ct': '7', 'xml_content': '<cteProc/>'})
+        self.assertIn('core_ctexml', sql)
+
+    def test_exclude(self):
+        dados, sql = self._get('/api/nfe/', exclude='emit_nome,dest_nome')
+        self.assertNotIn('emit_nome', dados['results'][0])
+        self.assertIn('numero_nf', dados['results'][0])
+        self.assertNotIn('emit_nome', sql)
+
+    def test_campo_de_relacao_usa_select_related(self):
+        dados, _ = self._get('/api/logs/', fields='arquivo_nome,usuario_nome')
+        self.assertEqual(dados['results'], [{'arquivo_nome': 'a.xml', 'usuario_nome': 'campos'}])
+        # Versão (ETag) + a página com o usuário no JOIN
+        with self.assertNumQueries(2):
+            self.client.get('/api/logs/', {'fields': 'usuario_nome'})
+
+    def test_campo_invalido(self):
+        resposta = self.client.get('/api/nfe/', {'fields': 'numero_nf,senha'})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('senha', resposta.json()['fields'][0])
+        self.assertEqual(self.client.get('/api/nfe/', {'exclude': 'nada'}).status_code, 400)
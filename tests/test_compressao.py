@@ -0,0 +1,135 @@
+"""
+Testes para a compressão dos XMLs armazenados
+"""
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from core import compressao
+from core.compressao import (
+    comprimir_arquivo, comprimir_xml, descomprimir_xml, dicionario_do_valor, salvar_dicionario, treinar_dicionario
+)
+from core.models import NFe, NFeXML
+from core.xml_parser import parse_nfe_xml
+from .amostras import gerar_cte_xml, gerar_nfe_xml
+
+
+class CompressaoTest(SimpleTestCase):
+    """Testes para treinar/comprimir/descomprimir"""
+
+    def test_dicionario_melhora_compressao(self):
+        """Testa que o dicionário reduz o tamanho de um documento novo"""
+        dicionario = treinar_dicionario([gerar_nfe_xml(n) for n in range(1, 30)] + [gerar_cte_xml(1), gerar_cte_xml(2)])
+        self.assertLessEqual(len(dicionario), compressao.TAMANHO_DICIONARIO)
+
+        xml = gerar_nfe_xml(99, itens=1)
+        sem = comprimir_xml(xml, (0, b''))
+        com = comprimir_xml(xml, (7, dicionario))
+        self.assertLess(len(com), len(sem) * 0.6)
+        self.assertEqual(dicionario_do_valor(com), 7)
+
+        compressao._dicionarios[7] = dicionario
+        self.assertEqual(descomprimir_xml(com), xml)
+
+    def test_comprimir_arquivo_em_blocos(self):
+        """Testa que o arquivo comprimido em blocos (cortando caracteres UTF-8) volta igual"""
+        xml = gerar_nfe_xml(5, itens=20).replace('Empresa', 'Emprésa Ação')
+        dicionario = treinar_dicionario([gerar_nfe_xml(n) for n in range(1, 10)])
+        compressao._dicionarios[7] = dicionario
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = Path(tmp, 'nfe.xml')
+            caminho.write_text(xml, encoding='utf-8')
+            comprimido = comprimir_arquivo(caminho, (7, dicionario), tamanho_bloco=101)
+
+        self.assertEqual(dicionario_do_valor(comprimido), 7)
+        self.assertEqual(descomprimir_xml(comprimido), xml)
+
+    def test_texto_legado(self):
+        """Testa leitura de valores gravados antes da compressão"""
+        self.assertEqual(descomprimir_xml('<a/>'), '<a/>')
+        self.assertEqual(descomprimir_xml(b'<a/>'), '<a/>')
+        self.assertIsNone(dicionario_do_valor(b'<a/>'))
+
+
+class XMLComprimidoFieldTest(TestCase):
+    """Testes para o campo comprimido nos models"""
+
+    def setUp(self):
+        compressao.recarregar_dicionarios()
+        self.addCleanup(compressao.recarregar_dicionarios)
+        self.xml = gerar_nfe_xml(1, itens=5)
+
+    def criar_nfe(self, numero):
+        xml = gerar_nfe_xml(numero, itens=5)
+        return NFe.objects.create(**parse_nfe_xml(xml).campos(), xml_content=xml)
+
+    def test_grava_comprimido_e_le_texto(self):
+        """Testa gravação comprimida e leitura transparente"""
+        nfe = self.criar_nfe(1)
+        bruto = bytes(NFeXML.objects.values_list('conteudo', flat=True).get(pk=nfe.pk))
+
+        self.assertTrue(bruto.startswith(compressao.MAGICO))
+        self.assertLess(len(bruto), len(self.xml))
+        self.assertEqual(NFe.objects.get(pk=nfe.pk).xml_content, self.xml)
+
+    def test_save_sem_alterar_nao_recomprime(self):
+        """Testa que o save regrava os bytes originais quando o XML não mudou"""
+        xml = NFeXML.objects.get(pk=self.criar_nfe(1).pk)
+        xml.conteudo
+        with self.assertNumQueries(1):
+            xml.save()
+
+        original = xml.__dict__[NFeXML._meta.get_field('conteudo').chave_original][0]
+        self.assertEqual(bytes(NFeXML.objects.values_list('conteudo', flat=True).get(pk=xml.pk)), bytes(original))
+
+    def test_comando_recomprimir(self):
+        """Testa treino do dicionário e recompressão das linhas existentes"""
+        for numero in range(1, 6):
+            self.criar_nfe(numero)
+        NFeXML.objects.filter(documento__numero_nf='5').update(conteudo=gerar_nfe_xml(5, itens=5).encode())
+        antes = sum(len(v) for v in NFeXML.objects.values_list('conteudo', flat=True))
+
+        saida = StringIO()
+        call_command('recomprimir_xmls', '--treinar', '10', '--modelo', 'nfe', stdout=saida)
+
+        brutos = list(NFeXML.objects.values_list('conteudo', flat=True))
+        dicionario_id = compressao.dicionario_ativo()[0]
+        self.assertTrue(all(dicionario_do_valor(b) == dicionario_id for b in brutos))
+        self.assertLess(sum(len(b) for b in brutos), antes)
+        self.assertIn('nfe: 5 regravados', saida.getvalue())
+        self.assertEqual(NFe.objects.get(numero_nf='3').xml_content, gerar_nfe_xml(3, itens=5))
+
+    def test_comando_migrar_xmls(self):
+        """Testa a cópia da coluna antiga xml_content para NFeXML (texto e comprimido)"""
+        # Sem xml_content: só a linha do documento, como nos bancos anteriores às tabelas de XML
+        texto, comprimida = (NFe.objects.create(**parse_nfe_xml(gerar_nfe_xml(n)).campos()) for n in (1, 2))
+        ja_migrada = self.criar_nfe(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE core_nfe ADD COLUMN xml_content BLOB NULL')
+            cursor.execute('UPDATE core_nfe SET xml_content = %s WHERE id = %s', [gerar_nfe_xml(1), texto.pk])
+            cursor.execute(
+                'UPDATE core_nfe SET xml_content = %s WHERE id IN (%s, %s)',
+                [comprimir_xml(gerar_nfe_xml(2)), comprimida.pk, ja_migrada.pk],
+            )
+
+        saida = StringIO()
+        call_command('migrar_xmls', '--modelo', 'nfe', '--lote', '2', stdout=saida)
+        self.assertIn('nfe: 2 XMLs copiados', saida.getvalue())
+        self.assertEqual(NFe.objects.get(pk=texto.pk).xml_content, gerar_nfe_xml(1))
+        self.assertEqual(NFe.objects.get(pk=comprimida.pk).xml_content, gerar_nfe_xml(2))
+        self.assertEqual(NFe.objects.get(pk=ja_migrada.pk).xml_content, gerar_nfe_xml(3, itens=5))
+
+        # Rodar de novo não copia nada
+        call_command('migrar_xmls', '--modelo', 'nfe', stdout=saida)
+        self.assertIn('nfe: 0 XMLs copiados', saida.getvalue())
+
+    def test_novo_dicionario_usado_nas_gravacoes(self):
+        """Testa que salvar_dicionario ativa o dicionário para novos registros"""
+        dicionario = salvar_dicionario([gerar_nfe_xml(n) for n in range(1, 10)])
+        nfe = self.criar_nfe(20)
+        bruto = NFeXML.objects.values_list('conteudo', flat=True).get(pk=nfe.pk)
+        self.assertEqual(dicionario_do_valor(bruto), dicionario.pk)
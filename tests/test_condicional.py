@@ -0,0 +1,74 @@
+"""
+Testes para o GET condicional da API (ETag/Last-Modified)
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.buffer_logs import BufferImportLog
+from core.models import NFe, VersaoDados
+from core.versoes import incrementar_versao, versoes
+from .amostras import chave_teste
+
+
+class VersoesTest(TestCase):
+    """Testes para core.versoes"""
+
+    def test_incrementar_e_ler(self):
+        self.assertEqual(versoes(['NFe'])['NFe'], (0, None))
+        incrementar_versao('NFe')
+        incrementar_versao('NFe', 'CTe')
+        self.assertEqual(versoes(['NFe'])['NFe'][0], 2)
+        self.assertEqual(VersaoDados.objects.get(nome='CTe').versao, 1)
+
+    def test_alteracoes_incrementam(self):
+        nfe = NFe.objects.create(chave_acesso=chave_teste(1), numero_nf='1')
+        nfe.delete()
+        self.assertEqual(versoes(['NFe'])['NFe'][0], 2)
+
+        NFe.objects.upsert_situacoes([{'chave_acesso': chave_teste(2), 'status_nfe': 'autorizada'}])
+        NFe.objects.upsert_situacoes([{'chave_acesso': chave_teste(2), 'status_nfe': 'cancelada'}])
+        self.assertEqual(versoes(['NFe'])['NFe'][0], 4)
+
+        with BufferImportLog() as logs:
+            logs.registrar('NFe', 'a.xml', 'sucesso')
+        self.assertEqual(versoes(['ImportLog'])['ImportLog'][0], 1)
+
+
+class CondicionalAPITest(TestCase):
+    """Testes para ETag/304 nos endpoints"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='api', password='x'))
+        NFe.objects.create(chave_acesso=chave_teste(1), numero_nf='1', valor_total=Decimal('10'))
+
+    def test_304_sem_rodar_consultas_pesadas(self):
+        for url in ('/api/dashboard/', '/api/statistics/', '/api/nfe/', '/api/nfe/totais/', '/api/logs/'):
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200, url)
+            self.assertIn('no-cache', resposta['Cache-Control'])
+
+            # Só a leitura das versões
+            with self.assertNumQueries(1):
+                repetida = self.client.get(url, HTTP_IF_NONE_MATCH=resposta['ETag'])
+            self.assertEqual(repetida.status_code, 304, url)
+            self.assertEqual(repetida['ETag'], resposta['ETag'])
+
+    def test_importacao_muda_etag(self):
+        etag = self.client.get('/api/nfe/')['ETag']
+        NFe.objects.create(chave_acesso=chave_teste(2), numero_nf='2')
+        resposta = self.client.get('/api/nfe/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_etag_por_url_e_if_modified_since(self):
+        lista = self.client.get('/api/nfe/')
+        self.assertNotEqual(self.client.get('/api/nfe/?limite=1')['ETag'], lista['ETag'])
+        self.assertEqual(self.client.get('/api/nfe/', HTTP_IF_MODIFIED_SINCE=lista['Last-Modified']).status_code, 304)
+
+    def test_304_exige_autenticacao(self):
+        etag = self.client.get('/api/dashboard/')['ETag']
+        self.assertIn(APIClient().get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, (401, 403))
@@ -0,0 +1,114 @@
+"""
+Testes para a deduplicação por chave de acesso
+"""
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, TestCase
+
+from core.dedup import FiltroBloom, IndiceChaves, chave_do_arquivo, chave_do_xml, tipo_da_chave
+from core.importacao import ImportadorXML
+from core.models import NFe, CTe, ImportLog
+from core.xml_parser import parse_nfe_xml
+from .amostras import chave_teste, gerar_cte_xml, gerar_nfe_xml, gerar_res_nfe_xml
+
+
+class ChaveTest(SimpleTestCase):
+    """Testes para a extração da chave sem parse"""
+
+    def test_chave_do_xml(self):
+        """Testa Id="NFe..." da NFe e chNFe do resumo"""
+        self.assertEqual(chave_do_xml(gerar_nfe_xml(7)), chave_teste(7))
+        self.assertEqual(chave_do_xml(gerar_res_nfe_xml(8).encode()), chave_teste(8))
+        self.assertEqual(chave_do_xml(gerar_cte_xml(3)), chave_teste(3, modelo='57'))
+        self.assertIsNone(chave_do_xml('<nada/>'))
+
+    def test_chave_do_arquivo(self):
+        """Testa chave pelo nome do arquivo e, sem ela, pelo conteúdo"""
+        with tempfile.TemporaryDirectory() as tmp:
+            pelo_nome = Path(tmp) / f'{chave_teste(1)}-nfe.xml'
+            pelo_nome.write_text('<nada/>')
+            pelo_conteudo = Path(tmp) / 'nota.xml'
+            pelo_conteudo.write_text(gerar_nfe_xml(2))
+
+            self.assertEqual(chave_do_arquivo(str(pelo_nome)), chave_teste(1))
+            self.assertEqual(chave_do_arquivo(str(pelo_conteudo)), chave_teste(2))
+
+    def test_tipo_da_chave(self):
+        self.assertEqual(tipo_da_chave(chave_teste(1)), 'NFe')
+        self.assertEqual(tipo_da_chave(chave_teste(1, modelo='57')), 'CTe')
+
+    def test_bloom_sem_falso_negativo(self):
+        """Testa que todas as chaves inseridas são encontradas"""
+        bloom = FiltroBloom(1000, taxa_erro=0.01)
+        chaves = [chave_teste(n) for n in range(1000)]
+        for chave in chaves:
+            bloom.adicionar(chave)
+
+        self.assertTrue(all(c in bloom for c in chaves))
+        falsos = sum(chave_teste(n) in bloom for n in range(1000, 11000))
+        self.assertLess(falsos, 300)
+
+
+class IndiceChavesTest(TestCase):
+    """Testes para IndiceChaves"""
+
+    def setUp(self):
+        for numero in (1, 2):
+            NFe.objects.create(**parse_nfe_xml(gerar_nfe_xml(numero)).campos())
+
+    def test_set_bloom_e_banco_concordam(self):
+        """Testa o mesmo resultado aquecido (set/Bloom) e consultando o banco"""
+        chaves = [chave_teste(n) for n in (1, 2, 3)]
+        esperado = {chave_teste(1), chave_teste(2)}
+
+        for bloom in (False, True):
+            indice = IndiceChaves([NFe, CTe], bloom=bloom)
+            self.assertEqual(indice.aquecer(), 2)
+            self.assertEqual(indice.existentes(chaves), esperado)
+        self.assertEqual(IndiceChaves([NFe, CTe]).existentes(chaves), esperado)
+
+    def test_chaves_adicionadas(self):
+        indice = IndiceChaves([NFe])
+        indice.aquecer()
+        indice.adicionar(chave_teste(9))
+        self.assertIn(chave_teste(9), indice)
+        self.assertNotIn(chave_teste(10), indice)
+
+
+class ImportacaoDeduplicadaTest(TestCase):
+    """Testes para o descarte de duplicados no ImportadorXML"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        for numero in range(1, 4):
+            (self.dir / f'nfe{numero}.xml').write_text(gerar_nfe_xml(numero))
+        # Mesma NFe com outro nome: repetida na própria execução
+        (self.dir / f'{chave_teste(1)}-copia.xml').write_text(gerar_nfe_xml(1))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reimportacao_registra_contagem(self):
+        """Testa que duplicados viram um ImportLog 'ignorado' com a quantidade"""
+        primeira = ImportadorXML(workers=0).importar_diretorios([self.dir])
+        self.assertEqual(primeira.importados, 3)
+        self.assertEqual(primeira.duplicados, 1)
+
+        segunda = ImportadorXML(workers=0).importar_diretorios([self.dir])
+
+        self.assertEqual(segunda.arquivos, 4)
+        self.assertEqual(segunda.importados, 0)
+        self.assertEqual(segunda.duplicados, 4)
+        self.assertEqual(segunda.erros, 0)
+        log = ImportLog.objects.filter(status='ignorado').latest('pk')
+        self.assertEqual((log.tipo_documento, log.quantidade), ('NFe', 4))
+
+    def test_sem_deduplicacao(self):
+        """Testa que, desativada, os duplicados seguem para o parse e viram erro"""
+        ImportadorXML(workers=0).importar_diretorios([self.dir])
+        resultado = ImportadorXML(workers=0, deduplicar=False).importar_diretorios([self.dir])
+
+        self.assertEqual(resultado.duplicados, 0)
+        self.assertEqual(resultado.erros, 4)
@@ -0,0 +1,61 @@
+"""
+Testes para a decodificação dos lotes de distribuição DF-e
+"""
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from core.distribuicao_dfe import decodificar_lote, iter_doczips, tipo_do_schema
+from core.xml_parser import EventoNFeRegistro, NFeRegistro, ResumoNFeRegistro
+from .amostras import (
+    chave_teste, gerar_nfe_xml, gerar_res_nfe_xml,
+    gerar_evento_nfe_xml, gerar_resposta_dist_dfe,
+)
+
+
+class DecodificarLoteTest(SimpleTestCase):
+    """Testes para decodificar_lote"""
+
+    def setUp(self):
+        self.resposta = gerar_resposta_dist_dfe([
+            (101, 'resNFe_v1.01.xsd', gerar_res_nfe_xml(1)),
+            (102, 'procNFe_v4.00.xsd', gerar_nfe_xml(2, itens=2)),
+            (103, 'procEventoNFe_v1.00.xsd', gerar_evento_nfe_xml(chave_teste(2))),
+            (104, 'outro_v1.00.xsd', '<x/>'),
+        ])
+
+    def test_tipos_por_schema(self):
+        """Testa classificação e parse de cada schema em ordem de NSU"""
+        docs = list(decodificar_lote(self.resposta.encode()))
+
+        self.assertEqual(
+            [d.nsu for d in docs],
+            ['000000000000101', '000000000000102', '000000000000103', '000000000000104'],
+        )
+        self.assertEqual([d.tipo for d in docs], ['resNFe', 'procNFe', 'procEventoNFe', None])
+        self.assertIsInstance(docs[0].registro, ResumoNFeRegistro)
+        self.assertEqual(docs[0].registro.valor_total, Decimal('10.00'))
+        self.assertIsInstance(docs[1].registro, NFeRegistro)
+        self.assertEqual(len(docs[1].registro.itens), 2)
+        self.assertIsInstance(docs[2].registro, EventoNFeRegistro)
+        self.assertEqual(docs[2].registro.tipo_evento, '110111')
+        self.assertEqual(docs[2].registro.cstat, '135')
+        self.assertIsNone(docs[3].registro)
+
+    def test_doczip_sem_copia(self):
+        """Testa que o base64 é entregue como memoryview da resposta"""
+        _, _, conteudo = next(iter_doczips(self.resposta.encode()))
+        self.assertIsInstance(conteudo, memoryview)
+
+    def test_doczip_invalido(self):
+        """Testa que erro de descompactação não interrompe o lote"""
+        resposta = self.resposta.replace('<docZip NSU="000000000000104" schema="outro_v1.00.xsd">',
+                                         '<docZip NSU="000000000000104" schema="resNFe_v1.01.xsd">!!')
+        docs = list(decodificar_lote(resposta, executor=ThreadPoolExecutor(2)))
+        self.assertIsNotNone(docs[3].erro)
+        self.assertIsNone(docs[1].erro)
+
+    def test_tipo_do_schema(self):
+        self.assertEqual(tipo_do_schema('procEventoNFe_v1.00.xsd'), 'procEventoNFe')
+        self.assertIsNone(tipo_do_schema('resCTe_v1.00.xsd'))
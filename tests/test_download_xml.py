@@ -0,0 +1,144 @@
+"""
+Testes para o download em massa de XMLs
+"""
+import threading
+import time
+from datetime import date, datetime
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from core.download_xml import DownloadXML
+from core.models_certificado import CertificadoDigital, ConsultaSEFAZ, DocumentoConsultado
+from .amostras import chave_teste, gerar_nfe_xml
+
+
+class ServicoFalso:
+    """
+    Registra UF, CNPJ e concorrência de cada download
+
+    Chaves ímpares recebem o nfeProc autorizado; pares múltiplas de 4 não
+    recebem nada e as demais pares recebem só a situação (retConsSitNFe).
+    """
+
+    def __init__(self):
+        self.ufs = {}
+        self.cnpjs = set()
+        self.simultaneos = 0
+        self.max_simultaneos = 0
+        self._lock = threading.Lock()
+
+    def baixar_nfe_distribuicao(self, chave_acesso, cnpj, uf='SP'):
+        with self._lock:
+            self.ufs[chave_acesso] = uf
+            self.cnpjs.add(cnpj)
+            self.simultaneos += 1
+            self.max_simultaneos = max(self.max_simultaneos, self.simultaneos)
+        time.sleep(0.01)
+        with self._lock:
+            self.simultaneos -= 1
+        numero = int(chave_acesso[25:34])
+        if numero % 2:
+            return gerar_nfe_xml(numero, chave=chave_acesso)
+        if numero % 4:
+            return (
+                '<retConsSitNFe xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><cStat>100</cStat>'
+                f'<chNFe>{chave_acesso}</chNFe><protNFe versao="4.00"><infProt><chNFe>{chave_acesso}</chNFe>'
+                '<cStat>100</cStat></infProt></protNFe></retConsSitNFe>'
+            )
+        return None
+
+
+class DownloadXMLTest(TestCase):
+    """Testes para DownloadXML"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        certificado = CertificadoDigital.objects.create(
+            usuario=user, nome='Teste', cnpj='98765432000110', arquivo_pfx=b'', senha_pfx='',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2030, 1, 1),
+        )
+        consulta = ConsultaSEFAZ.objects.create(
+            certificado=certificado, tipo_documento='NFE', data_inicio=date(2024, 1, 1), data_fim=date(2024, 1, 31)
+        )
+        DocumentoConsultado.objects.bulk_create([
+            DocumentoConsultado(
+                consulta=consulta, chave_acesso=chave_teste(n, cuf='31' if n > 10 else '35'),
+                numero=str(n), serie='1', data_emissao=timezone.make_aware(datetime(2024, 1, 15)),
+                papel_cnpj='DESTINATARIO', emit_cnpj='12345678000190', emit_nome='Empresa', valor_total=10,
+            )
+            for n in range(1, 21)
+        ])
+
+    def test_baixa_grava_e_roteia_por_uf(self):
+        """Testa bulk_update, falhas, UF pelo cUF, CNPJ do certificado e limite de concorrência"""
+        servico = ServicoFalso()
+        pendentes = DocumentoConsultado.objects.filter(xml_baixado=False)
+        resultado = DownloadXML(concorrencia=3, tamanho_lote=4, service=servico).baixar(pendentes)
+
+        self.assertEqual(resultado.total, 20)
+        self.assertEqual(resultado.baixados, 10)
+        self.assertEqual(len(resultado.falhas), 10)
+        self.assertLessEqual(servico.max_simultaneos, 3)
+        self.assertEqual(servico.ufs[chave_teste(11, cuf='31')], 'MG')
+        self.assertEqual(servico.ufs[chave_teste(1)], 'SP')
+        self.assertEqual(servico.cnpjs, {'98765432000110'})
+
+        documento = DocumentoConsultado.objects.get(numero='3')
+        self.assertTrue(documento.xml_baixado)
+        self.assertIn('<nfeProc', documento.xml_completo)
+        self.assertIn(documento.chave_acesso, documento.xml_completo)
+        self.assertFalse(DocumentoConsultado.objects.get(numero='4').xml_baixado)
+
+        # Só a situação da NFe (sem nfeProc) não conta como XML baixado
+        self.assertIn(chave_teste(2), resultado.falhas)
+        self.assertFalse(DocumentoConsultado.objects.get(numero='2').xml_baixado)
+
+    def test_rejeita_nfe_nao_autorizada_ou_de_outra_chave(self):
+        """Testa que nfeProc denegado ou de outra chave fica para nova tentativa"""
+        servico = ServicoFalso()
+        servico.baixar_nfe_distribuicao = lambda chave, cnpj, uf='SP': {
+            chave_teste(1): gerar_nfe_xml(1, chave=chave_teste(1), cstat='110'),
+            chave_teste(3): gerar_nfe_xml(5, chave=chave_teste(5)),
+            chave_teste(5): gerar_nfe_xml(5, chave=chave_teste(5), cstat='150'),
+        }[chave]
+        resultado = DownloadXML(service=servico).baixar([chave_teste(1), chave_teste(3), chave_teste(5)])
+
+        self.assertEqual(resultado.baixados, 1)
+        self.assertEqual(sorted(resultado.falhas), [chave_teste(1), chave_teste(3)])
+        self.assertEqual(
+            list(DocumentoConsultado.objects.filter(xml_baixado=True).values_list('numero', flat=True)), ['5']
+        )
+
+    def test_uf_de_todos_os_cuf_e_cuf_invalido(self):
+        """Testa UF fora das capitais mais comuns e chave com cUF inexistente"""
+        consulta = ConsultaSEFAZ.objects.get()
+        for numero, cuf in ((31, '13'), (33, '53'), (35, '99')):
+            DocumentoConsultado.objects.create(
+                consulta=consulta, chave_acesso=chave_teste(numero, cuf=cuf), numero=str(numero), serie='1',
+                data_emissao=timezone.make_aware(datetime(2024, 1, 15)), papel_cnpj='DESTINATARIO',
+                emit_cnpj='12345678000190', emit_nome='Empresa', valor_total=10,
+            )
+        servico = ServicoFalso()
+        documentos = DocumentoConsultado.objects.filter(numero__in=['31', '33', '35'])
+        resultado = DownloadXML(service=servico).baixar(documentos)
+
+        self.assertEqual(servico.ufs, {chave_teste(31, cuf='13'): 'AM', chave_teste(33, cuf='53'): 'DF'})
+        self.assertEqual(resultado.falhas, [chave_teste(35, cuf='99')])
+
+    def test_lista_de_chaves(self):
+        """Testa download a partir de uma lista de chaves"""
+        resultado = DownloadXML(service=ServicoFalso()).baixar([chave_teste(1), chave_teste(3), chave_teste(99)])
+
+        self.assertEqual(resultado.baixados, 2)
+        self.assertEqual(DocumentoConsultado.objects.filter(xml_baixado=True).count(), 2)
+
+    def test_comando(self):
+        """Testa o comando baixar_xmls com certificado sem serviço disponível"""
+        saida = StringIO()
+        call_command('baixar_xmls', '--chave', chave_teste(5), '--concorrencia', '2', stdout=saida)
+        self.assertIn('0/1 XMLs', saida.getvalue())
+        self.assertIn(f'falha: {chave_teste(5)}', saida.getvalue())
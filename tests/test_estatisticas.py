@@ -0,0 +1,204 @@
+"""
+Testes para os resumos e o cache do dashboard
+"""
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.estatisticas import reconstruir_resumos, registrar_documentos, resumo_analiticos, resumo_dashboard
+from core.importacao import ImportadorXML, importar_nfe_streaming
+from core.models import (
+    CTe, NFe, ResumoDiario, ResumoDiarioEmitente, ResumoDiarioProduto, ResumoDiarioRota, ResumoEmitente,
+)
+from core.xml_parser import parse_nfe_xml
+from .amostras import gerar_cte_xml, gerar_nfe_xml
+
+
+class ResumosTest(TestCase):
+    """Testes para ResumoDiario/ResumoEmitente"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _importar(self, nfes=3, ctes=1):
+        with tempfile.TemporaryDirectory() as tmp:
+            for numero in range(1, nfes + 1):
+                Path(tmp, f'nfe{numero}.xml').write_text(gerar_nfe_xml(numero))
+            for numero in range(1, ctes + 1):
+                Path(tmp, f'cte{numero}.xml').write_text(gerar_cte_xml(numero))
+            ImportadorXML(workers=0, tamanho_lote=2).importar_diretorios([tmp])
+
+    def test_importacao_atualiza_resumos(self):
+        self._importar()
+
+        dia = ResumoDiario.objects.get(tipo='NFe')
+        self.assertEqual(str(dia.dia), '2024-01-15')
+        self.assertEqual(dia.quantidade, 3)
+        self.assertEqual(dia.valor_total, Decimal('120.00'))
+        emitente = ResumoEmitente.objects.get(tipo='NFe')
+        self.assertEqual((emitente.emit_cnpj, emitente.quantidade), ('12345678000190', 3))
+        self.assertEqual(ResumoDiario.objects.get(tipo='CTe').valor_total, Decimal('350.00'))
+
+    def test_reconstruir_igual_ao_incremental(self):
+        self._importar()
+        antes = sorted(ResumoDiario.objects.values_list('tipo', 'dia', 'quantidade', 'valor_total'))
+
+        rollups = (
+            (ResumoDiarioEmitente, ('tipo', 'dia', 'emit_cnpj', 'quantidade', 'valor_total')),
+            (ResumoDiarioProduto, ('dia', 'codigo_produto', 'itens', 'quantidade', 'valor_total')),
+            (ResumoDiarioRota, ('dia', 'municipio_inicio', 'uf_fim', 'quantidade', 'valor_total')),
+        )
+        incrementais = [sorted(modelo.objects.values_list(*campos)) for modelo, campos in rollups]
+
+        self.assertEqual(reconstruir_resumos(), {'NFe': 3, 'CTe': 1})
+        self.assertEqual(sorted(ResumoDiario.objects.values_list('tipo', 'dia', 'quantidade', 'valor_total')), antes)
+        self.assertEqual(ResumoEmitente.objects.count(), 2)
+        self.assertEqual([sorted(modelo.objects.values_list(*campos)) for modelo, campos in rollups], incrementais)
+
+    def test_rollups_de_produto_e_rota(self):
+        self._importar(nfes=2, ctes=2)
+
+        produto = ResumoDiarioProduto.objects.get(codigo_produto='P0001')
+        self.assertEqual((produto.itens, produto.quantidade, produto.valor_total), (2, Decimal('4'), Decimal('40.00')))
+        rota = ResumoDiarioRota.objects.get()
+        self.assertEqual((rota.municipio_inicio, rota.uf_fim, rota.quantidade), ('São Paulo', 'PR', 2))
+
+    def test_incremento_em_uma_instrucao_por_resumo(self):
+        self._importar(nfes=1, ctes=0)
+        # bulk_create não dispara os signals: os resumos ficam para registrar_documentos
+        nfes = NFe.objects.bulk_create([
+            NFe(**{**parse_nfe_xml(gerar_nfe_xml(numero)).campos(), 'emit_cnpj': f'{numero:014d}'})
+            for numero in range(2, 12)
+        ])
+
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_documentos('NFe', nfes)
+        escritas = [q['sql'] for q in consultas if q['sql'].startswith('INSERT INTO "core_resumo')]
+        # Diário, emitente e diário por emitente: 10 documentos em 3 instruções
+        self.assertEqual(len(escritas), 3)
+        self.assertFalse([q for q in consultas if q['sql'].startswith('UPDATE "core_resumo')])
+
+        # Linha existente é somada, não sobrescrita
+        dia = ResumoDiario.objects.get(tipo='NFe')
+        self.assertEqual((dia.quantidade, dia.valor_total), (11, Decimal('440.00')))
+        self.assertEqual(ResumoDiarioEmitente.objects.count(), 11)
+
+    def test_documentos_sem_data_acumulam_na_mesma_linha(self):
+        for numero in (1, 2):
+            registro = parse_nfe_xml(gerar_nfe_xml(numero))
+            NFe.objects.create(**{**registro.campos(), 'data_emissao': None})
+        dia = ResumoDiario.objects.get(tipo='NFe')
+        self.assertEqual((dia.dia, dia.quantidade, dia.valor_total), (None, 2, Decimal('80.00')))
+
+    def test_exclusao_individual_subtrai_dos_resumos(self):
+        self._importar(nfes=2, ctes=1)
+        self.assertEqual(resumo_dashboard()['nfe_stats']['total'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            NFe.objects.get(numero_nf='1').delete()
+            CTe.objects.get().delete()
+
+        self.assertEqual(resumo_dashboard()['nfe_stats']['total'], 1)
+        self.assertEqual(resumo_dashboard()['cte_stats']['total'], 0)
+        produto = ResumoDiarioProduto.objects.get(codigo_produto='P0001')
+        self.assertEqual((produto.itens, produto.quantidade), (1, Decimal('2')))
+        # Linhas sem documentos somem (não aparecem com zero nos rankings)
+        self.assertFalse(ResumoDiarioRota.objects.exists())
+        self.assertFalse(ResumoDiario.objects.filter(tipo='CTe').exists())
+        self._assert_igual_a_reconstrucao()
+
+    def test_edicao_individual_troca_valores_nos_resumos(self):
+        """Edição pelo admin: save() do documento carregado do banco"""
+        self._importar(nfes=2, ctes=0)
+        self.assertEqual(resumo_dashboard()['nfe_stats']['valor_total'], Decimal('80.00'))
+
+        nfe = NFe.objects.get(numero_nf='1')
+        nfe.valor_total = Decimal('100.00')
+        nfe.emit_cnpj, nfe.emit_nome = '11222333000181', 'Outra Empresa'
+        nfe.data_emissao = timezone.make_aware(datetime(2024, 2, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            nfe.save()
+
+        self.assertEqual(resumo_dashboard()['nfe_stats']['valor_total'], Decimal('140.00'))
+        self.assertEqual(
+            sorted(ResumoEmitente.objects.values_list('emit_cnpj', 'emit_nome', 'quantidade')),
+            [('11222333000181', 'Outra Empresa', 1), ('12345678000190', 'Empresa Teste', 1)],
+        )
+        self.assertEqual(
+            sorted(ResumoDiarioProduto.objects.filter(codigo_produto='P0001').values_list('dia', 'itens')),
+            [(date(2024, 1, 15), 1), (date(2024, 2, 10), 1)],
+        )
+        # Save sem campos dos resumos não consulta nem altera os resumos
+        with self.assertNumQueries(2):
+            nfe.save(update_fields=['status_nfe'])
+        self._assert_igual_a_reconstrucao()
+
+    def _assert_igual_a_reconstrucao(self):
+        resumos = (
+            (ResumoDiario, ('tipo', 'dia', 'quantidade', 'valor_total')),
+            (ResumoEmitente, ('tipo', 'emit_cnpj', 'emit_nome', 'quantidade', 'valor_total')),
+            (ResumoDiarioEmitente, ('tipo', 'dia', 'emit_cnpj', 'quantidade', 'valor_total')),
+            (ResumoDiarioProduto, ('dia', 'codigo_produto', 'itens', 'quantidade', 'valor_total')),
+            (ResumoDiarioRota, ('dia', 'municipio_inicio', 'uf_fim', 'quantidade', 'valor_total')),
+        )
+        incrementais = [sorted(modelo.objects.values_list(*campos)) for modelo, campos in resumos]
+        reconstruir_resumos()
+        self.assertEqual([sorted(modelo.objects.values_list(*campos)) for modelo, campos in resumos], incrementais)
+
+    def test_streaming_soma_itens_a_cada_lote(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = Path(tmp, 'grande.xml')
+            caminho.write_text(gerar_nfe_xml(1, itens=25))
+            importar_nfe_streaming(str(caminho), tamanho_lote=4)
+
+        campos = ('dia', 'codigo_produto', 'itens', 'quantidade', 'valor_total')
+        incremental = sorted(ResumoDiarioProduto.objects.values_list(*campos))
+        self.assertEqual(len(incremental), 25)
+        self.assertEqual(ResumoDiario.objects.get(tipo='NFe').quantidade, 1)
+        reconstruir_resumos(['NFe'])
+        self.assertEqual(sorted(ResumoDiarioProduto.objects.values_list(*campos)), incremental)
+
+    def test_analiticos_lidos_dos_rollups(self):
+        self._importar(nfes=2, ctes=1)
+
+        with self.assertNumQueries(4):
+            resumo = resumo_analiticos()
+        self.assertEqual(resumo['top_emitentes'][0]['emit_nome'], 'Empresa Teste')
+        self.assertEqual(resumo['top_emitentes'][0]['total'], 2)
+        self.assertEqual(resumo['top_produtos'][0]['qtd_total'], Decimal('4'))
+        self.assertEqual(resumo['top_rotas'][0]['municipio_fim'], 'Curitiba')
+        self.assertEqual(str(resumo['vendas_por_mes'][0]['mes']), '2024-01-01')
+        self.assertEqual(resumo['vendas_por_mes'][0]['valor'], Decimal('80.00'))
+
+        # Documentos de 2024 ficam fora de uma janela de 30 dias
+        self.assertEqual(resumo_analiticos(dias=30)['top_rotas'], [])
+
+    def test_dashboard_periodo_e_totais(self):
+        registro = parse_nfe_xml(gerar_nfe_xml(1))
+        NFe.objects.create(**{**registro.campos(), 'data_emissao': timezone.now()})
+        self._importar(nfes=0, ctes=1)
+
+        resumo = resumo_dashboard()
+        self.assertEqual(resumo['nfe_stats']['total'], 1)
+        self.assertEqual(resumo['nfe_stats']['mes_atual'], 1)
+        self.assertEqual(resumo['nfe_stats']['valor_mes'], Decimal('40.00'))
+        self.assertEqual(resumo['cte_stats']['total'], 1)
+        self.assertEqual(resumo['cte_stats']['mes_atual'], 0)
+        self.assertEqual(resumo['top_emitentes'][0]['total'], 1)
+
+    def test_dashboard_em_cache_ate_importacao(self):
+        self._importar(nfes=1, ctes=0)
+        self.assertEqual(resumo_dashboard()['nfe_stats']['total'], 1)
+        with self.assertNumQueries(0):
+            resumo_dashboard()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._importar(nfes=2, ctes=0)
+        self.assertEqual(resumo_dashboard()['nfe_stats']['total'], 2)
@@ -0,0 +1,167 @@
+"""
+Testes para a fila de consultas SEFAZ
+"""
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from core.distribuicao_dfe import ler_retorno_distribuicao
+from core.fila_consultas import (
+    SEFAZWorker, agendar_consultas_automaticas, processar_consulta, reservar_consultas
+)
+from core.models_certificado import CertificadoDigital, ConfiguracaoConsulta, ConsultaSEFAZ, DocumentoConsultado
+from core.sefaz_service import SEFAZConsultaService
+from .amostras import gerar_nfe_xml, gerar_resposta_dist_dfe
+
+
+class ServicoFalso(SEFAZConsultaService):
+    def __init__(self):
+        pass
+
+    def consultar_distribuicao(self, cnpj, ult_nsu='0', uf='SP', ignorar=None, ignorar_completos=None, timeout=60):
+        return ler_retorno_distribuicao(gerar_resposta_dist_dfe([(1, 'procNFe_v4.00.xsd', gerar_nfe_xml(1))]))
+
+
+class FilaConsultasTest(TestCase):
+    """Testes para reserva, processamento e agendamento"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.certificado = CertificadoDigital.objects.create(
+            usuario=self.user, nome='Teste', cnpj='98765432000110', arquivo_pfx=b'', senha_pfx='',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2099, 1, 1),
+        )
+
+    def criar_consulta(self, **kwargs):
+        return ConsultaSEFAZ.objects.create(
+            certificado=self.certificado, tipo_documento='NFE',
+            data_inicio=date(2024, 1, 1), data_fim=date(2024, 1, 31), **kwargs
+        )
+
+    def test_reserva_exclusiva_e_lease_vencido(self):
+        """Testa que uma consulta reservada só volta à fila com o lease vencido"""
+        consulta = self.criar_consulta()
+
+        self.assertEqual([c.pk for c in reservar_consultas('w1', 5)], [consulta.pk])
+        self.assertEqual(reservar_consultas('w2', 5), [])
+
+        ConsultaSEFAZ.objects.filter(pk=consulta.pk).update(lease_ate=timezone.now() - timedelta(seconds=1))
+        reservada = reservar_consultas('w2', 5)
+        self.assertEqual(reservada[0].worker_id, 'w2')
+        self.assertEqual(reservada[0].tentativas, 2)
+
+    def test_uma_consulta_por_certificado(self):
+        """Testa que consultas do mesmo certificado não rodam ao mesmo tempo"""
+        primeira, segunda = self.criar_consulta(), self.criar_consulta()
+        outro = CertificadoDigital.objects.create(
+            usuario=self.user, nome='Outro', cnpj='11222333000181', arquivo_pfx=b'', senha_pfx='',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2099, 1, 1),
+        )
+        terceira = ConsultaSEFAZ.objects.create(
+            certificado=outro, tipo_documento='NFE', data_inicio=date(2024, 1, 1), data_fim=date(2024, 1, 31)
+        )
+
+        self.assertEqual(sorted(c.pk for c in reservar_consultas('w1', 5)), [primeira.pk, terceira.pk])
+        # A segunda espera a primeira terminar, mesmo com vaga em outro worker
+        self.assertEqual(reservar_consultas('w2', 5), [])
+
+        processar_consulta(ConsultaSEFAZ.objects.get(pk=primeira.pk), service=ServicoFalso())
+        self.assertEqual([c.pk for c in reservar_consultas('w2', 5)], [segunda.pk])
+
+    def test_processar_consulta(self):
+        """Testa conclusão da consulta e liberação do lease"""
+        self.criar_consulta()
+        consulta = reservar_consultas('w1', 1)[0]
+
+        consulta = processar_consulta(consulta, service=ServicoFalso())
+        self.assertEqual(consulta.status, 'CONCLUIDA')
+        self.assertIsNone(consulta.lease_ate)
+        self.assertEqual(DocumentoConsultado.objects.filter(consulta=consulta).count(), 1)
+
+    def test_processar_consulta_usa_timeout_consulta(self):
+        """Testa que a sincronização recebe o timeout_consulta do dono do certificado"""
+        consulta = self.criar_consulta()
+        with mock.patch('core.sincronizacao.sincronizar_distribuicao') as sincronizar:
+            processar_consulta(consulta, service=ServicoFalso())
+            self.assertIsNone(sincronizar.call_args.kwargs['timeout'])
+
+            ConfiguracaoConsulta.objects.create(usuario=self.user, timeout_consulta=120)
+            processar_consulta(consulta, service=ServicoFalso())
+            self.assertEqual(sincronizar.call_args.kwargs['timeout'], 120)
+
+    def test_falha_volta_para_fila_ate_max_tentativas(self):
+        """Testa retentativa e ERRO após MAX_TENTATIVAS"""
+        consulta = self.criar_consulta()
+        with mock.patch('core.sincronizacao.sincronizar_distribuicao', side_effect=Exception('timeout')):
+            for _ in range(3):
+                consulta = processar_consulta(reservar_consultas('w1', 1)[0])
+                if consulta.status == 'PENDENTE':
+                    # Aguardando a retentativa: não volta antes do lease_ate
+                    self.assertEqual(reservar_consultas('w1', 1), [])
+                    ConsultaSEFAZ.objects.filter(pk=consulta.pk).update(lease_ate=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(consulta.status, 'ERRO')
+        self.assertEqual(consulta.mensagem_erro, 'timeout')
+        self.assertIsNotNone(consulta.data_conclusao)
+
+    def test_agendamento_por_intervalo(self):
+        """Testa consulta automática a cada intervalo_consulta minutos"""
+        self.certificado.consulta_automatica = True
+        self.certificado.intervalo_consulta = 60
+        self.certificado.ultima_consulta = timezone.now() - timedelta(minutes=30)
+        self.certificado.save()
+
+        self.assertEqual(agendar_consultas_automaticas(), [])
+        self.assertEqual(len(agendar_consultas_automaticas(timezone.now() + timedelta(minutes=31))), 1)
+        # Já existe uma pendente: não cria outra
+        self.assertEqual(agendar_consultas_automaticas(timezone.now() + timedelta(minutes=31)), [])
+
+    def test_certificado_com_falha_nao_reagenda_a_cada_ciclo(self):
+        """Testa que sync sempre falhando não cria consultas nem chama a SEFAZ a cada ciclo"""
+        self.certificado.consulta_automatica = True
+        self.certificado.intervalo_consulta = 60
+        self.certificado.save()
+
+        worker = SEFAZWorker(concorrencia=1, intervalo=0)
+        with mock.patch('core.sincronizacao.sincronizar_distribuicao', side_effect=Exception('timeout')) as sync:
+            for _ in range(5):
+                worker.ciclo()
+            # Retentativas vencidas até ERRO: ainda assim nenhuma consulta nova antes do intervalo
+            for _ in range(5):
+                ConsultaSEFAZ.objects.filter(status='PENDENTE').update(lease_ate=timezone.now() - timedelta(seconds=1))
+                worker.ciclo()
+
+        self.assertEqual(ConsultaSEFAZ.objects.count(), 1)
+        self.assertEqual(ConsultaSEFAZ.objects.get().status, 'ERRO')
+        self.assertEqual(sync.call_count, 3)
+        self.assertEqual(agendar_consultas_automaticas(timezone.now() + timedelta(minutes=30)), [])
+        self.assertEqual(len(agendar_consultas_automaticas(timezone.now() + timedelta(minutes=61))), 1)
+
+    def test_agendamento_por_horario(self):
+        """Testa consulta diária a partir de horario_consulta"""
+        self.certificado.consulta_automatica = True
+        self.certificado.save()
+        ConfiguracaoConsulta.objects.create(
+            usuario=self.user, consulta_automatica_ativa=True, horario_consulta=time(6, 0)
+        )
+        hoje = timezone.localdate()
+
+        antes = timezone.make_aware(datetime.combine(hoje, time(5, 0)))
+        depois = timezone.make_aware(datetime.combine(hoje, time(6, 30)))
+        self.assertEqual(agendar_consultas_automaticas(antes), [])
+        self.assertEqual(agendar_consultas_automaticas(depois)[0].automatica, True)
+
+    def test_worker_processa_fila(self):
+        """Testa o worker processando as consultas pendentes"""
+        for _ in range(2):
+            self.criar_consulta()
+
+        with mock.patch('core.sincronizacao.obter_servico', return_value=ServicoFalso()):
+            worker = SEFAZWorker(concorrencia=1, intervalo=0)
+            worker.executar(uma_vez=True)
+
+        self.assertEqual(worker.processadas, 2)
+        self.assertEqual(ConsultaSEFAZ.objects.filter(status='CONCLUIDA').count(), 2)
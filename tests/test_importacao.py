@@ -0,0 +1,92 @@
+"""
+Testes para a importação em massa de XMLs
+"""
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.importacao import ImportadorXML
+from core.models import NFe, NFeItem, NFeXML, CTe, CTeXML, ImportLog
+from .amostras import gerar_nfe_xml, gerar_cte_xml
+
+
+class ImportadorXMLTest(TestCase):
+    """Testes para o ImportadorXML"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        (self.dir / 'NFe' / '2024').mkdir(parents=True)
+        (self.dir / 'CTe').mkdir()
+
+        for numero in range(1, 6):
+            (self.dir / 'NFe' / '2024' / f'nfe{numero}.xml').write_text(gerar_nfe_xml(numero, itens=3))
+        (self.dir / 'CTe' / 'cte1.xml').write_text(gerar_cte_xml(1))
+        (self.dir / 'NFe' / 'invalido.xml').write_text('<nada/>')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_importa_nfes_itens_e_ctes(self):
+        """Testa gravação de NFes, itens, CTes e logs"""
+        resultado = ImportadorXML(workers=0, tamanho_lote=2).importar_diretorios([self.dir])
+
+        self.assertEqual(resultado.arquivos, 7)
+        self.assertEqual(resultado.importados, 6)
+        self.assertEqual(resultado.erros, 1)
+        self.assertEqual(NFe.objects.count(), 5)
+        self.assertEqual(NFeItem.objects.count(), 15)
+        self.assertEqual(CTe.objects.count(), 1)
+        self.assertEqual(ImportLog.objects.filter(status='sucesso').count(), 6)
+
+        nfe = NFe.objects.get(numero_nf='3')
+        self.assertEqual(nfe.valor_total, Decimal('60.00'))
+        self.assertEqual(nfe.status_nfe, 'autorizada')
+        self.assertEqual(nfe.itens.count(), 3)
+
+    def test_xml_gravado_em_tabela_separada(self):
+        """Testa que o XML vai para NFeXML/CTeXML e é lido só sob demanda"""
+        ImportadorXML(workers=0, tamanho_lote=2).importar_diretorios([self.dir])
+
+        self.assertEqual(NFeXML.objects.count(), 5)
+        self.assertEqual(CTeXML.objects.count(), 1)
+        nfe = NFe.objects.get(numero_nf='3')
+        with self.assertNumQueries(1):
+            self.assertEqual(nfe.xml_content, gerar_nfe_xml(3, itens=3))
+        self.assertEqual(CTe.objects.get().xml_content, gerar_cte_xml(1))
+
+    def test_reimportacao_nao_duplica(self):
+        """Testa que documentos já importados são registrados como erro"""
+        ImportadorXML(workers=0).importar_diretorios([self.dir])
+        resultado = ImportadorXML(workers=0).importar_diretorios([self.dir])
+
+        self.assertEqual(resultado.importados, 0)
+        self.assertEqual(NFe.objects.count(), 5)
+
+    def test_pool_de_processos(self):
+        """Testa parse com pool de processos"""
+        resultado = ImportadorXML(workers=2).importar_diretorios([self.dir / 'NFe'])
+        self.assertEqual(resultado.importados, 5)
+
+    def test_streaming_para_arquivos_grandes(self):
+        """Testa parse incremental acima do limite de tamanho"""
+        (self.dir / 'NFe' / 'grande.xml').write_text(gerar_nfe_xml(99, itens=40))
+        resultado = ImportadorXML(workers=0, tamanho_lote=7, limite_streaming=5000).importar_diretorios([self.dir])
+
+        self.assertEqual(resultado.importados, 7)
+        nfe = NFe.objects.get(numero_nf='99')
+        self.assertEqual(nfe.itens.count(), 40)
+        self.assertEqual(nfe.valor_total, Decimal('800.00'))
+        self.assertEqual(nfe.status_nfe, 'autorizada')
+        self.assertEqual(nfe.xml_content, gerar_nfe_xml(99, itens=40))
+
+    def test_comando_importar_xmls(self):
+        """Testa o comando de gerenciamento"""
+        saida = StringIO()
+        call_command('importar_xmls', '--diretorio', str(self.dir), '--workers', '0', stdout=saida)
+        self.assertIn('arquivos/s', saida.getvalue())
+        self.assertEqual(NFe.objects.count(), 5)
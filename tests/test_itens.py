@@ -0,0 +1,56 @@
+"""
+Testes para itens de NFe na API sem N+1
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.serializers import NFeDetailSerializer
+from core.models import NFe, NFeItem
+from .amostras import chave_teste
+
+
+class ItensNFeTest(TestCase):
+    """Detalhe com itens pré-carregados e endpoint paginado de itens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='itens', password='x')
+        cls.nfe = NFe.objects.create(chave_acesso=chave_teste(1), numero_nf='1')
+        NFeItem.objects.bulk_create([
+            NFeItem(nfe=cls.nfe, numero_item=n, descricao=f'Produto {n}', valor_total=Decimal(n))
+            for n in (3, 1, 5, 2, 4)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_detalhe_carrega_itens_em_uma_consulta(self):
+        # Versão (ETag) + NFe + itens, qualquer que seja o número de itens
+        with self.assertNumQueries(3):
+            dados = self.client.get(f'/api/nfe/{self.nfe.pk}/').json()
+        self.assertEqual([i['numero_item'] for i in dados['itens']], [1, 2, 3, 4, 5])
+        self.assertEqual(dados['total_itens'], 5)
+
+    def test_total_itens_por_anotacao(self):
+        with self.assertNumQueries(2):
+            dados = self.client.get(f'/api/nfe/{self.nfe.pk}/', {'fields': 'numero_nf,total_itens'}).json()
+        self.assertEqual(dados, {'numero_nf': '1', 'total_itens': 5})
+
+    def test_serializer_sem_prefetch_conta(self):
+        self.assertEqual(NFeDetailSerializer(NFe.objects.get(pk=self.nfe.pk)).data['total_itens'], 5)
+
+    def test_itens_paginados(self):
+        url, numeros = f'/api/nfe/{self.nfe.pk}/itens/?limite=2', []
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            numeros += [i['numero_item'] for i in resposta.data['results']]
+            url = resposta.data['next']
+        self.assertEqual(numeros, [1, 2, 3, 4, 5])
+
+    def test_itens_de_nfe_inexistente(self):
+        self.assertEqual(self.client.get('/api/nfe/999999/itens/').status_code, 404)
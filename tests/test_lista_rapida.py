@@ -0,0 +1,79 @@
+"""
+Testes para a listagem rápida da API (values() + JSON rápido)
+"""
+import json
+from datetime import datetime, timedelta, timezone as tz
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api import lista_rapida
+from api.serializers import CTeListSerializer, NFeListSerializer
+from core.models import CTe, NFe
+from .amostras import chave_teste
+
+
+class ListaRapidaTest(TestCase):
+    """Saída igual à do ModelSerializer, com menos trabalho por linha"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='lista', password='x')
+        base = datetime(2024, 3, 1, 15, 30, 5, 123456, tzinfo=tz.utc)
+        for n in range(1, 8):
+            NFe.objects.create(
+                chave_acesso=chave_teste(n), numero_nf=str(n), serie='1', data_emissao=base + timedelta(days=n),
+                emit_cnpj='12345678000190', emit_nome='Emitente Ação', valor_total=Decimal('1234.5') * n,
+                status_nfe='autorizada',
+            )
+        # Colunas nulas
+        NFe.objects.create(chave_acesso=chave_teste(99), numero_nf='99')
+        CTe.objects.create(
+            chave_acesso=chave_teste(1, '57'), numero_ct='1', data_emissao=base, municipio_inicio='São Paulo',
+            municipio_fim='Curitiba', valor_total=Decimal('10.00'),
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _todas(self, url):
+        resultados = []
+        while url:
+            resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(resposta['Content-Type'], 'application/json')
+            dados = json.loads(resposta.content)
+            resultados += dados['results']
+            url = dados['next']
+        return resultados
+
+    def test_mesma_saida_do_serializer(self):
+        esperado = json.loads(json.dumps(NFeListSerializer(
+            NFe.objects.order_by('-data_emissao', '-pk'), many=True).data))
+        self.assertEqual(self._todas('/api/nfe/?limite=3'), esperado)
+
+        esperado = json.loads(json.dumps(CTeListSerializer(CTe.objects.all(), many=True).data))
+        self.assertEqual(self._todas('/api/cte/'), esperado)
+
+    def test_decimal_e_data_no_formato_do_drf(self):
+        item = next(i for i in self._todas('/api/nfe/') if i['numero_nf'] == '2')
+        self.assertEqual(item['valor_total'], '2469.00')
+        self.assertEqual(item['data_emissao'], '2024-03-03T12:30:05.123456-03:00')
+
+    def test_ordenacao_e_filtros(self):
+        numeros = [i['numero_nf'] for i in self._todas('/api/nfe/?ordering=valor_total&limite=2&search=Emitente')]
+        self.assertEqual(numeros, ['1', '2', '3', '4', '5', '6', '7'])
+
+    def test_sem_orjson_usa_json_padrao(self):
+        com_orjson = self._todas('/api/nfe/')
+        with mock.patch.object(lista_rapida, 'orjson', None):
+            self.assertEqual(self._todas('/api/nfe/'), com_orjson)
+
+    def test_api_navegavel_usa_serializer(self):
+        resposta = self.client.get('/api/nfe/?format=api')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data['results']), 8)
@@ -0,0 +1,118 @@
+"""
+Testes para a paginação por cursor
+"""
+from datetime import datetime, timedelta, timezone as tz
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from rest_framework.test import APIClient
+
+from core.models import NFe
+from core.paginacao import CursorInvalido, estimar_total, paginar
+from core.views import ORDENS_NFE, _ordem
+from .amostras import chave_teste
+
+
+class PaginacaoCursorTest(TestCase):
+    """Testes para paginar()"""
+
+    @classmethod
+    def setUpTestData(cls):
+        base = datetime(2024, 1, 1, tzinfo=tz.utc)
+        for n in range(1, 26):
+            # Datas repetidas (desempate pelo id) e algumas sem data
+            data = None if n % 10 == 0 else base + timedelta(days=n // 3)
+            NFe.objects.create(chave_acesso=chave_teste(n), numero_nf=str(n), data_emissao=data,
+                               valor_total=Decimal(n))
+
+    def _percorrer(self, queryset, tamanho):
+        vistos, cursor = [], None
+        while True:
+            pagina = paginar(queryset, cursor, tamanho)
+            vistos += [nfe.pk for nfe in pagina]
+            if not pagina.tem_proxima:
+                return vistos, pagina
+            cursor = pagina.proximo
+
+    def test_percorre_tudo_na_ordem_do_banco(self):
+        for ordem in ('-data_emissao', 'data_emissao', '-valor_total', '-pk'):
+            queryset = NFe.objects.order_by(ordem)
+            desempate = '-pk' if ordem.startswith('-') else 'pk'
+            esperado = list(NFe.objects.order_by(ordem, desempate).values_list('pk', flat=True))
+            vistos, _ = self._percorrer(queryset, 7)
+            self.assertEqual(vistos, esperado, ordem)
+
+    def test_pagina_anterior(self):
+        queryset = NFe.objects.order_by('-data_emissao')
+        primeira = paginar(queryset, None, 10)
+        self.assertFalse(primeira.tem_anterior)
+        segunda = paginar(queryset, primeira.proximo, 10)
+        terceira = paginar(queryset, segunda.proximo, 10)
+        self.assertEqual(len(terceira), 5)
+
+        de_volta = paginar(queryset, terceira.anterior, 10)
+        self.assertEqual([n.pk for n in de_volta], [n.pk for n in segunda])
+        inicio = paginar(queryset, de_volta.anterior, 10)
+        self.assertEqual([n.pk for n in inicio], [n.pk for n in primeira])
+        self.assertFalse(inicio.tem_anterior)
+
+    def test_uma_consulta_por_pagina(self):
+        primeira = paginar(NFe.objects.order_by('-data_emissao'), None, 10)
+        with self.assertNumQueries(1):
+            paginar(NFe.objects.order_by('-data_emissao'), primeira.proximo, 10)
+
+    def test_cursor_invalido(self):
+        with self.assertRaises(CursorInvalido):
+            paginar(NFe.objects.all(), 'nao-e-um-cursor')
+        cursor = paginar(NFe.objects.order_by('-data_emissao'), None, 5).proximo
+        with self.assertRaises(CursorInvalido):
+            paginar(NFe.objects.order_by('-valor_total'), cursor)
+
+    def test_total_estimado(self):
+        self.assertEqual(estimar_total(NFe.objects.all()), 25)
+        self.assertEqual(estimar_total(NFe.objects.all(), limite=10), 10)
+
+
+class PaginacaoAPITest(TestCase):
+    """Testes para a paginação por cursor na API"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='api', password='x'))
+        for n in range(1, 6):
+            NFe.objects.create(chave_acesso=chave_teste(n), numero_nf=str(n),
+                               data_emissao=datetime(2024, 1, n, tzinfo=tz.utc))
+
+    def test_segue_next_ate_o_fim(self):
+        resposta = self.client.get('/api/nfe/?limite=2&total=estimado').json()
+        self.assertEqual([nfe['numero_nf'] for nfe in resposta['results']], ['5', '4'])
+        self.assertEqual(resposta['total_estimado'], 5)
+        self.assertIsNone(resposta['previous'])
+
+        numeros = [nfe['numero_nf'] for nfe in resposta['results']]
+        while resposta['next']:
+            cursor = parse_qs(urlparse(resposta['next']).query)['cursor'][0]
+            resposta = self.client.get('/api/nfe/', {'limite': 2, 'cursor': cursor}).json()
+            numeros += [nfe['numero_nf'] for nfe in resposta['results']]
+        self.assertEqual(numeros, ['5', '4', '3', '2', '1'])
+        self.assertNotIn('total_estimado', resposta)
+
+    def test_ordering_da_api(self):
+        resposta = self.client.get('/api/nfe/?ordering=data_emissao&limite=3').json()
+        self.assertEqual([nfe['numero_nf'] for nfe in resposta['results']], ['1', '2', '3'])
+
+    def test_cursor_invalido_404(self):
+        self.assertEqual(self.client.get('/api/logs/?cursor=xyz').status_code, 404)
+
+
+class OrdemViewsTest(TestCase):
+    """Testes para ?ordem= nas listas HTML"""
+
+    def test_so_aceita_ordenacoes_permitidas(self):
+        fabrica = RequestFactory()
+        self.assertEqual(_ordem(fabrica.get('/', {'ordem': 'valor_total'}), ORDENS_NFE), 'valor_total')
+        for invalida in ('campo_inexistente', 'emit_nome', '?', ''):
+            self.assertEqual(_ordem(fabrica.get('/', {'ordem': invalida}), ORDENS_NFE), '-data_emissao')
+        self.assertEqual(_ordem(fabrica.get('/'), ORDENS_NFE), '-data_emissao')
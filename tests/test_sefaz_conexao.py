@@ -0,0 +1,69 @@
+"""
+Testes para credenciais e sessões reaproveitadas da SEFAZ
+"""
+import ssl
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from core.models_certificado import CertificadoDigital
+from core.sefaz_conexao import AdaptadorMTLS, CredencialSEFAZ
+from core.sefaz_service import SEFAZConsultaService, limpar_servicos, obter_servico
+from .amostras import gerar_certificado_pfx
+
+PFX = gerar_certificado_pfx('1234')
+
+
+class CredencialSEFAZTest(SimpleTestCase):
+    """Testes para CredencialSEFAZ"""
+
+    def test_carrega_pem_e_ssl_context(self):
+        """Testa decodificação do .pfx"""
+        credencial = CredencialSEFAZ.carregar(PFX, '1234')
+
+        self.assertTrue(credencial.cert_pem.startswith(b'-----BEGIN CERTIFICATE'))
+        self.assertIn(b'PRIVATE KEY', credencial.key_pem)
+        self.assertIsInstance(credencial.ssl_context, ssl.SSLContext)
+
+    def test_senha_invalida(self):
+        """Testa erro com senha incorreta"""
+        with self.assertRaises(Exception):
+            CredencialSEFAZ.carregar(PFX, 'errada')
+
+    def test_sessao_usa_adaptador_mtls(self):
+        """Testa que a sessão do serviço apresenta o SSLContext do certificado"""
+        service = SEFAZConsultaService(PFX, '1234')
+        adaptador = service.sessao.get_adapter(service.WEBSERVICE_DISTRIBUICAO)
+
+        self.assertIsInstance(adaptador, AdaptadorMTLS)
+        self.assertIs(adaptador.poolmanager.connection_pool_kw['ssl_context'], service.credencial.ssl_context)
+        self.assertIs(service.sessao, service.sessao)
+        self.assertTrue(service.validar_certificado()['valido'])
+
+
+class ObterServicoTest(TestCase):
+    """Testes para o registro de serviços por certificado"""
+
+    def setUp(self):
+        limpar_servicos()
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.certificado = CertificadoDigital.objects.create(
+            usuario=user, nome='Teste', cnpj='98765432000110', arquivo_pfx=PFX, senha_pfx='1234',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2030, 1, 1),
+        )
+
+    def tearDown(self):
+        limpar_servicos()
+
+    def test_reaproveita_servico(self):
+        """Testa que o mesmo certificado devolve o mesmo serviço"""
+        outro = CertificadoDigital.objects.get(pk=self.certificado.pk)
+        self.assertIs(obter_servico(self.certificado), obter_servico(outro))
+
+    def test_recria_apos_atualizacao(self):
+        """Testa que salvar o certificado invalida o serviço em cache"""
+        primeiro = obter_servico(self.certificado)
+        self.certificado.save()
+
+        self.assertIsNot(obter_servico(self.certificado), primeiro)
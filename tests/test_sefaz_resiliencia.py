@@ -0,0 +1,141 @@
+"""
+Testes para limite de taxa e circuit breaker da SEFAZ
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.sefaz_resiliencia import CircuitBreaker, SEFAZIndisponivel, TokenBucket, limpar_controles, controle_endpoint
+from core.sefaz_service import SEFAZConsultaService
+from .amostras import gerar_certificado_pfx
+
+PFX = gerar_certificado_pfx('1234')
+
+
+class RespostaFalsa:
+    def __init__(self, status_code=200, content=b'<cStat>138</cStat>'):
+        self.status_code = status_code
+        self.content = content
+
+
+class TokenBucketTest(SimpleTestCase):
+    """Testes para TokenBucket"""
+
+    def test_limita_taxa(self):
+        """Testa que, sem tokens, adquirir espera até a reposição"""
+        bucket = TokenBucket(taxa=20, capacidade=1)
+        self.assertTrue(bucket.adquirir())
+
+        inicio = time.perf_counter()
+        self.assertTrue(bucket.adquirir())
+        self.assertGreaterEqual(time.perf_counter() - inicio, 0.04)
+        self.assertFalse(bucket.adquirir(timeout=0.01))
+
+    def test_reducao_e_recuperacao(self):
+        """Testa redução multiplicativa e aumento aditivo"""
+        bucket = TokenBucket(taxa=10)
+        bucket.reduzir()
+        bucket.reduzir()
+        self.assertEqual(bucket.taxa, 2.5)
+        bucket.recuperar()
+        self.assertEqual(bucket.taxa, 3.5)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Testes para CircuitBreaker"""
+
+    def test_abre_apos_falhas_e_consulta_sonda(self):
+        """Testa FECHADO -> ABERTO -> SEMI_ABERTO conforme a sonda"""
+        circuito = CircuitBreaker(limite_falhas=2, tempo_aberto=0.05)
+        circuito.registrar_falha()
+        self.assertTrue(circuito.permitir())
+        circuito.registrar_falha()
+        self.assertFalse(circuito.permitir())
+
+        time.sleep(0.06)
+        self.assertFalse(circuito.permitir(sonda=lambda: False))
+        time.sleep(0.06)
+        self.assertTrue(circuito.permitir(sonda=lambda: True))
+        self.assertEqual(circuito.estado, CircuitBreaker.SEMI_ABERTO)
+
+        circuito.registrar_falha()
+        self.assertEqual(circuito.estado, CircuitBreaker.ABERTO)
+
+    def test_semi_aberto_libera_uma_chamada_de_teste(self):
+        """Testa que, vencida a espera, só um chamador concorrente passa até o teste terminar"""
+        circuito = CircuitBreaker(limite_falhas=1, tempo_aberto=0.05)
+        circuito.registrar_falha()
+        time.sleep(0.06)
+
+        barreira = threading.Barrier(8)
+
+        def chamar():
+            barreira.wait()
+            return circuito.permitir(sonda=lambda: time.sleep(0.02) or True)
+
+        with ThreadPoolExecutor(8) as executor:
+            liberadas = list(executor.map(lambda _: chamar(), range(8)))
+        self.assertEqual(liberadas.count(True), 1)
+        self.assertFalse(circuito.permitir())
+
+        circuito.registrar_sucesso()
+        self.assertTrue(all(circuito.permitir() for _ in range(3)))
+
+
+class ChamadaResilienteTest(SimpleTestCase):
+    """Testes para SEFAZConsultaService._chamar"""
+
+    def setUp(self):
+        limpar_controles()
+        cache.clear()
+        self.service = SEFAZConsultaService(PFX, '1234')
+        self.urls = []
+        self.respostas = []
+
+        def post(url, soap_body, timeout):
+            self.urls.append(url)
+            resposta = self.respostas.pop(0)
+            if isinstance(resposta, Exception):
+                raise resposta
+            return resposta
+
+        self.service._post = post
+
+    def tearDown(self):
+        limpar_controles()
+
+    def test_consumo_indevido_reduz_taxa(self):
+        """Testa que cStat 656 reduz a taxa sem abrir o circuito"""
+        url = self.service.WEBSERVICE_DISTRIBUICAO
+        self.respostas = [RespostaFalsa(content=b'<cStat>656</cStat>')]
+        self.service._chamar(url, '', 60)
+
+        controle = controle_endpoint(url)
+        self.assertEqual(controle.bucket.taxa, controle.bucket.taxa_maxima / 2)
+        self.assertEqual(controle.circuito.estado, CircuitBreaker.FECHADO)
+
+    def test_circuito_aberto_falha_rapido(self):
+        """Testa SEFAZIndisponivel sem nova conexão após falhas seguidas"""
+        url = self.service.WEBSERVICE_DISTRIBUICAO
+        self.respostas = [requests.Timeout()] * 5 + [RespostaFalsa(status_code=500)]
+        for _ in range(5):
+            with self.assertRaises(requests.Timeout):
+                self.service._chamar(url, '', 60)
+
+        with self.assertRaises(SEFAZIndisponivel):
+            self.service._chamar(url, '', 60)
+        self.assertEqual(len(self.urls), 5)
+
+    def test_contingencia_da_uf(self):
+        """Testa desvio para o SVC quando o circuito da UF está aberto"""
+        url = self.service.WEBSERVICES_NFE['SP']
+        for _ in range(5):
+            controle_endpoint(url).registrar_falha()
+        self.respostas = [RespostaFalsa()]
+
+        self.service._chamar(url, '', 30, uf='SP')
+        self.assertEqual(self.urls, [self.service.WEBSERVICES_CONTINGENCIA['SVC-AN']])
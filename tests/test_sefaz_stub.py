@@ -0,0 +1,86 @@
+"""
+Testes ponta a ponta do SEFAZConsultaService contra o servidor stub
+"""
+from datetime import date
+
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from core.models_certificado import CertificadoDigital, ConsultaSEFAZ, DocumentoConsultado
+from core.sefaz_resiliencia import controle_endpoint, limpar_controles
+from core.sefaz_service import SEFAZConsultaService
+from core.sincronizacao import sincronizar_distribuicao
+from .amostras import chave_teste, gerar_certificado_pfx
+from .sefaz_stub import ServidorSEFAZStub
+
+PFX = gerar_certificado_pfx('1234')
+
+
+class SEFAZStubTest(TestCase):
+    """Sincronização e consultas via HTTP no stub local"""
+
+    def setUp(self):
+        limpar_controles()
+        self.stub = ServidorSEFAZStub(total_documentos=120, tamanho_lote=50, itens=2).iniciar()
+        self.addCleanup(self.stub.encerrar)
+        self.addCleanup(limpar_controles)
+        self.service = SEFAZConsultaService(PFX, '1234')
+        self.addCleanup(self.service.fechar)
+
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        certificado = CertificadoDigital.objects.create(
+            usuario=user, nome='Teste', cnpj='98765432000110', arquivo_pfx=PFX, senha_pfx='1234',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2030, 1, 1),
+        )
+        self.consulta = ConsultaSEFAZ.objects.create(
+            certificado=certificado, tipo_documento='NFE', data_inicio=date(2024, 1, 1), data_fim=date(2024, 1, 31)
+        )
+
+    def test_sincronizacao_completa(self):
+        """Testa busca, decodificação e gravação de todos os lotes"""
+        with override_settings(SEFAZ_ENDPOINT_BASE=self.stub.url):
+            resultado = sincronizar_distribuicao(self.consulta, service=self.service)
+
+        self.assertEqual(resultado.lotes, 3)
+        self.assertEqual(resultado.documentos, 120)
+        self.assertEqual(self.stub.requisicoes['distribuicao'], 3)
+        self.assertEqual(DocumentoConsultado.objects.filter(xml_baixado=True).count(), 60)
+
+    def test_consulta_chave_e_status(self):
+        """Testa consSitNFe e consStatServ"""
+        with override_settings(SEFAZ_ENDPOINT_BASE=self.stub.url):
+            xml = self.service.baixar_xml_completo(chave_teste(7), 'SP')
+            self.assertTrue(self.service.status_servico('SP'))
+
+        self.assertIn(chave_teste(7), xml)
+
+    def test_download_por_chave(self):
+        """Testa consChNFe: procNFe gravado, resumo sem XML completo fica pendente"""
+        with override_settings(SEFAZ_ENDPOINT_BASE=self.stub.url):
+            xml = self.service.baixar_nfe_distribuicao(chave_teste(7), '98765432000110', 'SP')
+            self.assertIsNone(self.service.baixar_nfe_distribuicao(chave_teste(8), '98765432000110', 'SP'))
+
+        self.assertIn('<nfeProc', xml)
+        self.assertIn(chave_teste(7), xml)
+        self.assertEqual(self.stub.requisicoes['distribuicao'], 2)
+
+    def test_consumo_indevido(self):
+        """Testa rejeição 656 injetada e redução da taxa do endpoint"""
+        self.stub.prob_656 = 1.0
+        with override_settings(SEFAZ_ENDPOINT_BASE=self.stub.url):
+            with self.assertRaisesMessage(Exception, '656'):
+                sincronizar_distribuicao(self.consulta, service=self.service)
+
+        bucket = controle_endpoint(self.service.WEBSERVICE_DISTRIBUICAO).bucket
+        self.assertLess(bucket.taxa, bucket.taxa_maxima)
+
+    def test_timeout(self):
+        """Testa timeout injetado alimentando o circuit breaker"""
+        self.stub.prob_timeout, self.stub.atraso_timeout = 1.0, 0.5
+        url = self.service.WEBSERVICE_DISTRIBUICAO
+        with override_settings(SEFAZ_ENDPOINT_BASE=self.stub.url):
+            with self.assertRaises(requests.Timeout):
+                self.service._chamar(url, '<distDFeInt/>', timeout=0.1)
+
+        self.assertEqual(controle_endpoint(url).circuito.falhas, 1)
@@ -0,0 +1,189 @@
+"""
+Testes para a sincronização incremental por NSU
+"""
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from core.distribuicao_dfe import ler_retorno_distribuicao
+from core.models import NFe
+from core.models_certificado import CertificadoDigital, ConsultaSEFAZ, CursorNSU, DocumentoConsultado
+from core.sefaz_service import SEFAZConsultaService
+from core.sincronizacao import sincronizar_distribuicao
+from core.xml_parser import parse_nfe_xml
+from .amostras import chave_teste, gerar_evento_nfe_xml, gerar_nfe_xml, gerar_res_nfe_xml, gerar_resposta_dist_dfe
+
+
+class ServicoFalso(SEFAZConsultaService):
+    """Serviço que responde lotes da distribuição a partir de uma lista de NSUs"""
+
+    def __init__(self, max_nsu, por_lote=2):
+        self.max_nsu = max_nsu
+        self.por_lote = por_lote
+        self.chamadas = []
+        self.timeouts = []
+
+    def consultar_distribuicao(self, cnpj, ult_nsu='0', uf='SP', ignorar=None, ignorar_completos=None, timeout=60):
+        ult = int(ult_nsu)
+        self.chamadas.append(ult)
+        self.timeouts.append(timeout)
+        nsus = list(range(ult + 1, min(ult + self.por_lote, self.max_nsu) + 1))
+        docs = [self.documento(n) for n in nsus]
+        resposta = gerar_resposta_dist_dfe(docs, nsus[-1], self.max_nsu) if nsus else \
+            gerar_resposta_dist_dfe([], ult, self.max_nsu, cstat='137')
+        return ler_retorno_distribuicao(resposta, ignorar=ignorar, ignorar_completos=ignorar_completos)
+
+    def documento(self, nsu):
+        """(nsu, schema, xml) do NSU: ímpares procNFe, pares resNFe"""
+        if nsu % 2:
+            return nsu, 'procNFe_v4.00.xsd', gerar_nfe_xml(nsu)
+        return nsu, 'resNFe_v1.01.xsd', gerar_res_nfe_xml(nsu)
+
+
+class ServicoResumoDepoisCompleto(ServicoFalso):
+    """NSU 1 e 2 trazem o resumo e a NFe completa da mesma chave; NSU 3 repete a completa"""
+
+    def documento(self, nsu):
+        if nsu == 1:
+            return nsu, 'resNFe_v1.01.xsd', gerar_res_nfe_xml(1)
+        return nsu, 'procNFe_v4.00.xsd', gerar_nfe_xml(1)
+
+
+class SincronizacaoTest(TestCase):
+    """Testes para sincronizar_distribuicao"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        self.certificado = CertificadoDigital.objects.create(
+            usuario=user, nome='Teste', cnpj='98765432000110', arquivo_pfx=b'', senha_pfx='',
+            validade_inicio=date(2024, 1, 1), validade_fim=date(2030, 1, 1),
+        )
+        self.consulta = ConsultaSEFAZ.objects.create(
+            certificado=self.certificado, tipo_documento='NFE',
+            data_inicio=date(2024, 1, 1), data_fim=date(2024, 12, 31),
+        )
+
+    def test_percorre_ate_max_nsu(self):
+        """Testa laço de lotes até ultNSU == maxNSU e gravação do cursor"""
+        servico = ServicoFalso(max_nsu=5)
+        resultado = sincronizar_distribuicao(self.consulta, service=servico)
+
+        self.assertEqual(servico.chamadas, [0, 2, 4])
+        self.assertEqual(resultado.documentos, 5)
+        self.assertEqual(DocumentoConsultado.objects.count(), 5)
+        cursor = CursorNSU.objects.get(certificado=self.certificado, cnpj='98765432000110')
+        self.assertEqual(int(cursor.ult_nsu), 5)
+        self.consulta.refresh_from_db()
+        self.assertEqual(self.consulta.total_encontrados, 5)
+
+    def test_sincronizacao_incremental(self):
+        """Testa que o segundo sync busca apenas documentos novos"""
+        sincronizar_distribuicao(self.consulta, service=ServicoFalso(max_nsu=3))
+        servico = ServicoFalso(max_nsu=4)
+        resultado = sincronizar_distribuicao(self.consulta, service=servico)
+
+        self.assertEqual(servico.chamadas, [3])
+        self.assertEqual(resultado.documentos, 1)
+        self.assertEqual(DocumentoConsultado.objects.count(), 4)
+
+    def test_documentos_existentes_ignorados(self):
+        """Testa que chaves já gravadas são descartadas antes do parse"""
+        sincronizar_distribuicao(self.consulta, service=ServicoFalso(max_nsu=3))
+        CursorNSU.objects.all().delete()
+
+        resultado = sincronizar_distribuicao(self.consulta, service=ServicoFalso(max_nsu=4))
+
+        self.assertEqual(resultado.duplicados, 3)
+        self.assertEqual(resultado.documentos, 1)
+        self.assertEqual(DocumentoConsultado.objects.count(), 4)
+
+    def test_evento_cancela_nfe_importada(self):
+        """Testa que procEventoNFe do lote atualiza a situação da NFe já importada"""
+        NFe.objects.create(**parse_nfe_xml(gerar_nfe_xml(1)).campos())
+        servico = ServicoFalso(max_nsu=1)
+        servico.consultar_distribuicao = lambda *args, **kwargs: ler_retorno_distribuicao(
+            gerar_resposta_dist_dfe([(1, 'procEventoNFe_v1.00.xsd', gerar_evento_nfe_xml(chave_teste(1)))], 1, 1),
+            ignorar=kwargs.get('ignorar'),
+        )
+
+        resultado = sincronizar_distribuicao(self.consulta, service=servico)
+
+        self.assertEqual(resultado.eventos, 1)
+        self.assertEqual(NFe.objects.get().status_nfe, 'cancelada')
+
+    def test_documento_resumo_e_completo(self):
+        """Testa campos de resNFe e procNFe gravados"""
+        sincronizar_distribuicao(self.consulta, service=ServicoFalso(max_nsu=2))
+
+        completo = DocumentoConsultado.objects.get(numero='1')
+        self.assertTrue(completo.xml_baixado)
+        self.assertEqual(completo.papel_cnpj, 'DESTINATARIO')
+        resumo = DocumentoConsultado.objects.get(numero='2')
+        self.assertFalse(resumo.xml_baixado)
+
+    def test_completo_depois_do_resumo_em_outro_lote(self):
+        """Testa que o procNFe após o resNFe gravado completa o registro e só então vira duplicado"""
+        sincronizar_distribuicao(self.consulta, service=ServicoResumoDepoisCompleto(max_nsu=1))
+        self.assertFalse(DocumentoConsultado.objects.get().xml_baixado)
+
+        resultado = sincronizar_distribuicao(self.consulta, service=ServicoResumoDepoisCompleto(max_nsu=3, por_lote=1))
+
+        self.assertEqual(resultado.completados, 1)
+        self.assertEqual(resultado.documentos, 0)
+        self.assertEqual(resultado.duplicados, 1)
+        documento = DocumentoConsultado.objects.get()
+        self.assertTrue(documento.xml_baixado)
+        self.assertIn('<nfeProc', documento.xml_completo)
+        self.consulta.refresh_from_db()
+        self.assertEqual(self.consulta.total_encontrados, 1)
+
+    def test_completo_e_resumo_no_mesmo_lote(self):
+        """Testa que, no mesmo lote, o procNFe prevalece sobre o resNFe da chave"""
+        resultado = sincronizar_distribuicao(self.consulta, service=ServicoResumoDepoisCompleto(max_nsu=2))
+
+        self.assertEqual(resultado.documentos, 1)
+        self.assertEqual(resultado.duplicados, 1)
+        self.assertTrue(DocumentoConsultado.objects.get().xml_baixado)
+
+    def test_cursor_avancado_por_outra_sincronizacao(self):
+        """Testa que o lote seguinte parte do cursor gravado por outro worker e que o NSU não volta"""
+        servico = ServicoFalso(max_nsu=60)
+        consultar = servico.consultar_distribuicao
+
+        def consultar_com_concorrente(cnpj, ult_nsu='0', *args, **kwargs):
+            retorno = consultar(cnpj, ult_nsu, *args, **kwargs)
+            if ult_nsu == '000000000000000':
+                # Outro worker grava NSU 50 enquanto este lote está em andamento
+                CursorNSU.objects.update(ult_nsu='000000000000050', max_nsu='000000000000060')
+            return retorno
+        servico.consultar_distribuicao = consultar_com_concorrente
+
+        sincronizar_distribuicao(self.consulta, service=servico, max_lotes=2)
+
+        self.assertEqual(servico.chamadas, [0, 50])
+        self.assertEqual(int(CursorNSU.objects.get().ult_nsu), 52)
+
+    def test_prazo_limita_espera_e_lotes(self):
+        """Testa que cada lote espera só o tempo restante e que, vencido o prazo, nenhum lote começa"""
+        servico = ServicoFalso(max_nsu=4)
+        sincronizar_distribuicao(self.consulta, service=servico, timeout=5)
+
+        self.assertEqual(len(servico.timeouts), 2)
+        self.assertTrue(all(0 < t <= 5 for t in servico.timeouts))
+
+        servico = ServicoFalso(max_nsu=6)
+        resultado = sincronizar_distribuicao(self.consulta, service=servico, timeout=0)
+        self.assertEqual((resultado.lotes, servico.chamadas), (0, []))
+        self.assertEqual(int(CursorNSU.objects.get().ult_nsu), 4)
+
+    def test_rejeicao_nao_avanca_cursor(self):
+        """Testa que cStat de rejeição interrompe sem gravar o cursor"""
+        servico = ServicoFalso(max_nsu=2)
+        servico.consultar_distribuicao = lambda *args, **kwargs: ler_retorno_distribuicao(
+            gerar_resposta_dist_dfe([], 0, 0, cstat='656')
+        )
+
+        with self.assertRaises(Exception):
+            sincronizar_distribuicao(self.consulta, service=servico)
+        self.assertEqual(int(CursorNSU.objects.get().ult_nsu), 0)
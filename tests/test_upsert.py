@@ -0,0 +1,84 @@
+"""
+Testes para o upsert em massa da situação de NFe/CTe
+"""
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.models import NFe, CTe
+from core.xml_parser import parse_cte_xml, parse_nfe_xml
+from .amostras import chave_teste, gerar_cte_xml, gerar_evento_nfe_xml, gerar_nfe_xml
+
+
+class UpsertSituacoesTest(TestCase):
+    """Testes para upsert_situacoes e aplicar_eventos"""
+
+    def setUp(self):
+        for numero in (1, 2, 3):
+            NFe.objects.create(**parse_nfe_xml(gerar_nfe_xml(numero)).campos())
+
+    def test_contagens(self):
+        """Testa inseridos, atualizados e inalterados em um único upsert"""
+        nfe = NFe.objects.get(numero_nf='1')
+        protocolo = NFe.objects.get(numero_nf='2').protocolo
+        resultado = NFe.objects.upsert_situacoes([
+            {'chave_acesso': chave_teste(1), 'status_nfe': nfe.status_nfe,
+             'protocolo': nfe.protocolo, 'motivo': nfe.motivo},
+            {'chave_acesso': chave_teste(2), 'status_nfe': 'denegada'},
+            parse_nfe_xml(gerar_nfe_xml(4)),
+        ], tamanho_lote=2)
+
+        self.assertEqual((resultado.inseridos, resultado.atualizados, resultado.inalterados), (1, 1, 1))
+        denegada = NFe.objects.get(numero_nf='2')
+        self.assertEqual(denegada.status_nfe, 'denegada')
+        # Campos não informados mantêm o valor gravado
+        self.assertEqual(denegada.protocolo, protocolo)
+        self.assertEqual(NFe.objects.get(numero_nf='4').emit_nome, nfe.emit_nome)
+
+    def test_sem_criar(self):
+        resultado = NFe.objects.upsert_situacoes(
+            [{'chave_acesso': chave_teste(9), 'status_nfe': 'cancelada'}], criar=False
+        )
+        self.assertEqual(resultado.ausentes, 1)
+        self.assertEqual(NFe.objects.count(), 3)
+
+    def test_cte(self):
+        """Testa o mesmo upsert no manager de CTe (status_cte)"""
+        CTe.objects.create(**parse_cte_xml(gerar_cte_xml(1)).campos())
+        resultado = CTe.objects.upsert_situacoes(
+            [{'chave_acesso': chave_teste(1, modelo='57'), 'status_cte': 'cancelada'}]
+        )
+        self.assertEqual(resultado.atualizados, 1)
+        self.assertEqual(CTe.objects.get().status_cte, 'cancelada')
+
+    def test_aplicar_eventos(self):
+        """Testa cancelamento aplicado e CC-e/evento rejeitado ignorados"""
+        resultado = NFe.objects.aplicar_eventos([
+            gerar_evento_nfe_xml(chave_teste(1)),
+            gerar_evento_nfe_xml(chave_teste(2), tipo_evento='110110'),
+            gerar_evento_nfe_xml(chave_teste(3), cstat='573'),
+            gerar_evento_nfe_xml(chave_teste(8)),
+        ])
+
+        self.assertEqual((resultado.atualizados, resultado.ausentes), (1, 1))
+        cancelada = NFe.objects.get(numero_nf='1')
+        self.assertEqual(cancelada.status_nfe, 'cancelada')
+        self.assertEqual(cancelada.protocolo, '135240000009999')
+        self.assertEqual(cancelada.motivo, 'Erro na emissao do documento')
+        self.assertEqual(NFe.objects.filter(status_nfe='cancelada').count(), 1)
+
+        # Reaplicar não altera nada
+        self.assertEqual(NFe.objects.aplicar_eventos([gerar_evento_nfe_xml(chave_teste(1))]).inalterados, 1)
+
+    def test_comando_aplicar_eventos(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            Path(tmp, 'evento1.xml').write_text(gerar_evento_nfe_xml(chave_teste(2)))
+            Path(tmp, 'nfe.xml').write_text(gerar_nfe_xml(5))
+            saida = StringIO()
+            call_command('aplicar_eventos', '--diretorio', tmp, stdout=saida)
+
+        self.assertIn('1 atualizadas', saida.getvalue())
+        self.assertEqual(NFe.objects.get(numero_nf='2').status_nfe, 'cancelada')
@@ -0,0 +1,109 @@
+"""
+Testes para o parser de XMLs fiscais
+"""
+import io
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from core.xml_parser import NFeRegistro, NFeStreaming, parse_nfe_xml, parse_cte_xml, detectar_tipo
+from .amostras import chave_teste, gerar_nfe_xml, gerar_cte_xml
+
+
+class ParseNFeTest(SimpleTestCase):
+    """Testes para parse_nfe_xml"""
+
+    def test_cabecalho_emitente_destinatario_totais(self):
+        """Testa mapeamento dos campos do cabeçalho"""
+        nfe = parse_nfe_xml(gerar_nfe_xml(7, itens=2))
+
+        self.assertIsInstance(nfe, NFeRegistro)
+        self.assertEqual(nfe.chave_acesso, chave_teste(7))
+        self.assertEqual(nfe.numero_nf, '7')
+        self.assertEqual(nfe.data_emissao, datetime(2024, 1, 15, 10, 30, tzinfo=timezone(timedelta(hours=-3))))
+        self.assertEqual(nfe.emit_cnpj, '12345678000190')
+        self.assertEqual(nfe.emit_endereco, 'Rua A, 10, Centro')
+        self.assertEqual(nfe.emit_uf, 'SP')
+        self.assertEqual(nfe.dest_cnpj_cpf, '98765432000110')
+        self.assertEqual(nfe.dest_municipio, 'Campinas')
+        self.assertEqual(nfe.valor_total, Decimal('40.00'))
+        self.assertEqual(nfe.valor_icms, Decimal('7.20'))
+        self.assertEqual(nfe.status_nfe, 'autorizada')
+        self.assertEqual(nfe.protocolo, '135240000000007')
+
+    def test_itens(self):
+        """Testa mapeamento dos itens (det) e impostos"""
+        nfe = parse_nfe_xml(gerar_nfe_xml(1, itens=3).encode())
+
+        self.assertEqual(len(nfe.itens), 3)
+        item = nfe.itens[2]
+        self.assertEqual(item.numero_item, 3)
+        self.assertEqual(item.codigo_produto, 'P0003')
+        self.assertEqual(item.quantidade, Decimal('2.0000'))
+        self.assertEqual(item.valor_icms, Decimal('3.60'))
+        self.assertEqual(item.valor_cofins, Decimal('1.52'))
+        self.assertIsNone(item.valor_ipi)
+
+    def test_campos_compativeis_com_model(self):
+        """Testa que campos() contém apenas campos do model NFe"""
+        from core.models import NFe
+
+        nomes = {f.name for f in NFe._meta.get_fields()}
+        self.assertTrue(set(parse_nfe_xml(gerar_nfe_xml()).campos()) <= nomes)
+
+    def test_xml_sem_inf_nfe(self):
+        """Testa erro para XML que não é NFe"""
+        with self.assertRaises(ValueError):
+            parse_nfe_xml('<nada/>')
+
+
+class NFeStreamingTest(SimpleTestCase):
+    """Testes para o parse incremental"""
+
+    def test_lotes_equivalentes_ao_parse_completo(self):
+        """Testa que lotes + registro equivalem a parse_nfe_xml"""
+        xml = gerar_nfe_xml(5, itens=25)
+        completo = parse_nfe_xml(xml)
+
+        streaming = NFeStreaming(io.StringIO(xml), tamanho_lote=10)
+        lotes = list(streaming.lotes())
+
+        self.assertEqual([len(lote) for lote in lotes], [10, 10, 5])
+        self.assertEqual(streaming.total_itens, 25)
+        self.assertEqual(
+            [item.campos() for lote in lotes for item in lote],
+            [item.campos() for item in completo.itens],
+        )
+        self.assertEqual(streaming.registro.campos(), completo.campos())
+
+    def test_cabecalho_disponivel_no_primeiro_lote(self):
+        """Testa que ide/emit/dest já estão lidos quando o primeiro lote sai"""
+        streaming = NFeStreaming(io.BytesIO(gerar_nfe_xml(9, itens=4).encode()), tamanho_lote=2)
+        lotes = streaming.lotes()
+        next(lotes)
+
+        self.assertEqual(streaming.registro.numero_nf, '9')
+        self.assertEqual(streaming.registro.emit_cnpj, '12345678000190')
+        self.assertIsNone(streaming.registro.valor_total)
+
+
+class ParseCTeTest(SimpleTestCase):
+    """Testes para parse_cte_xml"""
+
+    def test_campos(self):
+        """Testa mapeamento dos campos do CTe"""
+        cte = parse_cte_xml(gerar_cte_xml(3))
+
+        self.assertEqual(cte.numero_ct, '3')
+        self.assertEqual(cte.rem_nome, 'Empresa Teste')
+        self.assertEqual(cte.uf_fim, 'PR')
+        self.assertEqual(cte.valor_carga, Decimal('15000.00'))
+        self.assertEqual(cte.valor_icms, Decimal('42.00'))
+        self.assertEqual(cte.status_cte, 'autorizada')
+
+    def test_detectar_tipo(self):
+        """Testa detecção do tipo pelo namespace"""
+        self.assertEqual(detectar_tipo(gerar_cte_xml()), 'CTe')
+        self.assertEqual(detectar_tipo(gerar_nfe_xml().encode()), 'NFe')
+        self.assertIsNone(detectar_tipo('<nada/>'))
@@ -149,7 +149,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PaginacaoCursor',
     'PAGE_SIZE': 20,
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.SearchFilter',
@@ -167,6 +167,33 @@ XML_DIRECTORIES = {
     'cte': PROJECT_ROOT / 'CTe',
 }
 
+# XMLs acima deste tamanho (bytes) são importados com parse incremental (0 desativa)
+XML_STREAMING_LIMITE = int(os.getenv('XML_STREAMING_LIMITE', 1024 * 1024))
+
+# Limite de taxa e circuit breaker por webservice da SEFAZ
+SEFAZ_REQUISICOES_POR_SEGUNDO = float(os.getenv('SEFAZ_REQUISICOES_POR_SEGUNDO', 5))
+SEFAZ_CIRCUITO_FALHAS = int(os.getenv('SEFAZ_CIRCUITO_FALHAS', 5))  # falhas seguidas para abrir
+SEFAZ_CIRCUITO_ESPERA = int(os.getenv('SEFAZ_CIRCUITO_ESPERA', 30))  # segundos aberto antes da sonda
+SEFAZ_ESPERA_LIMITE = int(os.getenv('SEFAZ_ESPERA_LIMITE', 10))  # espera máxima por vaga no limite
+SEFAZ_STATUS_CACHE = int(os.getenv('SEFAZ_STATUS_CACHE', 60))  # cache da sonda NfeStatusServico
+# Redireciona todos os webservices para outro host (ex.: servidor stub local em testes/benchmark)
+SEFAZ_ENDPOINT_BASE = os.getenv('SEFAZ_ENDPOINT_BASE', '')
+
+# Cache (estatísticas e totais da API). Local em memória com descarte LRU por padrão;
+# com CACHE_REDIS_URL os processos compartilham o cache e as invalidações.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    } if CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fiscal',
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRADAS', 5000))},
+    },
+}
+CACHE_CONSULTAS_TTL = int(os.getenv('CACHE_CONSULTAS_TTL', 3600))  # entradas antigas também saem pela versão
+
 # MongoDB Configuration - Added by Ávila DevOps SaaS Setup
 import os
 from pathlib import Path